@@ -0,0 +1,304 @@
+# admission.py
+import collections
+import itertools
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+ANONYMOUS_CAMERA = "(none)" # Stats/fairness key for requests without a camera_id
+OVERFLOW_CAMERA = "(other)" # Shared key for new cameras once max_cameras are tracked
+
+# Client-supplied camera IDs end up as dict keys and Prometheus label values
+CAMERA_ID_PATTERN = re.compile(r'[A-Za-z0-9_.:-]{1,64}')
+
+
+def valid_camera_id(camera_id):
+    return CAMERA_ID_PATTERN.fullmatch(camera_id) is not None
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of being queued/served."""
+
+    def __init__(self, reason, retry_after=1):
+        super().__init__(reason)
+        self.reason = reason # 'queue_full', 'deadline' or 'superseded'
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('camera_id', 'state', 'start_tag', 'finish_tag')
+
+    def __init__(self, camera_id, start_tag, finish_tag):
+        self.camera_id = camera_id
+        self.state = 'waiting' # -> 'granted' or 'superseded'
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+
+
+class _CameraStats:
+    """Per-camera counters; 'served' keeps completion times for the FPS window."""
+    __slots__ = ('served', 'completed', 'lag_total', 'lag_max', 'last_lag', 'shed', 'last_seen')
+
+    def __init__(self):
+        self.last_seen = time.monotonic() # Last frame arrival or completion (idle eviction)
+        self.served = collections.deque()
+        self.completed = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.last_lag = 0.0
+        self.shed = collections.Counter()
+
+
+class AdmissionController:
+    """
+    Bounds the number of in-flight inferences. Requests beyond the bound wait
+    in a short queue that holds at most one frame per camera (a newer frame
+    from the same camera replaces the queued one, which is rejected as
+    'superseded'). Free slots go to the queued frame with the smallest
+    weighted-fair-queueing finish tag, so a busy camera cannot starve the
+    others and cameras with a higher priority weight get a larger share.
+    Frames still queued when their deadline (queue_timeout) passes are dropped
+    rather than processed stale; when the queue is full new frames are
+    rejected immediately.
+    queue_timeout=None waits without a deadline (plain bounded concurrency).
+
+    Camera IDs come from clients, so per-camera state is bounded: cameras
+    without frames for camera_ttl seconds are forgotten, and beyond
+    max_cameras tracked cameras new ones share the OVERFLOW_CAMERA key.
+    """
+
+    def __init__(self, max_in_flight, max_queue=4, queue_timeout=0.2, newest_frame_wins=True,
+                 camera_weights=None, default_weight=1.0, fps_window=10.0, camera_ttl=300.0, max_cameras=256):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.newest_frame_wins = newest_frame_wins
+        self.camera_weights = {k.lower(): v for k, v in (camera_weights or {}).items()}
+        self.default_weight = default_weight
+        self.fps_window = fps_window
+        self.camera_ttl = camera_ttl
+        self.max_cameras = max_cameras
+        self.next_sweep = 0.0
+
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.waiters = {} # ticket -> _Waiter
+        self.camera_tickets = {} # camera_id -> ticket of its queued frame
+        self.tickets = itertools.count()
+
+        # Weighted fair queueing (start-time fair queueing with unit cost per frame)
+        self.virtual_time = 0.0
+        self.camera_finish = {} # camera key -> finish tag of its latest frame
+
+        # Metrics (guarded by cond)
+        self.admitted = 0
+        self.queued = 0
+        self.shed = collections.Counter()
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.cameras = collections.defaultdict(_CameraStats) # camera key -> _CameraStats
+        self.evicted_cameras = 0
+        self.service_time = None # EWMA of seconds a request holds its slot (capacity estimate)
+
+    def weight(self, camera_id):
+        # Config keys come lower-cased from configparser
+        weight = self.camera_weights.get(camera_id.lower(), self.default_weight) if camera_id else self.default_weight
+        return max(1e-6, float(weight))
+
+    def _camera_key(self, camera_id, now):
+        """Stats/fairness key of a new frame; registers the camera. Caller holds cond."""
+        if now >= self.next_sweep:
+            self._evict_idle(now)
+        if camera_id is None:
+            key = ANONYMOUS_CAMERA
+        elif camera_id in self.cameras or len(self.cameras) < self.max_cameras:
+            key = camera_id
+        else:
+            self._evict_idle(now) # Full: make room from idle cameras first
+            key = camera_id if len(self.cameras) < self.max_cameras else OVERFLOW_CAMERA
+        self.cameras[key].last_seen = now
+        return key
+
+    def _evict_idle(self, now):
+        """
+        Forgets cameras idle for camera_ttl seconds. Their queued frames (if any)
+        expire long before that, and an old finish tag is below virtual_time anyway.
+        Caller holds cond.
+        """
+        self.next_sweep = now + min(60.0, self.camera_ttl / 10.0)
+        for key in [key for key, stats in self.cameras.items() if now - stats.last_seen > self.camera_ttl]:
+            del self.cameras[key]
+            self.camera_finish.pop(key, None)
+            self.evicted_cameras += 1
+
+    def _retry_after(self):
+        return max(1, int(round(self.queue_timeout or 0)))
+
+    def _tags(self, key, camera_id):
+        """Assigns WFQ start/finish tags to a new frame from 'camera_id'."""
+        start_tag = max(self.virtual_time, self.camera_finish.get(key, 0.0))
+        finish_tag = start_tag + 1.0 / self.weight(camera_id)
+        self.camera_finish[key] = finish_tag
+        return start_tag, finish_tag
+
+    def _dequeue(self, ticket):
+        waiter = self.waiters.pop(ticket, None)
+        if waiter is not None and self.camera_tickets.get(waiter.camera_id) == ticket:
+            del self.camera_tickets[waiter.camera_id]
+        return waiter
+
+    def _shed(self, key, reason, retry_after):
+        self.shed[reason] += 1
+        self.cameras[key].shed[reason] += 1
+        raise AdmissionRejected(reason, retry_after)
+
+    def _acquire(self, camera_id):
+        with self.cond:
+            key = self._camera_key(camera_id, time.monotonic())
+            if self.in_flight < self.max_in_flight and not self.waiters:
+                start_tag, _ = self._tags(key, camera_id)
+                self.virtual_time = max(self.virtual_time, start_tag)
+                self.in_flight += 1
+                self.admitted += 1
+                return key
+
+            inherited = None
+            if self.newest_frame_wins and camera_id is not None and camera_id in self.camera_tickets:
+                old = self._dequeue(self.camera_tickets[camera_id])
+                if old is not None:
+                    old.state = 'superseded'
+                    inherited = (old.start_tag, old.finish_tag) # Keep the camera's place in line
+                    self.cond.notify_all()
+
+            if len(self.waiters) >= self.max_queue:
+                self._shed(key, 'queue_full', self._retry_after())
+
+            ticket = next(self.tickets)
+            start_tag, finish_tag = inherited or self._tags(key, camera_id)
+            waiter = _Waiter(camera_id, start_tag, finish_tag)
+            self.waiters[ticket] = waiter
+            if camera_id is not None and self.newest_frame_wins:
+                self.camera_tickets[camera_id] = ticket
+            self.queued += 1
+
+            start = time.monotonic()
+            deadline = None if self.queue_timeout is None else start + self.queue_timeout
+            while waiter.state == 'waiting':
+                if deadline is None:
+                    self.cond.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Stale frame: drop it instead of processing it late; the camera
+                    # did not get service, so give back its virtual time
+                    self._dequeue(ticket)
+                    if self.camera_finish.get(key) == finish_tag:
+                        self.camera_finish[key] = start_tag
+                    self._shed(key, 'deadline', self._retry_after())
+                self.cond.wait(remaining)
+
+            waited = time.monotonic() - start
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+            if waiter.state == 'superseded':
+                self._shed(key, 'superseded', 0)
+            # 'granted': the releasing request handed its slot over to us
+            self.admitted += 1
+            return key
+
+    def _release(self, key, arrived_at, granted_at):
+        now = time.monotonic()
+        with self.cond:
+            held = now - granted_at
+            self.service_time = held if self.service_time is None else 0.9 * self.service_time + 0.1 * held
+            stats = self.cameras[key]
+            stats.last_seen = now
+            lag = now - arrived_at # Queue wait + processing
+            stats.completed += 1
+            stats.lag_total += lag
+            stats.lag_max = max(stats.lag_max, lag)
+            stats.last_lag = lag
+            stats.served.append(now)
+            while stats.served and stats.served[0] < now - self.fps_window:
+                stats.served.popleft()
+
+            if self.waiters:
+                # Hand the slot directly to the waiter with the smallest finish tag (in_flight unchanged)
+                ticket = min(self.waiters, key=lambda t: (self.waiters[t].finish_tag, t))
+                waiter = self._dequeue(ticket)
+                waiter.state = 'granted'
+                self.virtual_time = max(self.virtual_time, waiter.start_tag)
+                self.cond.notify_all()
+            else:
+                self.in_flight -= 1
+
+    @contextmanager
+    def admit(self, camera_id=None):
+        """Context manager around one inference; raises AdmissionRejected if shed."""
+        arrived_at = time.monotonic()
+        key = self._acquire(camera_id)
+        granted_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(key, arrived_at, granted_at)
+
+    def load_hint(self, camera_id=None):
+        """
+        Cheap load summary sent to clients with every response: (load, fair_fps).
+        load is (in flight + queued) / max_in_flight, so above 1.0 frames are
+        waiting. fair_fps is this camera's weighted share of the estimated
+        capacity (slots / average time a request holds one) among the cameras
+        served in the last fps_window seconds, or None before the first request.
+        """
+        key = camera_id if camera_id is not None else ANONYMOUS_CAMERA
+        now = time.monotonic()
+        with self.cond:
+            load = (self.in_flight + len(self.waiters)) / float(self.max_in_flight)
+            if not self.service_time:
+                return load, None
+            active_weight = sum(self.weight(None if other == ANONYMOUS_CAMERA else other)
+                                for other, stats in self.cameras.items()
+                                if other != key and stats.served and stats.served[-1] >= now - self.fps_window)
+            weight = self.weight(camera_id)
+            capacity_fps = self.max_in_flight / self.service_time
+            return load, capacity_fps * weight / (weight + active_weight)
+
+    def camera_snapshot(self):
+        """Per-camera achieved FPS (over the last fps_window seconds), lag and drops."""
+        now = time.monotonic()
+        with self.cond:
+            result = {}
+            for key, stats in self.cameras.items():
+                recent = sum(1 for t in stats.served if t >= now - self.fps_window)
+                result[key] = {
+                    "weight": self.weight(None if key == ANONYMOUS_CAMERA else key),
+                    "fps": recent / self.fps_window,
+                    "completed": stats.completed,
+                    "avg_lag_ms": stats.lag_total / stats.completed * 1000.0 if stats.completed else 0.0,
+                    "max_lag_ms": stats.lag_max * 1000.0,
+                    "last_lag_ms": stats.last_lag * 1000.0,
+                    "shed": dict(stats.shed),
+                }
+            return result
+
+    def snapshot(self):
+        cameras = self.camera_snapshot()
+        with self.cond:
+            avg_wait = self.wait_time_total / self.queued if self.queued else 0.0
+            return {
+                "tracked_cameras": len(self.cameras),
+                "evicted_cameras": self.evicted_cameras,
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "queue_depth": len(self.waiters),
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "shed": dict(self.shed),
+                "shed_total": sum(self.shed.values()),
+                "avg_queue_wait_ms": avg_wait * 1000.0,
+                "max_queue_wait_ms": self.wait_time_max * 1000.0,
+                "cameras": cameras,
+            }
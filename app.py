@@ -1,9 +1,15 @@
 # app.py
 import sys
 import os
-from flask import Flask, request, jsonify, send_file, render_template, current_app
+from flask import Flask, Response, request, jsonify, render_template, current_app
 import threading
+import time
+import datetime
+import hmac
+import json
+import logging
 import traceback # Import traceback for detailed error logging
+from contextlib import nullcontext
 
 # --- Local Module Imports ---
 # Ensure these files exist in the same directory or are accessible via PYTHONPATH
@@ -11,14 +17,31 @@ try:
     from config_loader import load_config
     from model_loader import load_models # Loads YOLO models and InsightFace app
     from database_manager import DatabaseManager # Handles DB, Embeddings, and Email triggering
-    from image_processor import process_frame_logic # Performs actual frame analysis
+    from image_processor import process_frame_logic, apply_detected_fines # Performs actual frame analysis
+    from inference_pool import InferenceWorkerPool, FrameTooLargeError, WorkersUnavailable # Optional multi-process inference
+    from admission import AdmissionController, AdmissionRejected, valid_camera_id # Load shedding in front of the models
+    from batch_scheduler import BatchScheduler # Micro-batched detection across requests
+    from roi_zones import RoiZoneStore # Per-camera enforcement zones
+    from camera_sessions import CameraSessionBroker, TooManySubscribers # One producer per camera, results pushed to viewers
+    from event_streams import StreamSlots # Caps open event streams so /process keeps its threads
+    from profiler import SamplingProfiler, RequestProfiler # On-demand profiling of the live process
     from utils import decode_image, encode_image # Image encoding/decoding helpers
+    from frame_pool import FRAME_POOL, frame_lease # Reused frame buffers per request ([MEMORY])
     from fined_log_manager import FinedLogManager
+    from violation_analytics import ViolationAnalytics # Incrementally ingested reports over the fined log
+    from export_stream import (EXPORT_FORMATS, ExportUnavailable, export_stream, # Chunked CSV/Parquet/Arrow downloads
+                               balance_chunks, fined_event_chunks)
+    from log_setup import setup_logging, log_sampled # Queue-based logging ([LOGGING])
+    from pose_face import face_path_stats # Counters for keypoint fast path vs SCRFD
+    from metrics import (REGISTRY, timed, observe_stage, metric_family, # Stage histograms and counters for /metrics
+                         trace_request, current_trace, SlowRequestLog) # Per-request Server-Timing and slow log
 except ImportError as e:
     print(f"FATAL: Failed to import necessary modules: {e}")
     print("Ensure config_loader.py, model_loader.py, database_manager.py, image_processor.py, email_notifier.py, fined_log_manager.py, and utils.py are present.")
     sys.exit(1)
 
+logger = logging.getLogger(__name__)
+
 # --- Global Variables ---
 CONFIG = None
 person_model = None
@@ -27,21 +50,33 @@ face_app = None # Global for InsightFace FaceAnalysis application
 db_manager = None # Manages database, embeddings, and email logic
 fined_log_manager = None
 models_loaded_ok = False # Flag to track if all models loaded successfully
+inference_pool = None # InferenceWorkerPool when inference_workers > 0
+admission = None # AdmissionController bounding concurrent inferences ([ADMISSION])
+batch_scheduler = None # BatchScheduler when [BATCHING] is enabled (created on first use)
+batch_scheduler_lock = threading.Lock()
+roi_store = None # RoiZoneStore ([ROI] zones_file)
+camera_sessions = None # CameraSessionBroker when [SESSIONS] is enabled
+stream_slots = StreamSlots() # Open /totals/events and /camera/<id>/events streams ([SESSIONS] max_streams)
+violation_analytics = None # ViolationAnalytics when [ANALYTICS] is enabled (opened on first use)
+analytics_lock = threading.Lock()
+slow_requests = SlowRequestLog() # Slowest recent /process requests ([TRACING])
+sampling_profiler = SamplingProfiler() # Admin-triggered stack sampling ([PROFILING])
+request_profiler = RequestProfiler() # cProfile of single /process requests (X-Profile header)
 
 # --- Flask App Initialization ---
 # Looks for templates in a 'templates' subfolder by default
 app = Flask(__name__)
 
 # --- Initialization Function ---
-def initialize_app():
+def initialize_app(config_file='config.ini', allow_inference_pool=True):
     """Loads configuration, models, and initializes the database manager."""
-    global CONFIG, person_model, id_card_model, face_app, db_manager, models_loaded_ok
+    global CONFIG, person_model, id_card_model, face_app, db_manager, models_loaded_ok, inference_pool, admission, roi_store, camera_sessions, stream_slots, slow_requests, request_profiler
 
     print("\n" + "="*60 + "\n      Starting ID Card Compliance Monitoring System\n" + "="*60 + "\n")
 
     # 1. Load Configuration
     try:
-        CONFIG = load_config() # Returns a flat dictionary
+        CONFIG = load_config(config_file) # Returns a flat dictionary
         if not isinstance(CONFIG, dict):
              raise TypeError("load_config did not return a dictionary.")
     except Exception as e:
@@ -49,9 +84,25 @@ def initialize_app():
         traceback.print_exc()
         sys.exit(1)
 
+    # Log records are formatted and written by a background thread from here on
+    setup_logging(CONFIG)
+    FRAME_POOL.max_bytes = CONFIG.get('frame_pool_max_mb', 256) * 1024 * 1024
+
     # 2. Load Models (YOLO Person, YOLO ID, InsightFace App)
+    #    With inference workers, each worker process loads its own copies instead.
     try:
-        person_model, id_card_model, face_app, models_loaded_ok = load_models(CONFIG)
+        if CONFIG.get('inference_workers', 0) > 0 and not allow_inference_pool:
+            # Pool threads and queues do not survive a fork into server workers
+            print("[WARN] [WORKERS] inference_workers is ignored under a pre-fork WSGI server; use server workers instead.")
+        if CONFIG.get('inference_workers', 0) > 0 and allow_inference_pool:
+            inference_pool = InferenceWorkerPool(CONFIG, CONFIG['inference_workers'],
+                                                 ring_slots=CONFIG.get('ring_slots', 0),
+                                                 max_width=CONFIG.get('max_frame_width', 1920),
+                                                 max_height=CONFIG.get('max_frame_height', 1080),
+                                                 timeout=CONFIG.get('worker_timeout', 10.0))
+            models_loaded_ok = inference_pool.start()
+        else:
+            person_model, id_card_model, face_app, models_loaded_ok = load_models(CONFIG)
         if not models_loaded_ok:
             print("\n[WARNING] One or more models failed to load. Processing might be impaired or fail.")
         # Consider exiting if models are critical, e.g.:
@@ -63,6 +114,39 @@ def initialize_app():
         traceback.print_exc()
         sys.exit(1)
 
+    # 2b. Admission control: bound in-flight inferences, shed the rest quickly
+    max_in_flight = (CONFIG.get('max_in_flight', 0) or CONFIG.get('inference_slots', 0)
+                     or (inference_pool.num_workers if inference_pool is not None else 0) or 2)
+    if CONFIG.get('admission_enabled', True):
+        admission = AdmissionController(max_in_flight,
+                                        max_queue=CONFIG.get('max_queue', 4),
+                                        queue_timeout=CONFIG.get('queue_timeout_ms', 250) / 1000.0,
+                                        newest_frame_wins=CONFIG.get('newest_frame_wins', True),
+                                        camera_weights=CONFIG.get('camera_priorities', {}),
+                                        default_weight=CONFIG.get('default_camera_priority', 1.0),
+                                        camera_ttl=CONFIG.get('camera_ttl_s', 300.0),
+                                        max_cameras=CONFIG.get('max_cameras', 256))
+    else:
+        # No shedding; requests simply wait their turn (old inference_slots behaviour)
+        admission = AdmissionController(max_in_flight, max_queue=sys.maxsize, queue_timeout=None,
+                                        newest_frame_wins=False, camera_ttl=CONFIG.get('camera_ttl_s', 300.0),
+                                        max_cameras=CONFIG.get('max_cameras', 256))
+
+    slow_requests = SlowRequestLog(capacity=CONFIG.get('slow_request_count', 50),
+                                   max_age=CONFIG.get('slow_request_window_s', 900.0))
+
+    request_profiler = RequestProfiler(output_dir=CONFIG.get('profile_output_dir', 'profiles'))
+
+    # 2c. Per-camera ROI zones (re-read from disk when the file changes)
+    roi_store = RoiZoneStore(CONFIG.get('roi_zones_file', 'roi_zones.json'))
+
+    # 2d. Camera sessions: one producing tab per camera, everyone else watches
+    if CONFIG.get('sessions_enabled', True):
+        camera_sessions = CameraSessionBroker(producer_timeout=CONFIG.get('producer_timeout_s', 5.0),
+                                              max_subscribers=CONFIG.get('max_subscribers', 20),
+                                              heartbeat=CONFIG.get('session_heartbeat_s', 15.0))
+    stream_slots = StreamSlots(CONFIG.get('max_streams', 8))
+
 
     # 3. Initialize Database Manager (Handles DB, Embeddings, Emails)
     try:
@@ -72,7 +156,7 @@ def initialize_app():
              print("\n[WARNING] Database CSV loading failed or encountered issues. Fining might be disabled or inaccurate.")
         # Check specifically if embeddings needed for recognition are loaded
         _, known_embeddings = db_manager.get_recognition_data()
-        if not known_embeddings and models_loaded_ok and face_app is not None: # Only warn if face app itself loaded
+        if not known_embeddings and models_loaded_ok and (face_app is not None or inference_pool is not None): # Only warn if face app itself loaded
             print("[WARNING] No known embeddings loaded. Face recognition will be disabled.")
 
     except Exception as e:
@@ -89,15 +173,12 @@ def initialize_app():
         app.fined_log_manager = fined_log_manager
         
         print(f"[ OK ] Fined Log Manager initialized (File: {log_csv_path}).")
-        print(f"[DEBUG initialize_app] Type of app.fined_log_manager: {type(app.fined_log_manager)}")
-        print(f"[DEBUG initialize_app] Type of global fined_log_manager: {type(fined_log_manager)}, Is None: {fined_log_manager is None}")
     except Exception as e:
         print(f"\n[CRITICAL WARNING] Failed to initialize FinedLogManager: {e}. Fined event logging disabled.")
         traceback.print_exc()
         app.fined_log_manager = None
         fined_log_manager = None # Ensure it's None on failure
     # ------------------------------------
-    print(f"[DEBUG initialize_app] Type of fined_log_manager: {type(fined_log_manager)}, Is None: {fined_log_manager is None}")
 
 
 
@@ -105,13 +186,38 @@ def initialize_app():
     print("\n--- Backend Ready ---")
     print(f"Configured Settings Summary:")
     print(f"  - Camera Preference: Index {CONFIG.get('camera_index', 'N/A')}")
+    if inference_pool is not None:
+        print(f"  - Inference Workers: {inference_pool.num_workers} processes, {inference_pool.ring_slots} shared frame slots")
     print(f"  - Person Model:      {CONFIG.get('person_model_path', 'N/A')}")
+    if CONFIG.get('use_pose_model', False):
+        print(f"  - Pose Model:        {CONFIG.get('pose_model_path', 'N/A')} (replaces person model, keypoint face fast path)")
     print(f"  - ID Card Model:     {CONFIG.get('id_card_model_path', 'N/A')}")
     print(f"  - ArcFace Model:     {CONFIG.get('model_name', 'N/A')} (via InsightFace)")
     print(f"  - Student Database:  {CONFIG.get('csv_file', 'N/A')}")
     print(f"  - Embeddings File:   {CONFIG.get('embeddings_file', 'N/A')}")
     print(f"  - ArcFace Threshold: {CONFIG.get('similarity_threshold', 'N/A')}")
     print(f"  - Fine Amount:       ${CONFIG.get('fine_amount', 0.0):.2f}")
+    if CONFIG.get('batching_enabled', False) and inference_pool is None:
+        print(f"  - Detection Batching: up to {CONFIG.get('max_batch_size', 8)} frames, {CONFIG.get('max_wait_ms', 5.0):g} ms wait")
+    if CONFIG.get('admission_enabled', True):
+        print(f"  - Admission Control: {admission.max_in_flight} in flight, queue {admission.max_queue}, "
+              f"{CONFIG.get('queue_timeout_ms', 250)} ms deadline, {len(CONFIG.get('camera_priorities', {}))} camera priorities")
+    else:
+        print(f"  - Admission Control: Disabled ({admission.max_in_flight} in flight, no shedding)")
+    print(f"  - Inference Width:   {CONFIG.get('inference_max_width', 0) or 'Full'} "
+          f"(decode 1/{CONFIG.get('decode_reduce_factor', 1)}, output width {CONFIG.get('output_max_width', 0) or 'Full'})")
+    if CONFIG.get('frame_pool_enabled', True):
+        print(f"  - Frame Buffers:     Pooled (up to {CONFIG.get('frame_pool_max_mb', 256)} MB idle), annotated in place")
+    else:
+        print(f"  - Frame Buffers:     Not pooled, annotation on a copy")
+    if camera_sessions is not None:
+        print(f"  - Camera Sessions:   One producer per camera ({camera_sessions.producer_timeout:g} s lease), "
+              f"up to {camera_sessions.max_subscribers} viewers each")
+    else:
+        print(f"  - Camera Sessions:   Disabled (every tab's frames are processed)")
+    print(f"  - Event Streams:     Up to {stream_slots.max_streams} open per process (more get 503 and poll)")
+    if CONFIG.get('analytics_enabled', True):
+        print(f"  - Violation Reports: {CONFIG.get('analytics_db_file', 'N/A')} (SQLite, from the fined log)")
     email_status = "Enabled" if CONFIG.get('email_enabled', False) else "Disabled"
     sender = CONFIG.get('sender_email', 'N/A')
     print(f"  - Email Notifications: {email_status} (Sender: {sender})")
@@ -129,7 +235,7 @@ def index():
     """Serves the main HTML page using Flask's template rendering."""
     try:
         if CONFIG is None:
-             print("[ERROR in app.py / route]: Global CONFIG is None!")
+             logger.error("Global CONFIG is None while serving '/'.")
              return "Error: Application configuration not loaded correctly.", 500
 
         # Access 'camera_index' directly from the flat CONFIG dictionary
@@ -139,28 +245,139 @@ def index():
         # print(f"[DEBUG app.py / route] Value from CONFIG: {camera_index_from_config}")
 
         camera_index_str_to_pass = str(camera_index_from_config)
+        # Adaptive capture settings for the browser ([CLIENT])
+        capture_settings = {
+            "adaptive": CONFIG.get('adaptive_capture', True),
+            "latencyTargetMs": CONFIG.get('latency_target_ms', 400.0),
+            "maxFps": CONFIG.get('client_max_fps', 10.0),
+            "maxWidth": capture_width_limit(),
+        }
         # Pass the string value to the template
-        return render_template('index.html', preferred_camera_index_str=camera_index_str_to_pass)
+        return render_template('index.html', preferred_camera_index_str=camera_index_str_to_pass,
+                               capture_settings=capture_settings)
 
     except Exception as e:
-        print(f"Error rendering index template or preparing context: {e}")
-        traceback.print_exc() # Print full traceback to console
+        logger.exception("Error rendering index template or preparing context: %s", e)
         return f"Error loading page. Jinja/Context Error: <pre>{e}</pre>", 500
 
 
+def capture_width_limit():
+    """
+    Widest frame worth uploading: [CLIENT] capture_max_width, or else the widest
+    width the server works at when inference, annotation and output are all
+    downscaled (anything wider is decoded only to be shrunk). 0 = no limit.
+    """
+    if CONFIG.get('capture_max_width', 0):
+        return CONFIG['capture_max_width']
+    widths = [CONFIG.get(key, 0) for key in ('inference_max_width', 'annotate_max_width', 'output_max_width')]
+    return max(widths) if all(widths) else 0
+
+
+def capture_hint(camera_id):
+    """X-Capture-Hint value for the adaptive browser capture, e.g. 'load=0.75, fps=6.2, width=960'."""
+    load, fair_fps = admission.load_hint(camera_id)
+    hint = f"load={load:.2f}"
+    if fair_fps is not None:
+        hint += f", fps={fair_fps:.1f}"
+    max_width = capture_width_limit()
+    if max_width:
+        hint += f", width={max_width}"
+    return hint
+
+
+def get_batch_scheduler():
+    """
+    Returns the detection BatchScheduler, starting it on first use. Created
+    lazily so its thread starts in the serving process (threads do not survive
+    Gunicorn's fork after preload).
+    """
+    global batch_scheduler
+    if batch_scheduler is None:
+        with batch_scheduler_lock:
+            if batch_scheduler is None:
+                batch_scheduler = BatchScheduler(person_model, id_card_model, CONFIG,
+                                                 max_batch_size=CONFIG.get('max_batch_size', 8),
+                                                 max_wait_ms=CONFIG.get('max_wait_ms', 5.0))
+    return batch_scheduler
+
+
+def get_violation_analytics():
+    """
+    Returns the ViolationAnalytics store, opening it on first use (SQLite
+    connections must not be inherited across Gunicorn's fork), or None if
+    [ANALYTICS] is disabled or the fined log is unavailable.
+    """
+    global violation_analytics
+    log_manager = getattr(app, 'fined_log_manager', None)
+    if violation_analytics is None and CONFIG.get('analytics_enabled', True) and log_manager is not None:
+        with analytics_lock:
+            if violation_analytics is None:
+                violation_analytics = ViolationAnalytics(CONFIG.get('analytics_db_file', 'fined_log_analytics.sqlite3'),
+                                                         log_manager.log_file_path,
+                                                         cache_entries=CONFIG.get('analytics_cache_entries', 256))
+    return violation_analytics
+
+
+def run_inference(frame, log_manager, camera_id=None):
+    """Runs the frame pipeline in-process or on the worker pool; fines are applied here either way."""
+    roi_zone = roi_store.get(camera_id) if roi_store is not None else None
+    if inference_pool is not None:
+        # Inference runs in a worker process; fining/logging stay in this process
+        with timed('pool_inference'):
+            processed_frame, detected_info = inference_pool.process(frame, roi_zone=roi_zone)
+        apply_detected_fines(frame, detected_info, db_manager, log_manager, CONFIG)
+        return processed_frame, detected_info
+    detections = None
+    if CONFIG.get('batching_enabled', False):
+        # Detection runs batched with other requests' frames; the per-person stage runs here
+        with timed('batched_detection'): # Includes waiting for the batch to fill
+            detections = get_batch_scheduler().detect(frame, roi_zone=roi_zone, timeout=CONFIG.get('worker_timeout', 10.0))
+    # Pass all necessary components
+    # The decoded upload belongs to this request, so results are drawn straight onto it
+    # (fines and their evidence crops are done before anything is drawn)
+    return process_frame_logic(
+        frame, person_model, id_card_model, face_app, db_manager, log_manager, CONFIG,
+        detections=detections, roi_zone=roi_zone, annotate_in_place=CONFIG.get('frame_pool_enabled', True)
+    )
+
+
 @app.route('/process', methods=['POST'])
 def process_image_endpoint():
     """Receives image data, processes it using imported logic, and returns results."""
+    # Every stage timed while handling this request lands in 'trace'
+    # Frame buffers borrowed while handling the request go back to the pool once the response is built
+    with trace_request() as trace, (frame_lease() if CONFIG.get('frame_pool_enabled', True) else nullcontext()):
+        profile_id = None
+        if request.headers.get('X-Profile') and CONFIG.get('profiling_enabled', True) and admin_authorized():
+            # Profile just this request with cProfile (skipped if another request is being profiled)
+            result, profile_id = request_profiler.run(handle_process_request, label='process')
+        else:
+            result = handle_process_request()
+        response = current_app.make_response(result)
+        response.headers['Server-Timing'] = trace.server_timing() # Shown by browser devtools
+        if admission is not None and CONFIG.get('adaptive_capture', True):
+            # Read by the browser's capture controller, also on 503s
+            response.headers['X-Capture-Hint'] = capture_hint(trace.info.get('camera_id'))
+        if profile_id:
+            response.headers['X-Profile-Id'] = profile_id
+        slow_requests.record(trace, response.status_code)
+    observe_stage('request', trace.elapsed())
+    return response
+
+
+def handle_process_request():
+    """Body of /process (traced as a whole by process_image_endpoint)."""
     log_manager = current_app.fined_log_manager
-    print(f"[DEBUG /process] Checking log_manager from current_app. Type: {type(log_manager)}, Is None: {log_manager is None}")
+    trace = current_trace()
     # Check if essential components are loaded and ready
-    if not models_loaded_ok or person_model is None or id_card_model is None or face_app is None:
+    if inference_pool is None and (not models_loaded_ok or person_model is None or id_card_model is None or face_app is None):
          return jsonify({"error": "Core models/apps not loaded", "processed_image": None, "detections": []}), 503 # Service Unavailable
     if db_manager is None or not db_manager.is_loaded:
         return jsonify({"error":"Database unavailable"}), 503 # Service Unavailable if DB is essential
     
     if log_manager is None: # Check the local variable accessed via current_app
-         print("[Warning /process] FinedLogManager not available via current_app. Fines will not be logged to CSV.")
+         log_sampled(logger, logging.WARNING, 'no_fined_log_manager',
+                     "FinedLogManager not available via current_app. Fines will not be logged to CSV.")
                 # Allow processing to continue, but logging won't happen
 
     # Check if embeddings are needed and available (allow processing even without them if desired)
@@ -175,17 +392,53 @@ def process_image_endpoint():
         if not data or 'image' not in data:
             return jsonify({"error": "No image data provided"}), 400
 
-        # Decode base64 image
-        frame = decode_image(data['image'])
-        if frame is None:
-            return jsonify({"error": "Failed to decode image data"}), 400
-        
-        
+        camera_id = data.get('camera_id')
+        camera_id = str(camera_id) if camera_id is not None else None
+        if camera_id is not None and not valid_camera_id(camera_id):
+            return invalid_camera_id()
+        trace.info.update(camera_id=camera_id, payload_bytes=request.content_length)
+
+        # Only the camera's producer gets its frames processed; other tabs watch /camera/<id>/events.
+        # Frames without a client_id (load generator, older pages) are not part of a session.
+        client_id = data.get('client_id')
+        if camera_sessions is not None and camera_id is not None and client_id:
+            if not camera_sessions.claim(camera_id, str(client_id)):
+                return jsonify({"error": f"Camera '{camera_id}' is already streamed by another client",
+                                "role": "viewer"}), 409
+
         # --- Call the main processing logic from image_processor ---
-        # Pass all necessary components
-        processed_frame, detected_info = process_frame_logic(
-            frame, person_model, id_card_model, face_app, db_manager, log_manager, CONFIG
-        )
+        # Admission control: only max_in_flight requests decode + run models at once,
+        # a few more wait briefly, everything else is shed with 503 + Retry-After
+        try:
+            with admission.admit(camera_id):
+                # Decode base64 image
+                with timed('decode'):
+                    frame = decode_image(data['image'], reduce_factor=CONFIG.get('decode_reduce_factor', 1))
+                if frame is None:
+                    return jsonify({"error": "Failed to decode image data"}), 400
+                trace.info['frame_size'] = [frame.shape[1], frame.shape[0]]
+                processed_frame, detected_info = run_inference(frame, log_manager, camera_id)
+                if processed_frame is not None:
+                    trace.info['persons'] = len(detected_info)
+                    trace.info['faces'] = sum(1 for info in detected_info if info.get('face_path'))
+        except AdmissionRejected as ar:
+            log_sampled(logger, logging.INFO, f'shed_{ar.reason}', "Frame from camera %s shed (%s).", camera_id, ar.reason,
+                        extra={"camera_id": camera_id, "reason": ar.reason})
+            response = jsonify({"error": "Server busy, frame dropped", "reason": ar.reason})
+            response.headers['Retry-After'] = str(ar.retry_after)
+            return response, 503
+        except TimeoutError as te:
+            log_sampled(logger, logging.WARNING, 'inference_timeout', "%s", te)
+            response = jsonify({"error": "Inference workers busy, try again"})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        except WorkersUnavailable as wu: # Worker died; respawn may take a while
+            log_sampled(logger, logging.WARNING, 'workers_unavailable', "%s", wu)
+            response = jsonify({"error": "Inference workers restarting, try again"})
+            response.headers['Retry-After'] = str(wu.retry_after)
+            return response, 503
+        except FrameTooLargeError as ve: # Frame larger than the shared memory slots
+            return jsonify({"error": str(ve)}), 413
         # ---
 
         # Handle potential errors from processing logic itself
@@ -194,15 +447,21 @@ def process_image_endpoint():
              # Try to get more specific error if provided
              if detected_info and isinstance(detected_info, list) and len(detected_info) > 0 and 'error' in detected_info[0]:
                  error_msg = detected_info[0]['error']
-             print(f"Error reported by process_frame_logic: {error_msg}")
+             logger.error("Error reported by process_frame_logic: %s", error_msg)
              return jsonify({"error": error_msg}), 500 # Internal Server Error
 
         # Encode the processed frame for sending back to the browser
-        encoded_frame = encode_image(processed_frame)
+        with timed('encode'):
+            encoded_frame = encode_image(processed_frame,
+                                         quality=CONFIG.get('output_jpeg_quality', 85),
+                                         max_width=CONFIG.get('output_max_width', 0))
         if encoded_frame is None:
-            print("Error encoding processed frame to base64.")
+            logger.error("Error encoding processed frame to base64.")
             return jsonify({"error": "Failed to encode processed image"}), 500
 
+        if camera_sessions is not None and camera_id is not None:
+            camera_sessions.publish(camera_id, encoded_frame, detected_info) # Same result for every viewer
+
         # Return successful results
         return jsonify({
             "processed_image": encoded_frame,
@@ -211,14 +470,13 @@ def process_image_endpoint():
 
     except Exception as e:
         # Catch-all for unexpected errors within the endpoint
-        print(f"!! Unexpected Error in /process endpoint: {e}")
-        traceback.print_exc() # Print full traceback for debugging
+        logger.exception("Unexpected error in /process endpoint: %s", e) # Includes the full traceback
         return jsonify({"error": "An internal server error occurred during processing"}), 500
 
 
 @app.route('/get_totals', methods=['GET'])
 def get_totals_endpoint():
-    """Returns the current violation count and total fine amount."""
+    """Returns the current violation count and total fine amount (cached counters, no locking; see /totals/events)."""
     if db_manager is None:
          # Return defaults if DB manager failed to initialize
          return jsonify({"violations": 0, "fine": 0.0})
@@ -226,33 +484,425 @@ def get_totals_endpoint():
         violations, fine = db_manager.get_totals()
         return jsonify({"violations": violations, "fine": float(fine)}) # Ensure fine is float
     except Exception as e:
-        print(f"Error in /get_totals: {e}")
-        traceback.print_exc()
+        logger.exception("Error in /get_totals: %s", e)
         return jsonify({"error": "Failed to calculate totals"}), 500
 
 
+@app.route('/totals/events', methods=['GET'])
+def totals_events_endpoint():
+    """Server-Sent Events with the violations today and total fine, sent whenever a fine changes them."""
+    if db_manager is None or not db_manager.is_loaded:
+        return jsonify({"error": "Database unavailable"}), 503
+    heartbeat = CONFIG.get('session_heartbeat_s', 15.0)
+    if not stream_slots.try_acquire():
+        return streams_busy()
+
+    def events():
+        yield "retry: 2000\n\n" # Browser reconnect delay
+        version, sent = None, None
+        while True:
+            version = db_manager.wait_for_totals(version, timeout=heartbeat)
+            totals = db_manager.get_totals() # Also changes at midnight, noticed on the next heartbeat
+            if totals != sent:
+                sent = totals
+                yield f"event: totals\ndata: {json.dumps({'violations': totals[0], 'fine': float(totals[1])})}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+
+    response = Response(stream_slots.wrap(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def streams_busy():
+    """503 for an event stream over [SESSIONS] max_streams; the page polls instead and retries later."""
+    response = jsonify({"error": f"Too many open event streams ({stream_slots.max_streams}); poll instead"})
+    response.headers['Retry-After'] = '30'
+    return response, 503
+
+
+def collect_runtime_metrics():
+    """Scrape-time samples from the face path counters, admission control and batching."""
+    paths = face_path_stats.snapshot()
+    lines = metric_family('smart_id_face_path_total', 'Face embeddings by path (pose keypoints vs SCRFD).',
+                          [([('path', path)], paths[path]) for path in ('keypoints', 'scrfd_fallback', 'scrfd')],
+                          metric_type='counter')
+    if admission is not None:
+        stats = admission.snapshot()
+        lines += metric_family('smart_id_admission_in_flight', 'Inferences currently running.', [([], stats['in_flight'])])
+        lines += metric_family('smart_id_admission_queue_depth', 'Requests waiting for an inference slot.',
+                               [([], stats['queue_depth'])])
+        lines += metric_family('smart_id_admission_avg_wait_seconds', 'Average queue wait of queued requests.',
+                               [([], stats['avg_queue_wait_ms'] / 1000.0)])
+        lines += metric_family('smart_id_admission_shed_total', 'Requests shed by admission control.',
+                               [([('reason', reason)], count) for reason, count in stats['shed'].items()],
+                               metric_type='counter')
+        cameras = stats['cameras'].items()
+        lines += metric_family('smart_id_camera_fps', 'Frames served per camera.',
+                               [([('camera', camera_id)], cam['fps']) for camera_id, cam in cameras])
+        lines += metric_family('smart_id_camera_avg_lag_seconds', 'Average arrival-to-completion time per camera.',
+                               [([('camera', camera_id)], cam['avg_lag_ms'] / 1000.0) for camera_id, cam in cameras])
+    if inference_pool is not None:
+        pool_stats = inference_pool.snapshot()
+        lines += metric_family('smart_id_inference_workers_alive', 'Inference worker processes running.',
+                               [([], pool_stats['alive'])])
+        lines += metric_family('smart_id_inference_worker_restarts_total', 'Inference workers respawned after exiting.',
+                               [([], pool_stats['restarts'])], metric_type='counter')
+    if batch_scheduler is not None:
+        lines += metric_family('smart_id_batch_avg_size', 'Average detection batch size.',
+                               [([], batch_scheduler.snapshot()['avg_batch_size'])])
+    if camera_sessions is not None:
+        sessions = camera_sessions.snapshot().items()
+        lines += metric_family('smart_id_camera_producers', 'Live producing clients per camera (0 or 1).',
+                               [([('camera', camera_id)], session['producers']) for camera_id, session in sessions])
+        lines += metric_family('smart_id_camera_subscribers', 'Connected result viewers per camera.',
+                               [([('camera', camera_id)], session['subscribers']) for camera_id, session in sessions])
+    streams = stream_slots.snapshot()
+    lines += metric_family('smart_id_event_streams_open', 'Open Server-Sent Event streams in this process.',
+                           [([], streams['open'])])
+    lines += metric_family('smart_id_event_streams_refused_total', 'Event streams refused at max_streams.',
+                           [([], streams['refused'])], metric_type='counter')
+    pool = FRAME_POOL.snapshot()
+    lines += metric_family('smart_id_frame_pool_acquires_total', 'Frame buffer requests by outcome.',
+                           [([('result', 'reused')], pool['hits']), ([('result', 'allocated')], pool['misses'])],
+                           metric_type='counter')
+    lines += metric_family('smart_id_frame_pool_idle_bytes', 'Bytes held by idle pooled frame buffers.',
+                           [([], pool['pooled_bytes'])])
+    return lines
+
+
+REGISTRY.add_collector('runtime', collect_runtime_metrics)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of stage timings, counters and queue gauges."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/face_path_stats', methods=['GET'])
+def face_path_stats_endpoint():
+    """Reports how often faces were embedded via pose keypoints instead of the SCRFD detector."""
+    return jsonify(face_path_stats.snapshot())
+
+
+@app.route('/admission_stats', methods=['GET'])
+def admission_stats_endpoint():
+    """Reports in-flight inferences, queue depth, wait times, shed requests and per-camera FPS/lag."""
+    if admission is None:
+        return jsonify({"error": "Admission control not initialized"}), 503
+    return jsonify(admission.snapshot())
+
+
+@app.route('/batch_stats', methods=['GET'])
+def batch_stats_endpoint():
+    """Reports detection batch sizes and the wait they add ([BATCHING])."""
+    if batch_scheduler is None:
+        return jsonify({"enabled": CONFIG.get('batching_enabled', False) if CONFIG else False, "batches": 0})
+    return jsonify(dict(batch_scheduler.snapshot(), enabled=True))
+
+
+def invalid_camera_id():
+    # Camera IDs become per-camera state and metric labels, so they are kept short and plain
+    return jsonify({"error": "camera_id must be 1-64 characters of letters, digits, '_', '.', ':' or '-'"}), 400
+
+
+@app.route('/camera/<camera_id>/claim', methods=['POST'])
+def claim_camera_endpoint(camera_id):
+    """Makes the calling tab (JSON client_id) the camera's producer, or 409 if another live tab is."""
+    if not valid_camera_id(camera_id):
+        return invalid_camera_id()
+    data = request.get_json(silent=True) or {}
+    client_id = data.get('client_id')
+    if not client_id:
+        return jsonify({"error": "client_id is required"}), 400
+    if camera_sessions is None or camera_sessions.claim(camera_id, str(client_id)):
+        return jsonify({"camera_id": camera_id, "role": "producer"})
+    return jsonify({"camera_id": camera_id, "role": "viewer"}), 409
+
+
+@app.route('/camera/<camera_id>/release', methods=['POST'])
+def release_camera_endpoint(camera_id):
+    """Gives up the producer claim (sent with navigator.sendBeacon when a tab stops or closes)."""
+    data = request.get_json(force=True, silent=True) or {} # Beacons may not be sent as application/json
+    client_id = data.get('client_id')
+    released = bool(camera_sessions is not None and client_id and camera_sessions.release(camera_id, str(client_id)))
+    return jsonify({"camera_id": camera_id, "released": released})
+
+
+@app.route('/camera/<camera_id>/events', methods=['GET'])
+def camera_events_endpoint(camera_id):
+    """Server-Sent Events with each processed result of the camera (?detections_only=1 leaves out the image)."""
+    if camera_sessions is None:
+        return jsonify({"error": "Camera sessions are disabled"}), 404
+    if not valid_camera_id(camera_id):
+        return invalid_camera_id()
+    include_image = request.args.get('detections_only', '').lower() not in ('1', 'true', 'yes')
+    if not stream_slots.try_acquire():
+        return streams_busy()
+    try:
+        events = camera_sessions.stream(camera_id, include_image=include_image)
+    except TooManySubscribers as e:
+        stream_slots.release()
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '10'
+        return response, 503
+    response = Response(stream_slots.wrap(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Keep reverse proxies (nginx) from buffering the stream
+    return response
+
+
+@app.route('/camera/<camera_id>/latest', methods=['GET'])
+def camera_latest_endpoint(camera_id):
+    """Polling fallback for viewers: the newest result if its seq differs from ?after=<seq>, else 204."""
+    if camera_sessions is None:
+        return jsonify({"error": "Camera sessions are disabled"}), 404
+    include_image = request.args.get('detections_only', '').lower() not in ('1', 'true', 'yes')
+    result = camera_sessions.latest(camera_id, after=request.args.get('after', 0, type=int), include_image=include_image)
+    if result is None:
+        return '', 204
+    return jsonify(result)
+
+
+@app.route('/camera_sessions', methods=['GET'])
+def camera_sessions_endpoint():
+    """Reports producer and subscriber counts per camera."""
+    if camera_sessions is None:
+        return jsonify({"error": "Camera sessions are disabled"}), 404
+    return jsonify(camera_sessions.snapshot())
+
+
 @app.route('/export_violations', methods=['GET'])
 def export_violations_endpoint():
-    """Exports the current student database (with fines) as a CSV file."""
+    """
+    Streams the student database (with fines) as a download: ?format=csv
+    (default), parquet or arrow; ?kind=fines exports the fined-event log joined
+    with each student's current balance instead.
+    """
     if db_manager is None or not db_manager.is_loaded:
         return "Error: Database is not available for export.", 503 # Service Unavailable
+    fmt = request.args.get('format', 'csv').lower()
+    kind = request.args.get('kind', 'balances').lower()
+    if fmt not in EXPORT_FORMATS or kind not in ('balances', 'fines'):
+        return f"Error: format must be one of {', '.join(EXPORT_FORMATS)} and kind 'balances' or 'fines'.", 400
+    log_manager = current_app.fined_log_manager
+    if kind == 'fines' and log_manager is None:
+        return "Error: Fined log is not available for export.", 503
     try:
-        # Delegate CSV generation to database manager
-        csv_buffer, filename, mimetype = db_manager.export_database_csv()
-        # Use Flask's send_file to stream the buffer as a download
-        return send_file(
-            csv_buffer,
-            mimetype=mimetype,
-            as_attachment=True,
-            download_name=filename # Use filename generated by db_manager
-        )
-    except ValueError as ve: # Catch specific error from export_database_csv if DB not loaded
-         print(f"Export failed: {ve}")
+        # Snapshot under db_lock, then format and send chunk by chunk without it
+        snapshot = db_manager.snapshot_database()
+        if kind == 'fines':
+            chunks = fined_event_chunks(snapshot, log_manager.log_file_path, log_manager.snapshot_size())
+        else:
+            chunks = balance_chunks(snapshot)
+        body = export_stream(fmt, chunks)
+    except ExportUnavailable as eu: # pyarrow missing
+        return str(eu), 501
+    except ValueError as ve: # Catch specific error from snapshot_database if DB not loaded
+         logger.warning("Export failed: %s", ve)
          return str(ve), 503
     except Exception as e:
-        print(f"Error during CSV export: {e}")
-        traceback.print_exc()
+        logger.exception("Error during export: %s", e)
         return "Error generating export file.", 500
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    prefix = 'student_fines_export' if kind == 'balances' else 'fined_events_export'
+    filename = f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}.{extension}"
+    response = Response(body, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# --- Violation Reports ---
+
+def analytics_query(query):
+    """JSON response for query(analytics), with 400 for bad arguments and 503 without analytics."""
+    analytics = get_violation_analytics()
+    if analytics is None:
+        return jsonify({"error": "Violation analytics are disabled or the fined log is unavailable"}), 503
+    try:
+        return jsonify(query(analytics))
+    except ValueError as ve: # Bad query argument
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        logger.exception("Error in violation analytics query: %s", e)
+        return jsonify({"error": "Failed to run the report"}), 500
+
+
+def date_arg(name):
+    """Optional YYYY-MM-DD query argument, zero-padded ('2024-1-5' -> '2024-01-05'); days are compared as strings."""
+    value = request.args.get(name)
+    if value is not None:
+        value = datetime.datetime.strptime(value, '%Y-%m-%d').date().isoformat() # ValueError if malformed
+    return value
+
+
+def limit_arg(default, cap=1000):
+    """?limit clamped to 1..cap (a negative LIMIT means no limit in SQLite)."""
+    return max(1, min(request.args.get('limit', default, type=int), cap))
+
+
+@app.route('/analytics/daily', methods=['GET'])
+def analytics_daily_endpoint():
+    """Fines per day, optionally limited to ?start=YYYY-MM-DD&end=YYYY-MM-DD."""
+    return analytics_query(lambda a: a.fines_per_day(date_arg('start'), date_arg('end')))
+
+
+@app.route('/analytics/busiest_hours', methods=['GET'])
+def analytics_busiest_hours_endpoint():
+    """Fines per hour of day over ?start/?end, busiest first."""
+    return analytics_query(lambda a: a.busiest_hours(date_arg('start'), date_arg('end')))
+
+
+@app.route('/analytics/repeat_offenders', methods=['GET'])
+def analytics_repeat_offenders_endpoint():
+    """Students fined at least ?min_fines times (default 2), ever or ?since=YYYY-MM-DD; ?limit rows."""
+    return analytics_query(lambda a: a.repeat_offenders(min_fines=request.args.get('min_fines', 2, type=int),
+                                                        since=date_arg('since'),
+                                                        limit=limit_arg(50)))
+
+
+@app.route('/analytics/students/<student_id>', methods=['GET'])
+def analytics_student_endpoint(student_id):
+    """A student's fines, newest first, with evidence image filenames (?limit, default 100)."""
+    return analytics_query(lambda a: {"student_id": student_id,
+                                      "fines": a.student_history(student_id, limit=limit_arg(100))})
+
+
+@app.route('/analytics/summary', methods=['GET'])
+def analytics_summary_endpoint():
+    """Total fines, fined students, covered days and cache statistics."""
+    return analytics_query(lambda a: dict(a.summary(), cache=a.snapshot()))
+
+
+# --- Admin Routes ---
+
+def admin_authorized():
+    """Admin endpoints need the [ADMIN] admin_token header, or come from localhost when no token is set."""
+    token = CONFIG.get('admin_token', '') if CONFIG else ''
+    if token:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+@app.route('/admin/roi_zones', methods=['GET'])
+def list_roi_zones_endpoint():
+    """Returns all per-camera ROI polygons (normalized coordinates)."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(roi_store.all())
+
+
+@app.route('/admin/roi_zones/<camera_id>', methods=['GET', 'PUT', 'DELETE'])
+def roi_zone_endpoint(camera_id):
+    """Fetches, replaces ({"polygon": [[x, y], ...]}) or removes one camera's ROI zone; no restart needed."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    if not valid_camera_id(camera_id):
+        return invalid_camera_id()
+    if request.method == 'GET':
+        zone = roi_store.get(camera_id)
+        if zone is None:
+            return jsonify({"error": f"No ROI zone for camera '{camera_id}'"}), 404
+        return jsonify({"camera_id": camera_id, "polygon": zone.to_list()})
+    try:
+        if request.method == 'DELETE':
+            roi_store.set(camera_id, None)
+            logger.info("ROI zone removed for camera '%s'.", camera_id)
+            return jsonify({"camera_id": camera_id, "polygon": None})
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict) or data.get('polygon') is None:
+            return jsonify({"error": "Expected JSON body {\"polygon\": [[x, y], ...]}"}), 400
+        roi_store.set(camera_id, data['polygon'])
+        logger.info("ROI zone updated for camera '%s'.", camera_id)
+        return jsonify({"camera_id": camera_id, "polygon": roi_store.get(camera_id).to_list()})
+    except ValueError as ve: # Invalid polygon
+        return jsonify({"error": str(ve)}), 400
+    except OSError as oe:
+        logger.error("Could not save ROI zones: %s", oe)
+        return jsonify({"error": "Failed to save ROI zones"}), 500
+
+
+@app.route('/admin/slow_requests', methods=['GET'])
+def slow_requests_endpoint():
+    """Slowest recent /process requests with stage timings, counts and frame size."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify({"window_s": slow_requests.max_age, "requests": slow_requests.slowest()})
+
+
+def profiling_allowed():
+    return CONFIG.get('profiling_enabled', True) and admin_authorized()
+
+
+@app.route('/admin/profile', methods=['GET'])
+def profile_status_endpoint():
+    """Status of the sampling profiler and the ids of recent per-request cProfile runs."""
+    if not profiling_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(dict(sampling_profiler.status(), request_profiles=request_profiler.list()))
+
+
+@app.route('/admin/profile/start', methods=['POST'])
+def profile_start_endpoint():
+    """Starts sampling all threads' stacks (?seconds=30&interval_ms=10&thread=&skip_idle=1)."""
+    if not profiling_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        seconds = min(float(request.args.get('seconds', 30)), CONFIG.get('profile_max_seconds', 120.0))
+        interval = max(float(request.args.get('interval_ms', 10)), 1.0) / 1000.0
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+    skip_idle = request.args.get('skip_idle', '1') not in ('0', 'false', 'no')
+    if not sampling_profiler.start(seconds, interval, request.args.get('thread', ''), skip_idle):
+        return jsonify({"error": "A profiling session is already running"}), 409
+    logger.info("Sampling profiler started for %gs every %g ms.", seconds, interval * 1000)
+    return jsonify(sampling_profiler.status())
+
+
+@app.route('/admin/profile/stop', methods=['POST'])
+def profile_stop_endpoint():
+    if not profiling_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    sampling_profiler.stop()
+    return jsonify(sampling_profiler.status())
+
+
+@app.route('/admin/profile/collapsed', methods=['GET'])
+def profile_collapsed_endpoint():
+    """Collapsed stacks of the last sampling session (input for flamegraph.pl / speedscope)."""
+    if not profiling_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    return Response(sampling_profiler.collapsed(), mimetype='text/plain',
+                    headers={'Content-Disposition': 'attachment; filename=stacks.collapsed'})
+
+
+@app.route('/admin/profile/requests/<profile_id>', methods=['GET'])
+def request_profile_endpoint(profile_id):
+    """pstats summary of one profiled /process request (full .prof file is in [PROFILING] output_dir)."""
+    if not profiling_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    summary = request_profiler.summary(profile_id)
+    if summary is None:
+        return jsonify({"error": f"Unknown profile '{profile_id}'"}), 404
+    return Response(summary, mimetype='text/plain')
+
+
+# --- WSGI Factory ---
+def create_app(config_file='config.ini'):
+    """
+    Initializes the application and returns the Flask app for a WSGI server.
+    Meant to run once in the server's master process before workers are forked
+    (Gunicorn --preload, see gunicorn.conf.py), so model weights and the
+    memory-mapped embedding matrix are shared copy-on-write by all workers.
+    """
+    initialize_app(config_file, allow_inference_pool=False)
+    if not CONFIG.get('shared_fine_state', False):
+        print("[WARN] shared_fine_state is disabled. With more than one server worker, enable it in config.ini "
+              "[SERVER] so workers cannot fine the same student twice.")
+    return app
 
 
 # --- Main Execution Block ---
@@ -276,4 +926,12 @@ if __name__ == '__main__':
          traceback.print_exc()
     finally:
         # This runs when the server is shut down (e.g., by Ctrl+C)
+        if camera_sessions is not None:
+            camera_sessions.close() # Ends open event streams
+        if violation_analytics is not None:
+            violation_analytics.close()
+        if inference_pool is not None:
+            inference_pool.shutdown()
+        if batch_scheduler is not None:
+            batch_scheduler.shutdown()
         print("\n--- Server Shutdown ---")
\ No newline at end of file
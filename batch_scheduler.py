@@ -0,0 +1,137 @@
+# batch_scheduler.py
+import logging
+import queue
+import threading
+import time
+
+from image_processor import detect_frames
+from log_setup import log_sampled
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingFrame:
+    __slots__ = ('frame', 'roi_zone', 'event', 'detections', 'error', 'enqueued_at')
+
+    def __init__(self, frame, roi_zone=None):
+        self.frame = frame
+        self.roi_zone = roi_zone
+        self.event = threading.Event()
+        self.detections = None
+        self.error = None
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchScheduler:
+    """
+    Micro-batching for the detection stage. Request threads call detect(frame);
+    a single scheduler thread collects frames for up to max_wait_ms after the
+    first one arrives (or until max_batch_size frames are waiting), runs
+    person_model and id_card_model once over the whole batch via
+    detect_frames(), and hands each request its own detections. The per-person
+    stage (faces, matching, drawing) then continues in the request thread.
+    """
+
+    def __init__(self, person_model, id_card_model, config, max_batch_size=8, max_wait_ms=5.0):
+        self.person_model = person_model
+        self.id_card_model = id_card_model
+        self.config = config
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self.pending = queue.Queue()
+        self.stats_lock = threading.Lock()
+        self.batches = 0
+        self.frames = 0
+        self.batch_size_max = 0
+        self.queue_wait_total = 0.0 # Seconds frames spent waiting for their batch to start
+        self.inference_time_total = 0.0
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self.thread.start()
+
+    def detect(self, frame, roi_zone=None, timeout=None):
+        """Queues 'frame' (optionally limited to a RoiZone) for the next batch and returns its detections dict."""
+        if not self.running:
+            raise RuntimeError("BatchScheduler has been shut down.")
+        item = _PendingFrame(frame, roi_zone)
+        self.pending.put(item)
+        if not item.event.wait(timeout):
+            raise TimeoutError(f"Batched detection did not finish within {timeout} s.")
+        if item.error is not None:
+            raise item.error
+        return item.detections
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self.pending.get(timeout=remaining) if remaining > 0 else self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is None: # Shutdown marker; put it back for the main loop
+                self.pending.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self.pending.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+
+            start = time.perf_counter()
+            try:
+                detections = detect_frames([item.frame for item in batch],
+                                           self.person_model, self.id_card_model, self.config,
+                                           roi_zones=[item.roi_zone for item in batch])
+                for item, det in zip(batch, detections):
+                    item.detections = det
+            except Exception as e:
+                log_sampled(logger, logging.WARNING, 'batch_failed', "Batched detection failed for %d frame(s): %s",
+                            len(batch), e, exc_info=True)
+                for item in batch:
+                    item.error = e
+            elapsed = time.perf_counter() - start
+
+            with self.stats_lock:
+                self.batches += 1
+                self.frames += len(batch)
+                self.batch_size_max = max(self.batch_size_max, len(batch))
+                self.queue_wait_total += sum(start - item.enqueued_at for item in batch)
+                self.inference_time_total += elapsed
+            for item in batch:
+                item.event.set()
+
+        # Fail anything still queued after shutdown
+        while True:
+            try:
+                item = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item.error = RuntimeError("BatchScheduler has been shut down.")
+                item.event.set()
+
+    def snapshot(self):
+        with self.stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": self.batches,
+                "frames": self.frames,
+                "avg_batch_size": self.frames / self.batches if self.batches else 0.0,
+                "largest_batch": self.batch_size_max,
+                "avg_batch_wait_ms": self.queue_wait_total / self.frames * 1000.0 if self.frames else 0.0,
+                "avg_batch_inference_ms": self.inference_time_total / self.batches * 1000.0 if self.batches else 0.0,
+            }
+
+    def shutdown(self):
+        self.running = False
+        self.pending.put(None)
+        self.thread.join(timeout=5)
@@ -0,0 +1,147 @@
+# benchmarks/autotune_threads.py
+"""
+Sweeps [THREADS] combinations (torch threads, ONNX Runtime intra-op threads,
+OpenCV threads, concurrent inference slots) on this machine and reports the
+one with the best throughput whose p99 latency stays under a limit.
+
+Every combination runs in a fresh child process, because thread pool sizes
+are process-wide and some can only be set once.
+
+Usage:
+    python benchmarks/autotune_threads.py --source recordings/gate.mp4 --max-p99-ms 400
+    python benchmarks/autotune_threads.py --source frames/ --torch 1,2,4 --ort 1,2 --slots 1,2,4,8
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from frame_sources import iter_frames, percentile
+from config_loader import load_config
+
+RESULT_PREFIX = "AUTOTUNE_RESULT "
+
+
+def run_child(args):
+    """Measures one combination in this process and prints a JSON result line."""
+    from model_loader import load_models
+    from database_manager import DatabaseManager
+    from image_processor import process_frame_logic
+
+    config = load_config(args.config)
+    config.update({
+        'torch_threads': args.child_torch,
+        'ort_intra_op_threads': args.child_ort,
+        'opencv_threads': args.child_opencv,
+        'inference_slots': args.child_slots,
+    })
+    person_model, id_card_model, face_app, _ = load_models(config)
+    gallery = DatabaseManager(config)
+    frames = [frame for _, frame in iter_frames(args.source, every=args.every, limit=args.frames)]
+
+    def process(frame):
+        process_frame_logic(frame, person_model, id_card_model, face_app, gallery, None, config, apply_fines=False)
+
+    for frame in frames[:3]: # Warm-up
+        process(frame)
+
+    # Closed loop: 'slots' threads each keep one inference in flight, like
+    # concurrent /process requests admitted with max_in_flight = inference_slots
+    latencies = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + args.duration
+
+    def worker(offset):
+        i, local = offset, []
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            process(frames[i % len(frames)])
+            local.append((time.perf_counter() - start) * 1000.0)
+            i += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(s,)) for s in range(args.child_slots)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(RESULT_PREFIX + json.dumps({
+        'fps': len(latencies) / args.duration,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+    }), flush=True)
+
+
+def sweep(args):
+    cores = os.cpu_count() or 1
+    grid = list(itertools.product(
+        [int(v) for v in args.torch.split(',')],
+        [int(v) for v in args.ort.split(',')],
+        [int(v) for v in args.opencv.split(',')],
+        [int(v) for v in args.slots.split(',')],
+    ))
+    if not args.no_prune:
+        # Skip combinations that oversubscribe the machine by more than 2x
+        grid = [g for g in grid if max(g[0], g[1]) * g[3] <= 2 * cores]
+    print(f"--- Thread budget sweep: {len(grid)} combinations, {args.duration:.0f}s each, {cores} cores ---")
+
+    results = []
+    for torch_t, ort_t, cv_t, slots in grid:
+        cmd = [sys.executable, os.path.abspath(__file__), '--child',
+               '--source', args.source, '--config', args.config, '--duration', str(args.duration),
+               '--frames', str(args.frames), '--every', str(args.every),
+               '--child-torch', str(torch_t), '--child-ort', str(ort_t),
+               '--child-opencv', str(cv_t), '--child-slots', str(slots)]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        line = next((l for l in proc.stdout.splitlines() if l.startswith(RESULT_PREFIX)), None)
+        if line is None:
+            print(f"  torch={torch_t} ort={ort_t} opencv={cv_t} slots={slots}: FAILED\n{proc.stderr[-2000:]}")
+            continue
+        res = json.loads(line[len(RESULT_PREFIX):])
+        results.append(((torch_t, ort_t, cv_t, slots), res))
+        print(f"  torch={torch_t:<3} ort={ort_t:<3} opencv={cv_t:<3} slots={slots:<3} "
+              f"{res['fps']:7.2f} fps   p50 {res['p50_ms']:7.1f} ms   p99 {res['p99_ms']:7.1f} ms")
+
+    acceptable = [r for r in results if r[1]['p99_ms'] <= args.max_p99_ms]
+    if not acceptable:
+        print(f"\nNo combination met p99 <= {args.max_p99_ms:.0f} ms.")
+        return
+    (torch_t, ort_t, cv_t, slots), best = max(acceptable, key=lambda r: r[1]['fps'])
+    print(f"\nBest: {best['fps']:.2f} fps at p99 {best['p99_ms']:.1f} ms. Suggested config.ini:")
+    print("[THREADS]")
+    print(f"torch_threads = {torch_t}")
+    print(f"ort_intra_op_threads = {ort_t}")
+    print(f"opencv_threads = {cv_t}")
+    print(f"inference_slots = {slots}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Auto-tune the [THREADS] budget on this machine.")
+    parser.add_argument('--source', required=True, help="Directory of images or a video file")
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--torch', default='1,2,4', help="torch_threads values to try")
+    parser.add_argument('--ort', default='1,2,4', help="ort_intra_op_threads values to try")
+    parser.add_argument('--opencv', default='1', help="opencv_threads values to try")
+    parser.add_argument('--slots', default='1,2,4', help="inference_slots values to try")
+    parser.add_argument('--max-p99-ms', type=float, default=500.0, help="Latency limit for the recommendation")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per combination")
+    parser.add_argument('--frames', type=int, default=30, help="Distinct frames to cycle through")
+    parser.add_argument('--every', type=int, default=1, help="Use every Nth frame of the source")
+    parser.add_argument('--no-prune', action='store_true', help="Also run heavily oversubscribed combinations")
+    # Internal: single-combination child run
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--child-torch', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--child-ort', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--child-opencv', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--child-slots', type=int, default=1, help=argparse.SUPPRESS)
+    parsed = parser.parse_args()
+    if parsed.child:
+        run_child(parsed)
+    else:
+        sweep(parsed)
@@ -0,0 +1,103 @@
+# benchmarks/benchmark_batching.py
+"""
+Measures the detection micro-batching ([BATCHING] in config.ini): throughput
+and latency for each combination of max batch size and max wait, against the
+unbatched baseline where every request runs the YOLO models on its own frame.
+
+'clients' threads keep submitting recorded frames like concurrent /process
+requests; each one runs detection through the BatchScheduler and then the
+per-person stage itself, as app.py does.
+
+Usage:
+    python benchmarks/benchmark_batching.py --source recordings/gate.mp4 --clients 16
+    python benchmarks/benchmark_batching.py --source frames/ --batch-sizes 1,4,8 --waits 2,5,10 --plot batching.png
+"""
+import argparse
+import itertools
+
+from frame_sources import iter_frames, percentile
+from config_loader import load_config
+from benchmark_workers import run_clients
+
+
+def main(args):
+    from model_loader import load_models
+    from database_manager import DatabaseManager
+    from image_processor import process_frame_logic
+    from batch_scheduler import BatchScheduler
+
+    config = load_config(args.config)
+    frames = [frame for _, frame in iter_frames(args.source, every=args.every, limit=args.frames)]
+    if not frames:
+        raise SystemExit(f"No frames read from '{args.source}'.")
+    person_model, id_card_model, face_app, _ = load_models(config)
+    gallery = DatabaseManager(config)
+
+    def unbatched(frame):
+        process_frame_logic(frame, person_model, id_card_model, face_app, gallery, None, config, apply_fines=False)
+
+    unbatched(frames[0]) # Warm-up
+    print(f"\n=== Unbatched, {args.clients} client(s), {args.duration:.0f}s ===")
+    count, latencies = run_clients(unbatched, frames, args.clients, args.duration)
+    rows = [("off", "-", count / args.duration, percentile(latencies, 50), percentile(latencies, 99), 1.0, 0.0)]
+
+    for batch_size, wait_ms in itertools.product([int(b) for b in args.batch_sizes.split(',')],
+                                                 [float(w) for w in args.waits.split(',')]):
+        print(f"\n=== Batch <= {batch_size}, wait <= {wait_ms:g} ms, {args.clients} client(s) ===")
+        scheduler = BatchScheduler(person_model, id_card_model, config, max_batch_size=batch_size, max_wait_ms=wait_ms)
+
+        def batched(frame):
+            detections = scheduler.detect(frame)
+            process_frame_logic(frame, person_model, id_card_model, face_app, gallery, None, config,
+                                apply_fines=False, detections=detections)
+
+        try:
+            batched(frames[0]) # Warm-up
+            count, latencies = run_clients(batched, frames, args.clients, args.duration)
+            stats = scheduler.snapshot()
+        finally:
+            scheduler.shutdown()
+        rows.append((batch_size, f"{wait_ms:g}", count / args.duration, percentile(latencies, 50),
+                     percentile(latencies, 99), stats['avg_batch_size'], stats['avg_batch_wait_ms']))
+
+    base_fps, base_p50 = rows[0][2] or 1.0, rows[0][3]
+    print(f"\n--- Detection Batching: Throughput vs Added Latency ({args.clients} clients) ---")
+    print(f"{'batch':>6}{'wait ms':>9}{'frames/s':>10}{'speedup':>9}{'p50 ms':>9}{'+p50 ms':>9}{'p99 ms':>9}"
+          f"{'avg batch':>11}{'batch wait':>12}")
+    for batch_size, wait, fps, p50, p99, avg_batch, batch_wait in rows:
+        print(f"{batch_size:>6}{wait:>9}{fps:>10.2f}{fps / base_fps:>8.2f}x{p50:>9.1f}{p50 - base_p50:>+9.1f}{p99:>9.1f}"
+              f"{avg_batch:>11.2f}{batch_wait:>10.1f}ms")
+
+    if args.plot:
+        try:
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+        except ImportError:
+            print("[WARN] matplotlib is not installed; skipping --plot.")
+            return
+        fig, ax = plt.subplots(figsize=(7, 5))
+        for batch_size, wait, fps, p50, p99, _, _ in rows:
+            ax.scatter(p50 - base_p50, fps)
+            ax.annotate(f"b={batch_size}, w={wait}", (p50 - base_p50, fps), textcoords="offset points", xytext=(4, 4), fontsize=8)
+        ax.set_xlabel("Added p50 latency vs unbatched (ms)")
+        ax.set_ylabel("Throughput (frames/s)")
+        ax.set_title(f"Detection micro-batching, {args.clients} concurrent clients")
+        ax.grid(True, alpha=0.3)
+        fig.tight_layout()
+        fig.savefig(args.plot, dpi=120)
+        print(f"Plot saved to {args.plot}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Throughput vs added latency of detection micro-batching.")
+    parser.add_argument('--source', required=True, help="Directory of images or a video file")
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--batch-sizes', default='1,2,4,8', help="Comma-separated max_batch_size values")
+    parser.add_argument('--waits', default='2,5,10', help="Comma-separated max_wait_ms values")
+    parser.add_argument('--clients', type=int, default=8, help="Concurrent submitters")
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds per run")
+    parser.add_argument('--frames', type=int, default=50, help="Distinct frames to cycle through")
+    parser.add_argument('--every', type=int, default=1, help="Use every Nth frame of the source")
+    parser.add_argument('--plot', default='', help="Optional PNG path for a throughput vs latency plot (needs matplotlib)")
+    main(parser.parse_args())
@@ -0,0 +1,188 @@
+# benchmarks/benchmark_frame_memory.py
+"""
+Memory behaviour of the frame pipeline under sustained multi-camera load:
+--cameras threads each push frames through decode -> process_frame_logic ->
+encode (the /process work, as in benchmark_pipeline.py) for --duration
+seconds, with [MEMORY] frame_pool on ('pooled': leased buffers, annotation in
+place) or off ('legacy': fresh arrays and a copy to draw on).
+
+Reports frames/s, minor page faults per frame (every fresh multi-megabyte
+array is mmap'ed and faulted in page by page, so this tracks the allocation
+rate of frame buffers), RSS at the end and at peak, the per-frame peak of
+traced allocations (separate tracemalloc pass) and the pool's reuse ratio.
+--mode both runs each mode in its own process (RSS is per process) and
+compares them.
+
+Usage:
+    python benchmarks/benchmark_frame_memory.py --mode both --cameras 6 --duration 20
+    python benchmarks/benchmark_frame_memory.py --mode pooled --inference-width 640 --annotate-width 640 --json results/mem.json
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmark_pipeline import Pipeline, encode_upload, peak_rss_mb, allocation_pass
+from frame_sources import percentile
+from results import metric, run_metadata, save_results, load_results, compare_results, print_comparison
+from synthetic_data import scratch_config, synthetic_frames
+from config_loader import load_config
+
+try:
+    import resource # Not available on Windows
+except ImportError:
+    resource = None
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+    except (OSError, ValueError, AttributeError): # Not Linux
+        return None
+
+
+def minor_faults():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_minflt if resource else 0
+
+
+def sustained_load(pipeline, uploads, cameras, duration):
+    """Runs 'cameras' threads back to back for 'duration' seconds; returns (frames, latencies ms, wall s)."""
+    latencies = [[] for _ in range(cameras)]
+    stop = threading.Event()
+
+    def camera(index):
+        position = index
+        while not stop.is_set():
+            start = time.perf_counter()
+            pipeline(uploads[position % len(uploads)])
+            latencies[index].append((time.perf_counter() - start) * 1000.0)
+            position += cameras
+
+    threads = [threading.Thread(target=camera, args=(i,), daemon=True) for i in range(cameras)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    samples = [ms for camera_samples in latencies for ms in camera_samples]
+    return len(samples), samples, wall
+
+
+def run_mode(args):
+    from frame_pool import FRAME_POOL
+
+    config = load_config(args.config)
+    config['stub_models'] = True
+    config['stub_latency_ms'] = args.stub_latency_ms
+    config['frame_pool_enabled'] = args.mode == 'pooled'
+    config['inference_max_width'] = args.inference_width
+    config['annotate_max_width'] = args.annotate_width
+    config['output_max_width'] = args.output_width
+    uploads = [encode_upload(frame, 80) for frame in synthetic_frames(args.frames, args.width, args.height)]
+
+    with tempfile.TemporaryDirectory(prefix='smart_id_mem_') as scratch:
+        config = scratch_config(config, scratch, args.gallery)
+        pipeline = Pipeline(config)
+        for upload in uploads[:args.warmup]:
+            pipeline(upload)
+        rss_start = current_rss_mb()
+        faults_before = minor_faults()
+        frames, latencies, wall = sustained_load(pipeline, uploads, args.cameras, args.duration)
+        faults = minor_faults() - faults_before
+        rss_end = current_rss_mb()
+        alloc_peaks, _, _ = allocation_pass(pipeline, uploads[:args.alloc_frames]) if args.alloc_frames else ([], 0, 0)
+        rss_peak = peak_rss_mb()
+    pool = FRAME_POOL.snapshot()
+    acquires = pool['hits'] + pool['misses']
+
+    metrics = {
+        "throughput.fps": metric(frames / wall if wall else 0.0, 'frames/s', 'higher'),
+        "latency.p50": metric(percentile(latencies, 50)),
+        "latency.p95": metric(percentile(latencies, 95)),
+        "memory.page_faults_per_frame": metric(faults / max(1, frames), 'faults'),
+    }
+    if rss_end is not None:
+        metrics["memory.rss_end_mb"] = metric(rss_end, 'MB')
+        metrics["memory.rss_growth_mb"] = metric(rss_end - rss_start, 'MB')
+    if rss_peak is not None:
+        metrics["memory.peak_rss_mb"] = metric(rss_peak, 'MB')
+    if alloc_peaks:
+        metrics["memory.frame_alloc_peak_kb.p50"] = metric(percentile(alloc_peaks, 50), 'KB')
+
+    print(f"\n--- {args.mode}: {args.cameras} camera(s) x {args.duration:g}s, {args.width}x{args.height} ---")
+    print(f"Frames:       {frames} ({frames / wall:.1f}/s), latency p50 {percentile(latencies, 50):.1f} ms, "
+          f"p95 {percentile(latencies, 95):.1f} ms")
+    print(f"Page faults:  {faults / max(1, frames):.0f} per frame")
+    if rss_end is not None:
+        print(f"RSS:          {rss_end:.1f} MB at the end ({rss_end - rss_start:+.1f} MB during the run), "
+              f"peak {rss_peak:.1f} MB")
+    if alloc_peaks:
+        print(f"Allocations:  per-frame traced peak p50 {percentile(alloc_peaks, 50):.0f} KB")
+    if acquires:
+        print(f"Frame pool:   {pool['hits']}/{acquires} buffers reused, {pool['pooled_bytes'] / 1048576:.1f} MB idle")
+    return {
+        "meta": run_metadata('benchmark_frame_memory', args.label, mode=args.mode, cameras=args.cameras,
+                             duration=args.duration, frame_size=f"{args.width}x{args.height}",
+                             inference_width=args.inference_width, annotate_width=args.annotate_width,
+                             stub_latency_ms=args.stub_latency_ms),
+        "metrics": metrics,
+        "frame_pool": pool,
+    }
+
+
+def run_both(args):
+    """Each mode in a fresh process, then legacy vs pooled side by side."""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='smart_id_mem_cmp_') as scratch:
+        for mode in ('legacy', 'pooled'):
+            path = os.path.join(scratch, f'{mode}.json')
+            # Same arguments; the later --mode/--json win
+            command = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ['--mode', mode, '--json', path]
+            subprocess.run(command, check=True)
+            results[mode] = load_results(path)
+    print("\n--- legacy vs pooled ---")
+    print_comparison(compare_results(results['legacy'], results['pooled'], threshold_pct=args.threshold),
+                     base_label='legacy', new_label='pooled')
+    return results['pooled']
+
+
+def main(args):
+    results = run_both(args) if args.mode == 'both' else run_mode(args)
+    if args.json:
+        save_results(args.json, results)
+    if args.compare:
+        print(f"\n--- Compared with '{args.compare}' ---")
+        rows = compare_results(load_results(args.compare), results, threshold_pct=args.threshold)
+        print_comparison(rows)
+        return 1 if any(row[4] == 'regressed' for row in rows) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Allocation rate and RSS of the frame pipeline, pooled vs legacy buffers.")
+    parser.add_argument('--mode', choices=('pooled', 'legacy', 'both'), default='both')
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--cameras', type=int, default=4, help="Concurrent camera threads")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds of sustained load")
+    parser.add_argument('--frames', type=int, default=20, help="Distinct synthetic frames")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--inference-width', type=int, default=0, help="[RESOLUTION] inference_max_width")
+    parser.add_argument('--annotate-width', type=int, default=0, help="[RESOLUTION] annotate_max_width")
+    parser.add_argument('--output-width', type=int, default=0, help="[RESOLUTION] output_max_width")
+    parser.add_argument('--gallery', type=int, default=1000, help="Students in the synthetic gallery")
+    parser.add_argument('--stub-latency-ms', type=float, default=0.0, help="Simulated time per stub model call")
+    parser.add_argument('--warmup', type=int, default=5, help="Untimed frames before measuring")
+    parser.add_argument('--alloc-frames', type=int, default=10, help="Frames in the tracemalloc pass (0 = skip)")
+    parser.add_argument('--label', help="Free-form label stored in the results")
+    parser.add_argument('--json', help="Write machine-readable results to this file (pooled run for --mode both)")
+    parser.add_argument('--compare', help="Results JSON of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=10.0, help="Regression threshold in percent")
+    sys.exit(main(parser.parse_args()))
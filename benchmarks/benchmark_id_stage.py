@@ -0,0 +1,149 @@
+# benchmarks/benchmark_id_stage.py
+"""
+Compares the two ID card stages on recorded footage:
+  full_frame   - ID model on the whole frame, cards matched by center point
+  person_crops - ID model on a batch of torso crops at a small input size
+
+Usage:
+    python benchmarks/benchmark_id_stage.py --source recordings/gate.mp4 --every 5
+    python benchmarks/benchmark_id_stage.py --source frames/ --labels frames/labels.csv
+
+The optional labels CSV has one row per person, with columns
+'frame,x1,y1,x2,y2,has_id' (frame = image file name or video frame index,
+box in pixels, has_id 0/1). Detected persons are matched to labelled ones by
+IoU (--iou, greedy, best overlap first), then each mode's per-person verdict
+is scored: recall = labelled ID wearers found with an ID, precision = persons
+reported with an ID that are labelled wearers (unmatched detections count as
+false positives, unmatched labelled wearers as misses).
+"""
+import argparse
+import csv
+import time
+
+from frame_sources import iter_frames, percentile
+from config_loader import load_config
+from model_loader import load_models
+from image_processor import detect_id_cards_full_frame, detect_id_cards_on_person_crops
+
+
+def load_labels(path):
+    """frame key -> [((x1, y1, x2, y2), has_id), ...]"""
+    labels = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            box = tuple(float(row[k]) for k in ('x1', 'y1', 'x2', 'y2'))
+            labels.setdefault(str(row['frame']).strip(), []).append((box, int(row['has_id']) != 0))
+    return labels
+
+
+def iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_persons(detected, labelled, threshold):
+    """Greedy one-to-one matching by IoU; returns {detected index: labelled index}."""
+    pairs = sorted(((iou(d, l[0]), di, li) for di, d in enumerate(detected) for li, l in enumerate(labelled)),
+                   reverse=True)
+    matches, used = {}, set()
+    for overlap, di, li in pairs:
+        if overlap < threshold:
+            break
+        if di not in matches and li not in used:
+            matches[di] = li
+            used.add(li)
+    return matches
+
+
+def score_frame(person_has_id, matches, labelled):
+    """(true positives, false positives, false negatives) of one frame's per-person ID verdicts."""
+    tp = fp = 0
+    for di, has_id in enumerate(person_has_id):
+        if not has_id:
+            continue
+        if di in matches and labelled[matches[di]][1]:
+            tp += 1
+        else:
+            fp += 1 # ID on a labelled non-wearer, or on a box that is nobody
+    wearers = sum(1 for _, has_id in labelled if has_id)
+    return tp, fp, wearers - tp
+
+
+def run_benchmark(args):
+    config = load_config(args.config)
+    person_model, id_card_model, _, _ = load_models(config)
+    if person_model is None or id_card_model is None:
+        raise SystemExit("Person/ID models failed to load; cannot benchmark.")
+
+    labels = load_labels(args.labels) if args.labels else None
+    person_conf = config.get('person_conf_threshold', 0.6)
+    id_conf = config.get('id_card_conf_threshold', 0.5)
+    crop_imgsz = args.crop_imgsz or config.get('id_crop_imgsz', 320)
+    top = config.get('id_crop_top', 0.1)
+    bottom = config.get('id_crop_bottom', 0.8)
+
+    modes = {
+        'full_frame': lambda frame, boxes: detect_id_cards_full_frame(
+            frame, boxes, id_card_model, id_conf, imgsz=args.full_imgsz),
+        'person_crops': lambda frame, boxes: detect_id_cards_on_person_crops(
+            frame, boxes, id_card_model, id_conf, crop_imgsz, top, bottom),
+    }
+    stats = {name: {'latency_ms': [], 'with_id': 0, 'tp': 0, 'fp': 0, 'fn': 0} for name in modes}
+    total_persons = 0
+    labelled_frames = 0
+    frames = 0
+
+    for key, frame in iter_frames(args.source, every=args.every, limit=args.limit):
+        # Person detection is shared by both modes and not part of the comparison
+        results = person_model(frame, stream=False, classes=[0], conf=person_conf, verbose=False)
+        boxes = results[0].boxes if results and results[0].boxes is not None else []
+        person_xyxy = [tuple(map(int, b.xyxy[0])) for b in boxes]
+        total_persons += len(person_xyxy)
+        labelled = labels.get(key) if labels is not None else None
+        if labelled is not None:
+            labelled_frames += 1
+            matches = match_persons(person_xyxy, labelled, args.iou)
+
+        for name, stage in modes.items():
+            start = time.perf_counter()
+            person_has_id, _ = stage(frame, person_xyxy)
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            if frames >= args.warmup:
+                stats[name]['latency_ms'].append(elapsed_ms)
+            found = sum(person_has_id)
+            stats[name]['with_id'] += found
+            if labelled is not None:
+                tp, fp, fn = score_frame(person_has_id, matches, labelled)
+                stats[name]['tp'] += tp
+                stats[name]['fp'] += fp
+                stats[name]['fn'] += fn
+        frames += 1
+
+    print(f"\n--- ID Stage Benchmark ({frames} frames, {total_persons} persons) ---")
+    if labels is not None:
+        print(f"({labelled_frames} labelled frames, persons matched at IoU >= {args.iou})")
+    print(f"{'mode':<14}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'persons w/ ID':>16}{'recall':>10}{'precision':>11}")
+    for name, s in stats.items():
+        lat = s['latency_ms']
+        mean = sum(lat) / len(lat) if lat else 0.0
+        recall = f"{s['tp'] / (s['tp'] + s['fn']):.3f}" if s['tp'] + s['fn'] else "N/A"
+        precision = f"{s['tp'] / (s['tp'] + s['fp']):.3f}" if s['tp'] + s['fp'] else "N/A"
+        print(f"{name:<14}{mean:>10.2f}{percentile(lat, 50):>10.2f}{percentile(lat, 95):>10.2f}"
+              f"{s['with_id']:>16}{recall:>10}{precision:>11}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Full-frame vs person-crop ID card detection benchmark.")
+    parser.add_argument('--source', required=True, help="Directory of images or a video file")
+    parser.add_argument('--labels', help="Optional CSV with columns frame,x1,y1,x2,y2,has_id (one row per person)")
+    parser.add_argument('--iou', type=float, default=0.5, help="Minimum IoU to match a detected person to a label")
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--every', type=int, default=1, help="Use every Nth frame")
+    parser.add_argument('--limit', type=int, default=None, help="Stop after N frames")
+    parser.add_argument('--warmup', type=int, default=3, help="Frames excluded from latency stats")
+    parser.add_argument('--full-imgsz', type=int, default=None, help="imgsz for full-frame mode (default: model's)")
+    parser.add_argument('--crop-imgsz', type=int, default=None, help="imgsz for person-crop mode (default: config)")
+    run_benchmark(parser.parse_args())
@@ -0,0 +1,233 @@
+# benchmarks/benchmark_pipeline.py
+"""
+Offline end-to-end benchmark of the frame pipeline, without the web server:
+each recorded frame is JPEG/base64 encoded like a browser upload, then timed
+through utils.decode_image -> process_frame_logic -> utils.encode_image,
+exactly as /process does. Recognition runs against a synthetic gallery of
+--gallery students in a scratch directory (DB CSV, embeddings, fined log and
+evidence images), so the real student data is never touched.
+
+Reports per-stage and end-to-end p50/p95/p99, frames/s, peak RSS, and from a
+separate tracemalloc pass (so tracing does not distort the timings) the
+per-frame peak allocation and the memory still held afterwards.
+
+Usage:
+    python benchmarks/benchmark_pipeline.py --source recordings/gate.mp4 --gallery 5000 --json results/gate.json
+    python benchmarks/benchmark_pipeline.py --stub-models --frames 200 --json results/stub.json
+    python benchmarks/compare_results.py results/stub_main.json results/stub.json
+"""
+import argparse
+import base64
+import gc
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+
+from frame_sources import iter_frames, percentile
+from results import metric, latency_metrics, run_metadata, save_results, load_results, compare_results, print_comparison
+from synthetic_data import scratch_config, synthetic_frames
+from config_loader import load_config
+
+try:
+    import resource # Not available on Windows
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def encode_upload(frame, quality):
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not JPEG-encode a source frame.")
+    return "data:image/jpeg;base64," + base64.b64encode(buffer).decode('ascii')
+
+
+class Pipeline:
+    """One /process worth of work per call, minus Flask and admission control."""
+
+    def __init__(self, config):
+        from model_loader import load_models
+        from database_manager import DatabaseManager
+        from fined_log_manager import FinedLogManager
+
+        self.config = config
+        self.person_model, self.id_card_model, self.face_app, models_ok = load_models(config)
+        if not models_ok:
+            raise SystemExit("Models failed to load; use --stub-models to benchmark without weights.")
+        self.db_manager = DatabaseManager(config)
+        self.fined_log_manager = FinedLogManager(config['fined_log_csv'])
+
+    def __call__(self, upload):
+        from contextlib import nullcontext
+        from frame_pool import frame_lease
+        from image_processor import process_frame_logic
+        from metrics import timed
+        from utils import decode_image, encode_image
+
+        pooled = self.config.get('frame_pool_enabled', True)
+        with frame_lease() if pooled else nullcontext(): # As /process: buffers reused, upload drawn on in place
+            with timed('decode'):
+                frame = decode_image(upload, reduce_factor=self.config.get('decode_reduce_factor', 1))
+            processed_frame, detected_info = process_frame_logic(
+                frame, self.person_model, self.id_card_model, self.face_app,
+                self.db_manager, self.fined_log_manager, self.config, annotate_in_place=pooled)
+            with timed('encode'):
+                encode_image(processed_frame, quality=self.config.get('output_jpeg_quality', 85),
+                             max_width=self.config.get('output_max_width', 0))
+        return detected_info
+
+
+def timed_pass(pipeline, uploads, repeat):
+    """Returns (end-to-end ms list, {stage: ms list}, wall seconds, gc collections, detection counts)."""
+    from metrics import trace_request
+
+    end_to_end, stages = [], {}
+    persons = faces = 0
+    gc_before = sum(s['collections'] for s in gc.get_stats())
+    wall_start = time.perf_counter()
+    for _ in range(repeat):
+        for upload in uploads:
+            with trace_request() as trace:
+                detected_info = pipeline(upload)
+            end_to_end.append(trace.elapsed() * 1000.0)
+            for stage, seconds in trace.stages.items():
+                stages.setdefault(stage, []).append(seconds * 1000.0)
+            persons += len(detected_info)
+            faces += sum(1 for info in detected_info if info.get('face_path'))
+    wall = time.perf_counter() - wall_start
+    gc_collections = sum(s['collections'] for s in gc.get_stats()) - gc_before
+    return end_to_end, stages, wall, gc_collections, (persons, faces)
+
+
+def allocation_pass(pipeline, uploads):
+    """Per-frame peak of traced allocations, and what the pass left allocated (leak check)."""
+    tracemalloc.start()
+    try:
+        pipeline(uploads[0]) # Lazily created caches are not a per-frame cost
+        gc.collect()
+        start_current, _ = tracemalloc.get_traced_memory()
+        blocks_before = sys.getallocatedblocks()
+        peaks = []
+        for upload in uploads:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            pipeline(upload)
+            peaks.append((tracemalloc.get_traced_memory()[1] - before) / 1024.0)
+        gc.collect()
+        end_current, _ = tracemalloc.get_traced_memory()
+        retained_blocks = sys.getallocatedblocks() - blocks_before
+    finally:
+        tracemalloc.stop()
+    return peaks, (end_current - start_current) / 1024.0, retained_blocks
+
+
+def load_uploads(args):
+    if args.source:
+        frames = [frame for _, frame in iter_frames(args.source, every=args.every, limit=args.frames)]
+    else:
+        frames = synthetic_frames(args.frames, args.width, args.height)
+    if not frames:
+        raise SystemExit(f"No frames read from '{args.source}'.")
+    return frames, [encode_upload(frame, args.upload_quality) for frame in frames]
+
+
+def main(args):
+    config = load_config(args.config)
+    if args.stub_models:
+        config['stub_models'] = True
+        config['stub_latency_ms'] = args.stub_latency_ms
+    frames, uploads = load_uploads(args)
+    frame_size = f"{frames[0].shape[1]}x{frames[0].shape[0]}"
+    del frames
+
+    with tempfile.TemporaryDirectory(prefix='smart_id_bench_') as scratch:
+        config = scratch_config(config, scratch, args.gallery)
+        rss_before_models = peak_rss_mb()
+        pipeline = Pipeline(config)
+
+        for upload in uploads[:args.warmup]:
+            pipeline(upload)
+        print(f"\n=== {len(uploads)} frame(s) x {args.repeat}, gallery {args.gallery}, "
+              f"{'stub' if config.get('stub_models') else 'real'} models ===")
+        end_to_end, stages, wall, gc_collections, (persons, faces) = timed_pass(pipeline, uploads, args.repeat)
+        alloc_peaks, retained_kb, retained_blocks = allocation_pass(pipeline, uploads[:args.alloc_frames]) \
+            if args.alloc_frames else ([], 0.0, 0)
+        rss_peak = peak_rss_mb()
+
+    fps = len(end_to_end) / wall if wall else 0.0
+    metrics = {"end_to_end.fps": metric(fps, 'frames/s', 'higher')}
+    metrics.update(latency_metrics("end_to_end", end_to_end))
+    for stage, samples in stages.items():
+        metrics.update(latency_metrics(f"stage.{stage}", samples))
+    if rss_peak is not None:
+        metrics["memory.peak_rss_mb"] = metric(rss_peak, 'MB')
+    if alloc_peaks:
+        metrics["memory.frame_alloc_peak_kb.p50"] = metric(percentile(alloc_peaks, 50), 'KB')
+        metrics["memory.frame_alloc_peak_kb.max"] = metric(max(alloc_peaks), 'KB')
+        metrics["memory.retained_kb"] = metric(retained_kb, 'KB')
+    metrics["gc.collections_per_frame"] = metric(gc_collections / max(1, len(end_to_end)), 'collections')
+
+    print(f"\n--- Pipeline Latency ({frame_size}, {persons / max(1, len(end_to_end)):.2f} persons and "
+          f"{faces / max(1, len(end_to_end)):.2f} faces per frame) ---")
+    print(f"{'stage':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for name, samples in [('end_to_end', end_to_end)] + sorted(stages.items(), key=lambda kv: -sum(kv[1])):
+        print(f"{name:<22}{len(samples):>7}{percentile(samples, 50):>10.2f}{percentile(samples, 95):>10.2f}"
+              f"{percentile(samples, 99):>10.2f}{sum(samples) / len(samples):>10.2f}")
+    print(f"\nThroughput: {fps:.2f} frames/s (single thread)")
+    if rss_peak is not None:
+        print(f"Peak RSS:   {rss_peak:.1f} MB (peak before loading models: {rss_before_models:.1f} MB)")
+    if alloc_peaks:
+        print(f"Allocations (tracemalloc, {len(alloc_peaks)} frames): per-frame peak p50 "
+              f"{percentile(alloc_peaks, 50):.0f} KB, max {max(alloc_peaks):.0f} KB; "
+              f"retained after pass {retained_kb:.0f} KB in {retained_blocks} block(s)")
+    print(f"GC:         {gc_collections} collection(s) during the timed pass")
+
+    results = {
+        "meta": run_metadata('benchmark_pipeline', args.label, source=args.source or 'synthetic',
+                             frames=len(uploads), repeat=args.repeat, frame_size=frame_size,
+                             gallery=args.gallery, stub_models=bool(config.get('stub_models')),
+                             stub_latency_ms=config.get('stub_latency_ms', 0.0)),
+        "metrics": metrics,
+        "detections": {"persons_per_frame": persons / max(1, len(end_to_end)),
+                       "faces_per_frame": faces / max(1, len(end_to_end))},
+    }
+    if args.json:
+        save_results(args.json, results)
+    if args.compare:
+        print(f"\n--- Compared with '{args.compare}' ---")
+        rows = compare_results(load_results(args.compare), results, threshold_pct=args.threshold)
+        print_comparison(rows)
+        return 1 if any(row[4] == 'regressed' for row in rows) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of decode -> process_frame_logic -> encode.")
+    parser.add_argument('--source', help="Directory of images or a video file (default: synthetic frames)")
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--stub-models', action='store_true', help="Use stub_models.py instead of loading weights")
+    parser.add_argument('--stub-latency-ms', type=float, default=0.0, help="Simulated time per stub model call")
+    parser.add_argument('--gallery', type=int, default=1000, help="Students in the synthetic gallery")
+    parser.add_argument('--frames', type=int, default=100, help="Distinct frames to use")
+    parser.add_argument('--every', type=int, default=1, help="Use every Nth frame of the source")
+    parser.add_argument('--width', type=int, default=1280, help="Synthetic frame width")
+    parser.add_argument('--height', type=int, default=720, help="Synthetic frame height")
+    parser.add_argument('--upload-quality', type=int, default=80, help="JPEG quality of the simulated uploads")
+    parser.add_argument('--repeat', type=int, default=1, help="Passes over the frames")
+    parser.add_argument('--warmup', type=int, default=5, help="Untimed frames before measuring")
+    parser.add_argument('--alloc-frames', type=int, default=20, help="Frames in the tracemalloc pass (0 = skip)")
+    parser.add_argument('--label', help="Free-form label stored in the results")
+    parser.add_argument('--json', help="Write machine-readable results to this file")
+    parser.add_argument('--compare', help="Results JSON of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=10.0, help="Regression threshold in percent for --compare")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,108 @@
+# benchmarks/benchmark_workers.py
+"""
+Measures /process inference throughput against the number of worker processes.
+
+Each run keeps 'clients' threads busy submitting recorded frames (like
+concurrent /process requests) for a fixed duration. Worker count 0 is the
+in-process baseline: all threads share one set of models, as app.py does
+without [WORKERS] inference_workers.
+
+Usage:
+    python benchmarks/benchmark_workers.py --source recordings/gate.mp4 --workers 0,1,2,4,8,16
+"""
+import argparse
+import threading
+import time
+
+from frame_sources import iter_frames, percentile
+from config_loader import load_config
+
+
+def run_clients(process_fn, frames, clients, duration):
+    """Runs 'clients' threads calling process_fn for 'duration' seconds; returns (count, latencies_ms)."""
+    latencies = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(offset):
+        i = offset
+        local = []
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            process_fn(frames[i % len(frames)])
+            local.append((time.perf_counter() - start) * 1000.0)
+            i += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return len(latencies), latencies
+
+
+def benchmark_in_process(config, frames, clients, duration):
+    from model_loader import load_models
+    from database_manager import DatabaseManager
+    from image_processor import process_frame_logic
+
+    person_model, id_card_model, face_app, _ = load_models(config)
+    gallery = DatabaseManager(config)
+
+    def process_fn(frame):
+        process_frame_logic(frame, person_model, id_card_model, face_app, gallery, None, config, apply_fines=False)
+
+    process_fn(frames[0]) # Warm-up
+    return run_clients(process_fn, frames, clients, duration)
+
+
+def benchmark_pool(config, workers, frames, clients, duration):
+    from inference_pool import InferenceWorkerPool
+
+    max_h = max(f.shape[0] for f in frames)
+    max_w = max(f.shape[1] for f in frames)
+    pool = InferenceWorkerPool(config, workers, max_width=max_w, max_height=max_h, timeout=60.0)
+    try:
+        pool.start()
+        for _ in range(workers): # Warm-up each worker once
+            pool.process(frames[0])
+        return run_clients(pool.process, frames, clients, duration)
+    finally:
+        pool.shutdown()
+
+
+def main(args):
+    config = load_config(args.config)
+    frames = [frame for _, frame in iter_frames(args.source, every=args.every, limit=args.frames)]
+    if not frames:
+        raise SystemExit(f"No frames read from '{args.source}'.")
+
+    rows = []
+    for workers in [int(w) for w in args.workers.split(',')]:
+        clients = args.clients or max(2, workers * 2)
+        print(f"\n=== {workers} worker(s), {clients} client thread(s), {args.duration:.0f}s ===")
+        if workers == 0:
+            count, latencies = benchmark_in_process(config, frames, clients, args.duration)
+        else:
+            count, latencies = benchmark_pool(config, workers, frames, clients, args.duration)
+        rows.append((workers, clients, count / args.duration,
+                     percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)))
+
+    print(f"\n--- Throughput vs Worker Count ({len(frames)} distinct frames) ---")
+    print(f"{'workers':>8}{'clients':>9}{'frames/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for workers, clients, fps, p50, p95, p99 in rows:
+        print(f"{workers:>8}{clients:>9}{fps:>10.2f}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inference throughput vs number of worker processes.")
+    parser.add_argument('--source', required=True, help="Directory of images or a video file")
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--workers', default='0,1,2,4', help="Comma-separated worker counts (0 = in-process)")
+    parser.add_argument('--clients', type=int, default=0, help="Concurrent submitters (default: 2 x workers)")
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds per run")
+    parser.add_argument('--frames', type=int, default=50, help="Distinct frames to cycle through")
+    parser.add_argument('--every', type=int, default=1, help="Use every Nth frame of the source")
+    main(parser.parse_args())
@@ -0,0 +1,45 @@
+# benchmarks/compare_results.py
+"""
+Compares two JSON results files written by the benchmark tools (--json) and
+flags every metric that got worse by more than --threshold percent.
+Exits with status 1 if anything regressed, so it can gate a CI job.
+
+Usage:
+    python benchmarks/compare_results.py results/main.json results/branch.json --threshold 10
+"""
+import argparse
+import sys
+
+from results import load_results, compare_results, print_comparison
+
+
+def main(args):
+    base = load_results(args.base)
+    new = load_results(args.new)
+    for name, results in (('base', base), ('new', new)):
+        meta = results.get('meta', {})
+        print(f"{name}: {meta.get('tool')} {meta.get('label') or ''} "
+              f"(rev {meta.get('git_revision')}, {meta.get('timestamp')}, {meta.get('platform')})")
+    if base.get('meta', {}).get('tool') != new.get('meta', {}).get('tool'):
+        print("[WARN] The files were written by different tools; only metrics with the same name are compared.")
+    print()
+
+    rows = compare_results(base, new, threshold_pct=args.threshold, min_delta=args.min_delta)
+    if args.only_changed:
+        rows = [row for row in rows if row[4] != 'ok']
+    print_comparison(rows)
+
+    regressed = [row[0] for row in rows if row[4] == 'regressed']
+    print(f"\n{len(regressed)} metric(s) regressed by more than {args.threshold:g}%.")
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument('base', help="Baseline results JSON")
+    parser.add_argument('new', help="Results JSON to check against the baseline")
+    parser.add_argument('--threshold', type=float, default=10.0, help="Allowed slowdown in percent")
+    parser.add_argument('--min-delta', type=float, default=0.0,
+                        help="Ignore changes smaller than this, in the metric's unit (e.g. 0.05 ms)")
+    parser.add_argument('--only-changed', action='store_true', help="Hide metrics within the threshold")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,60 @@
+# benchmarks/frame_sources.py
+import math
+import os
+import sys
+import cv2
+
+# Make the project modules importable when running scripts from benchmarks/
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def iter_frames(source, every=1, limit=None):
+    """
+    Yields (key, frame) pairs from a directory of images or a video file.
+    For images the key is the file name, for videos the frame index.
+    """
+    count = 0
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTENSIONS))
+        for i, name in enumerate(names):
+            if i % every:
+                continue
+            frame = cv2.imread(os.path.join(source, name))
+            if frame is None:
+                print(f"  [Skip] Unreadable image: {name}")
+                continue
+            yield name, frame
+            count += 1
+            if limit and count >= limit:
+                return
+    else:
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            raise FileNotFoundError(f"Could not open video source '{source}'.")
+        try:
+            index = 0
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                if index % every == 0:
+                    yield str(index), frame
+                    count += 1
+                    if limit and count >= limit:
+                        return
+                index += 1
+        finally:
+            cap.release()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0.0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
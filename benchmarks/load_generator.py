@@ -0,0 +1,361 @@
+# benchmarks/load_generator.py
+"""
+HTTP load generator for /process that simulates several cameras.
+
+Modes:
+  open   - every camera sends a frame every 1/fps seconds whether or not
+           earlier frames were answered (fixed arrival rate, shows how the
+           server sheds load). Latency is also reported from the scheduled
+           send time, so a backed-up client cannot hide server slowness.
+  closed - every camera keeps one request in flight and sends at most fps
+           frames per second, backing off on 503 + Retry-After like
+           templates/index.html does. Frames that came due while waiting are
+           skipped, as a live camera would.
+
+Per camera it reports achieved fps, latency percentiles, 503/error counts and
+lag (time from frame capture to its answer). Server-side time comes from the
+Server-Timing header, so network/queueing overhead is visible too.
+
+Against a running instance:
+    python benchmarks/load_generator.py --url http://127.0.0.1:5000 --cameras 4 --fps 5 --source recordings/gate.mp4
+Self-contained with stub models (starts app.py on a scratch DB, no weights needed):
+    python benchmarks/load_generator.py --spawn --stub-latency-ms 30 --cameras 8 --fps 5 --mode open --json results/load.json
+"""
+import argparse
+import base64
+import configparser
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import cv2
+
+from frame_sources import PROJECT_ROOT, iter_frames, percentile
+from load_test_wsgi import wait_until_ready
+from results import metric, latency_metrics, run_metadata, save_results, load_results, compare_results, print_comparison
+from synthetic_data import synthetic_frames, write_student_db
+
+
+class CameraStats:
+    def __init__(self, camera_id, fps):
+        self.camera_id = camera_id
+        self.target_fps = fps
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.ok = 0
+        self.shed = 0 # 503 (admission control / busy workers)
+        self.errors = 0 # Other statuses and connection failures
+        self.skipped = 0 # Closed loop: frames that came due while a request was in flight
+        self.latencies = [] # ms, send -> response, 200s only
+        self.lags = [] # ms, scheduled capture -> response, 200s only
+        self.server_ms = [] # Server-Timing total, 200s only
+
+    def record(self, status, scheduled, sent, done, server_ms):
+        with self.lock:
+            self.sent += 1
+            if status == 200:
+                self.ok += 1
+                self.latencies.append((done - sent) * 1000.0)
+                self.lags.append((done - scheduled) * 1000.0)
+                if server_ms is not None:
+                    self.server_ms.append(server_ms)
+            elif status == 503:
+                self.shed += 1
+            else:
+                self.errors += 1
+
+
+def server_total_ms(header):
+    """The 'total' entry of a Server-Timing header, in ms."""
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if name == 'total' and params.startswith('dur='):
+            try:
+                return float(params[4:])
+            except ValueError:
+                return None
+    return None
+
+
+class Client:
+    """One keep-alive connection per thread."""
+
+    def __init__(self, host, port, timeout):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.local = threading.local()
+
+    def post(self, path, body):
+        """Returns (status, Retry-After seconds or None, Server-Timing total ms or None); status 0 on connection errors."""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            retry_after = response.getheader('Retry-After')
+            return (response.status, float(retry_after) if retry_after else None,
+                    server_total_ms(response.getheader('Server-Timing')))
+        except (OSError, http.client.HTTPException, ValueError):
+            conn.close()
+            self.local.conn = None
+            return 0, None, None
+
+
+def camera_bodies(uploads, camera_id, offset):
+    """The shared uploads as this camera's request bodies, rotated so cameras do not send identical frames in step."""
+    rotated = uploads[offset % len(uploads):] + uploads[:offset % len(uploads)]
+    return [json.dumps({"image": upload, "camera_id": camera_id}).encode('utf-8') for upload in rotated]
+
+
+def run_open_loop(client, cameras, bodies, duration, max_outstanding):
+    """Fixed arrival rate per camera; requests go to a thread pool and are never waited for by the schedule."""
+    pool = ThreadPoolExecutor(max_workers=max_outstanding)
+    start = time.perf_counter() + 0.2
+    schedule = []
+    for index, stats in enumerate(cameras):
+        interval = 1.0 / stats.target_fps
+        phase = interval * index / len(cameras) # Spread cameras over the frame interval
+        schedule.extend((start + phase + n * interval, index, n) for n in range(int(duration * stats.target_fps)))
+    schedule.sort()
+
+    def send(stats, body, scheduled):
+        sent = time.perf_counter()
+        status, _, server_ms = client.post('/process', body)
+        stats.record(status, scheduled, sent, time.perf_counter(), server_ms)
+
+    for scheduled, index, n in schedule:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pool.submit(send, cameras[index], bodies[index][n % len(bodies[index])], scheduled)
+    pool.shutdown(wait=True)
+    return time.perf_counter() - start
+
+
+def run_closed_loop(client, cameras, bodies, duration):
+    """One request in flight per camera, at most target fps, honoring Retry-After."""
+    start = time.perf_counter() + 0.2
+    stop_at = start + duration
+
+    def camera(index, stats):
+        interval = 1.0 / stats.target_fps
+        next_due = start + interval * index / len(cameras)
+        n = 0
+        while True:
+            now = time.perf_counter()
+            if next_due < now: # Frames that came due while the last request was in flight are dropped
+                missed = int((now - next_due) / interval)
+                stats.skipped += missed
+                next_due += missed * interval
+            if next_due >= stop_at:
+                break
+            if next_due > now:
+                time.sleep(next_due - now)
+            sent = time.perf_counter()
+            status, retry_after, server_ms = client.post('/process', bodies[index][n % len(bodies[index])])
+            done = time.perf_counter()
+            stats.record(status, next_due, sent, done, server_ms)
+            n += 1
+            next_due += interval
+            if status == 503 and retry_after:
+                next_due = max(next_due, done + retry_after)
+
+    threads = [threading.Thread(target=camera, args=(i, stats)) for i, stats in enumerate(cameras)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start
+
+
+def write_stub_config(args, scratch):
+    """config.ini copy that runs stub models against a synthetic DB inside 'scratch'."""
+    parser = configparser.ConfigParser()
+    parser.read(os.path.join(PROJECT_ROOT, args.config))
+    csv_path, embeddings_path = write_student_db(scratch, args.gallery)
+    overrides = {
+        'MODELS': {'stub_models': 'true', 'stub_latency_ms': str(args.stub_latency_ms)},
+        'DATABASE': {'csv_file': csv_path, 'embeddings_file': embeddings_path},
+        'LOGGING': {'fined_log_csv': os.path.join(scratch, 'fined_log.csv'),
+                    'fined_images_dir': os.path.join(scratch, 'fined_images'),
+                    'log_level': 'WARNING'},
+        'EMAIL': {'enabled': 'false'},
+        'ROI': {'zones_file': os.path.join(scratch, 'roi_zones.json')},
+        'PROFILING': {'output_dir': os.path.join(scratch, 'profiles')},
+    }
+    for section, values in overrides.items():
+        if not parser.has_section(section):
+            parser.add_section(section)
+        for key, value in values.items():
+            parser.set(section, key, value)
+    config_path = os.path.join(scratch, 'config.ini')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        parser.write(f)
+    return config_path
+
+
+def spawn_server(args, scratch):
+    config_path = write_stub_config(args, scratch)
+    log_path = os.path.join(scratch, 'server.log')
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application']
+    else:
+        command = [sys.executable, '-c',
+                   "import sys, app; app.initialize_app(sys.argv[1]); "
+                   "app.app.run(host='127.0.0.1', port=int(sys.argv[2]), debug=False, threaded=True)",
+                   config_path, str(args.port)]
+    env = dict(os.environ, SMART_ID_CONFIG=config_path, SMART_ID_BIND=f"127.0.0.1:{args.port}",
+               SMART_ID_WORKERS=str(args.server_workers))
+    log_file = open(log_path, 'w', encoding='utf-8')
+    server = subprocess.Popen(command, cwd=PROJECT_ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    if not wait_until_ready('127.0.0.1', args.port, args.startup_timeout):
+        server.terminate()
+        log_file.close()
+        with open(log_path, 'r', encoding='utf-8') as f:
+            print(f.read()[-4000:])
+        raise SystemExit("Spawned server did not become ready in time (log above).")
+    print(f"[ OK ] Spawned {args.server} server with stub models on port {args.port} (log: {log_path}).")
+    return server, log_file
+
+
+def load_uploads(args):
+    if args.source:
+        frames = [frame for _, frame in iter_frames(args.source, every=args.every, limit=args.frames)]
+    else:
+        frames = synthetic_frames(args.frames, args.width, args.height)
+    if not frames:
+        raise SystemExit(f"No frames read from '{args.source}'.")
+    uploads = []
+    for frame in frames:
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, args.upload_quality])
+        if ok:
+            uploads.append("data:image/jpeg;base64," + base64.b64encode(buffer).decode('ascii'))
+    return uploads
+
+
+def report(args, cameras, elapsed):
+    total = lambda attr: sum(getattr(stats, attr) for stats in cameras)
+    merged = lambda attr: [value for stats in cameras for value in getattr(stats, attr)]
+    sent, ok, shed, errors = total('sent'), total('ok'), total('shed'), total('errors')
+    latencies, lags, server_ms = merged('latencies'), merged('lags'), merged('server_ms')
+    offered = sum(stats.target_fps for stats in cameras)
+
+    print(f"\n--- Per Camera ({args.mode} loop, {elapsed:.1f}s) ---")
+    print(f"{'camera':<10}{'target':>8}{'ok fps':>8}{'sent':>7}{'ok':>7}{'503':>6}{'err':>6}{'skip':>6}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'lag p95':>9}")
+    for stats in cameras:
+        print(f"{stats.camera_id:<10}{stats.target_fps:>8.1f}{stats.ok / elapsed:>8.2f}{stats.sent:>7}{stats.ok:>7}"
+              f"{stats.shed:>6}{stats.errors:>6}{stats.skipped:>6}{percentile(stats.latencies, 50):>9.1f}"
+              f"{percentile(stats.latencies, 95):>9.1f}{percentile(stats.lags, 95):>9.1f}")
+
+    print(f"\n--- Totals ---")
+    print(f"Offered:    {offered:.1f} frames/s ({len(cameras)} camera(s))")
+    print(f"Achieved:   {ok / elapsed:.2f} ok/s, {sent / elapsed:.2f} sent/s")
+    print(f"Shed (503): {shed} ({shed / max(1, sent) * 100.0:.1f}%), errors: {errors} ({errors / max(1, sent) * 100.0:.1f}%)")
+    print(f"Latency:    p50 {percentile(latencies, 50):.1f} ms, p95 {percentile(latencies, 95):.1f} ms, "
+          f"p99 {percentile(latencies, 99):.1f} ms")
+    if server_ms:
+        print(f"Server:     p50 {percentile(server_ms, 50):.1f} ms, p95 {percentile(server_ms, 95):.1f} ms (Server-Timing total)")
+    print(f"Lag:        p50 {percentile(lags, 50):.1f} ms, p95 {percentile(lags, 95):.1f} ms (capture -> answer)")
+
+    metrics = {
+        "throughput.ok_per_s": metric(ok / elapsed, 'req/s', 'higher'),
+        "rate.shed_pct": metric(shed / max(1, sent) * 100.0, '%'),
+        "rate.error_pct": metric(errors / max(1, sent) * 100.0, '%'),
+    }
+    metrics.update(latency_metrics("latency", latencies))
+    metrics.update(latency_metrics("lag", lags))
+    metrics.update(latency_metrics("server", server_ms))
+    return {
+        "meta": run_metadata('load_generator', args.label, mode=args.mode, cameras=len(cameras), fps=args.fps,
+                             duration_s=args.duration, source=args.source or 'synthetic', frames=args.frames,
+                             spawned=args.spawn, stub_latency_ms=args.stub_latency_ms if args.spawn else None),
+        "metrics": metrics,
+        "cameras": {stats.camera_id: {"target_fps": stats.target_fps, "ok_fps": stats.ok / elapsed,
+                                      "sent": stats.sent, "ok": stats.ok, "shed": stats.shed,
+                                      "errors": stats.errors, "skipped": stats.skipped,
+                                      "latency_p95_ms": percentile(stats.latencies, 95),
+                                      "lag_p95_ms": percentile(stats.lags, 95)} for stats in cameras},
+    }
+
+
+def main(args):
+    uploads = load_uploads(args)
+    fps_list = [float(f) for f in args.fps.split(',')]
+    cameras = [CameraStats(f"{args.camera_prefix}{i}", fps_list[i % len(fps_list)]) for i in range(args.cameras)]
+    bodies = [camera_bodies(uploads, stats.camera_id, i * 7) for i, stats in enumerate(cameras)]
+
+    with tempfile.TemporaryDirectory(prefix='smart_id_load_') as scratch:
+        server = log_file = None
+        if args.spawn:
+            server, log_file = spawn_server(args, scratch)
+            host, port = '127.0.0.1', args.port
+        else:
+            url = urlsplit(args.url)
+            host, port = url.hostname, url.port or 80
+        try:
+            client = Client(host, port, args.timeout)
+            # Warm-up outside the measurement (first requests build caches)
+            for body in bodies[0][:args.warmup]:
+                client.post('/process', body)
+            print(f"\n=== {args.mode} loop: {len(cameras)} camera(s) at {args.fps} fps for {args.duration:.0f}s ===")
+            if args.mode == 'open':
+                outstanding = args.max_outstanding or max(8, len(cameras) * 4)
+                elapsed = run_open_loop(client, cameras, bodies, args.duration, outstanding)
+            else:
+                elapsed = run_closed_loop(client, cameras, bodies, args.duration)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+                log_file.close()
+
+    results = report(args, cameras, elapsed)
+    if args.json:
+        save_results(args.json, results)
+    if args.compare:
+        print(f"\n--- Compared with '{args.compare}' ---")
+        rows = compare_results(load_results(args.compare), results, threshold_pct=args.threshold)
+        print_comparison(rows)
+        return 1 if any(row[4] == 'regressed' for row in rows) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Multi-camera HTTP load generator for /process.")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="Base URL of a running instance")
+    parser.add_argument('--spawn', action='store_true', help="Start app.py with stub models on a scratch DB instead")
+    parser.add_argument('--server', choices=('flask', 'gunicorn'), default='flask', help="Server to spawn")
+    parser.add_argument('--server-workers', type=int, default=2, help="Gunicorn workers when spawning gunicorn")
+    parser.add_argument('--port', type=int, default=5056, help="Port of the spawned server")
+    parser.add_argument('--config', default='config.ini', help="Base config of the spawned server")
+    parser.add_argument('--stub-latency-ms', type=float, default=20.0, help="Simulated time per stub model call")
+    parser.add_argument('--gallery', type=int, default=1000, help="Students in the spawned server's synthetic DB")
+    parser.add_argument('--startup-timeout', type=float, default=120.0)
+    parser.add_argument('--mode', choices=('open', 'closed'), default='closed')
+    parser.add_argument('--cameras', type=int, default=4)
+    parser.add_argument('--fps', default='5', help="Target fps per camera; comma-separated values are assigned round-robin")
+    parser.add_argument('--camera-prefix', default='cam-', help="camera_id is <prefix><index>")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds of load")
+    parser.add_argument('--max-outstanding', type=int, default=0, help="Open loop: concurrent requests (default 4 x cameras)")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument('--source', help="Directory of images or a video file (default: synthetic frames)")
+    parser.add_argument('--frames', type=int, default=50, help="Distinct frames to cycle through")
+    parser.add_argument('--every', type=int, default=1, help="Use every Nth frame of the source")
+    parser.add_argument('--width', type=int, default=1280, help="Synthetic frame width")
+    parser.add_argument('--height', type=int, default=720, help="Synthetic frame height")
+    parser.add_argument('--upload-quality', type=int, default=80, help="JPEG quality of the uploads")
+    parser.add_argument('--warmup', type=int, default=5, help="Untimed requests before measuring")
+    parser.add_argument('--label', help="Free-form label stored in the results")
+    parser.add_argument('--json', help="Write machine-readable results to this file")
+    parser.add_argument('--compare', help="Results JSON of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=10.0, help="Regression threshold in percent for --compare")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,137 @@
+# benchmarks/load_test_wsgi.py
+"""
+Load test for the pre-fork WSGI deployment: starts Gunicorn (gunicorn.conf.py,
+wsgi:application) with 1, 2, 4, ... workers and posts recorded frames to
+/process from concurrent client threads, reporting throughput per worker count.
+
+Usage:
+    python benchmarks/load_test_wsgi.py --source recordings/gate.mp4 --workers 1,2,4,8
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import cv2
+
+from frame_sources import PROJECT_ROOT, iter_frames, percentile
+
+
+def encode_frames(source, limit, every):
+    """Pre-encodes frames as the JSON bodies the browser would send."""
+    bodies = []
+    for _, frame in iter_frames(source, every=every, limit=limit):
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 75])
+        if ok:
+            data_uri = "data:image/jpeg;base64," + base64.b64encode(buffer).decode('ascii')
+            bodies.append(json.dumps({"image": data_uri}).encode('utf-8'))
+    return bodies
+
+
+def wait_until_ready(host, port, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request('GET', '/get_totals')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(1)
+    return False
+
+
+def run_clients(host, port, bodies, clients, duration):
+    results = {'ok': 0, 'errors': 0, 'latencies': []}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(offset):
+        conn = http.client.HTTPConnection(host, port, timeout=60)
+        i, ok, errors, latencies = offset, 0, 0, []
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request('POST', '/process', body=bodies[i % len(bodies)],
+                             headers={'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                if response.status == 200:
+                    ok += 1
+                    latencies.append((time.perf_counter() - start) * 1000.0)
+                else:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=60)
+            i += 1
+        conn.close()
+        with lock:
+            results['ok'] += ok
+            results['errors'] += errors
+            results['latencies'].extend(latencies)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def main(args):
+    bodies = encode_frames(args.source, args.frames, args.every)
+    if not bodies:
+        raise SystemExit(f"No frames read from '{args.source}'.")
+
+    rows = []
+    for workers in [int(w) for w in args.workers.split(',')]:
+        clients = args.clients or workers * 2
+        env = dict(os.environ,
+                   SMART_ID_CONFIG=os.path.abspath(args.config),
+                   SMART_ID_WORKERS=str(workers),
+                   SMART_ID_THREADS=str(args.threads),
+                   SMART_ID_BIND=f"127.0.0.1:{args.port}")
+        print(f"\n=== {workers} Gunicorn worker(s), {clients} client(s), {args.duration:.0f}s ===")
+        server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application'],
+                                  cwd=PROJECT_ROOT, env=env)
+        try:
+            if not wait_until_ready('127.0.0.1', args.port, args.startup_timeout):
+                raise SystemExit("Server did not become ready in time.")
+            run_clients('127.0.0.1', args.port, bodies[:1], workers, 3.0) # Warm-up
+            res = run_clients('127.0.0.1', args.port, bodies, clients, args.duration)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        lat = res['latencies']
+        rows.append((workers, clients, res['ok'] / args.duration, res['errors'],
+                     percentile(lat, 50), percentile(lat, 95), percentile(lat, 99)))
+
+    print(f"\n--- /process Throughput vs Gunicorn Workers ---")
+    print(f"{'workers':>8}{'clients':>9}{'req/s':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    base = rows[0][2] or 1.0
+    for workers, clients, rps, errors, p50, p95, p99 in rows:
+        print(f"{workers:>8}{clients:>9}{rps:>9.2f}{errors:>8}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}"
+              f"   x{rps / base:.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Throughput scaling of the Gunicorn deployment across workers.")
+    parser.add_argument('--source', required=True, help="Directory of images or a video file")
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--workers', default='1,2,4', help="Comma-separated Gunicorn worker counts")
+    parser.add_argument('--threads', type=int, default=2, help="Threads per Gunicorn worker")
+    parser.add_argument('--clients', type=int, default=0, help="Concurrent clients (default: 2 x workers)")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds per run")
+    parser.add_argument('--frames', type=int, default=50, help="Distinct frames to cycle through")
+    parser.add_argument('--every', type=int, default=1, help="Use every Nth frame of the source")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--startup-timeout', type=float, default=300.0)
+    main(parser.parse_args())
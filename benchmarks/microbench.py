@@ -0,0 +1,245 @@
+# benchmarks/microbench.py
+"""
+Micro-benchmarks of the pipeline's building blocks, for regression tracking.
+
+Gallery-dependent benchmarks run against synthetic student DBs of each
+--scales size (1k, 10k and 100k students by default), built in a scratch
+directory. Each benchmark is timed like timeit: the loop count is calibrated
+so one measurement takes at least --min-time, repeated --repeat times, and
+the median time per call is reported (the min is kept for reference).
+
+The checked-in baseline (benchmarks/baselines/microbench.json) was recorded
+on one developer machine; absolute numbers only mean something on comparable
+hardware, so regenerate it with --update-baseline when the reference machine
+changes.
+
+Usage:
+    python benchmarks/microbench.py run --json results/micro.json
+    python benchmarks/microbench.py run --filter gallery --scales 100000
+    python benchmarks/microbench.py compare --threshold 15      # run, then compare with the baseline
+    python benchmarks/microbench.py run --update-baseline        # record a new baseline
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from frame_sources import PROJECT_ROOT
+from results import metric, run_metadata, save_results, load_results, compare_results, print_comparison
+from synthetic_data import scratch_config, synthetic_frames
+from config_loader import load_config
+from stub_models import stub_embedding
+
+DEFAULT_BASELINE = os.path.join(PROJECT_ROOT, 'benchmarks', 'baselines', 'microbench.json')
+
+BENCHMARKS = [] # (name, scaled, setup); setup(context) returns the zero-argument callable to time
+
+
+def benchmark(name, scaled=False):
+    """Registers a benchmark; scaled ones run once per gallery size."""
+    def register(setup):
+        BENCHMARKS.append((name, scaled, setup))
+        return setup
+    return register
+
+
+class Context:
+    """Inputs shared by the benchmarks of one gallery size."""
+
+    def __init__(self, config, directory, students):
+        from database_manager import DatabaseManager
+        from fined_log_manager import FinedLogManager
+
+        self.students = students
+        self.config = scratch_config(config, directory, students) if students else dict(config)
+        self.db_manager = DatabaseManager(self.config) if students else None
+        self.fined_log_manager = FinedLogManager(os.path.join(directory, 'fined_log.csv'))
+        self.frame = synthetic_frames(1, 1280, 720, seed=1)[0]
+        # Probe face: a noisy copy of gallery identity 3, as the recognizer would produce
+        probe = stub_embedding(3) + np.random.default_rng(7).standard_normal(512).astype(np.float32) * 0.01
+        self.probe = probe / np.linalg.norm(probe)
+
+
+# --- Recognition ---
+
+@benchmark('gallery_match', scaled=True)
+def bench_gallery_match(ctx):
+    from image_processor import match_embedding
+    known_names, known_embeddings = ctx.db_manager.get_recognition_data()
+    gallery_ids, gallery_matrix = ctx.db_manager.get_embedding_matrix()
+    return lambda: match_embedding(ctx.probe, known_embeddings, gallery_ids, gallery_matrix)
+
+
+@benchmark('gallery_match_per_student', scaled=True)
+def bench_gallery_match_loop(ctx):
+    # Fallback path when the embedding matrix cache is unavailable
+    from image_processor import match_embedding
+    _, known_embeddings = ctx.db_manager.get_recognition_data()
+    return lambda: match_embedding(ctx.probe, known_embeddings)
+
+
+@benchmark('cosine_similarity')
+def bench_cosine_similarity(ctx):
+    from image_processor import calculate_cosine_similarity
+    other = stub_embedding(4)
+    return lambda: calculate_cosine_similarity(ctx.probe, other)
+
+
+# --- Image I/O and drawing ---
+
+@benchmark('decode_image_720p')
+def bench_decode_image(ctx):
+    from utils import decode_image, encode_image
+    upload = "data:image/jpeg;base64," + encode_image(ctx.frame, quality=80)
+    return lambda: decode_image(upload)
+
+
+@benchmark('encode_image_720p')
+def bench_encode_image(ctx):
+    from utils import encode_image
+    quality = ctx.config.get('output_jpeg_quality', 85)
+    return lambda: encode_image(ctx.frame, quality=quality)
+
+
+@benchmark('draw_text_with_background')
+def bench_draw_text(ctx):
+    from utils import draw_text_with_background
+    canvas = ctx.frame.copy()
+    return lambda: draw_text_with_background(canvas, "Fine: Student 1234 (0.87)", (100, 200),
+                                             fontScale=0.5, bg_color=(0, 0, 255), alpha=0.6)
+
+
+@benchmark('draw_overlays_24_labels')
+def bench_draw_overlays(ctx):
+    # A crowded frame: 24 labelled person boxes drawn by one draw_overlays() pass
+    from utils import draw_overlays, BoxLabel, COLOR_PERSON_WITH_ID, COLOR_RECOGNIZED_NO_ID, COLOR_UNKNOWN_NO_ID
+    colors = (COLOR_PERSON_WITH_ID, COLOR_RECOGNIZED_NO_ID, COLOR_UNKNOWN_NO_ID)
+    overlays = [BoxLabel((40 + 50 * i, 100 + 10 * i, 140 + 50 * i, 400 + 10 * i), colors[i % 3],
+                         f"Fine: Student {i} (0.8{i % 10})", (42 + 50 * i, 93 + 10 * i), 0.45, 0.75)
+                for i in range(24)]
+    canvas = ctx.frame.copy()
+    return lambda: draw_overlays(canvas, overlays)
+
+
+# --- Database and fined log ---
+
+@benchmark('apply_fine', scaled=True)
+def bench_apply_fine(ctx):
+    db = ctx.db_manager
+    ids = list(db.known_ids)
+    position = [0]
+
+    def apply_next():
+        # A student is fined once per day, so every call takes the next one
+        if position[0] >= len(ids):
+            position[0] = 0
+            db.fined_students_today = set()
+        student_id = ids[position[0]]
+        position[0] += 1
+        db.apply_fine(student_id, db.known_names.get(student_id, ''))
+    return apply_next
+
+
+@benchmark('get_totals', scaled=True)
+def bench_get_totals(ctx):
+    return ctx.db_manager.get_totals
+
+
+@benchmark('export_database_csv', scaled=True)
+def bench_export_csv(ctx):
+    return lambda: ctx.db_manager.export_database_csv()[0].getvalue()
+
+
+@benchmark('log_fine')
+def bench_log_fine(ctx):
+    import datetime
+    now = datetime.datetime.now()
+    return lambda: ctx.fined_log_manager.log_fine('S000003', 'Student 3', now, 'S000003_20250101_120000.jpg')
+
+
+def measure(func, min_time, repeat):
+    """Returns (median, min) seconds per call."""
+    func() # Warm-up (imports, caches)
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.2))
+    timings = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - start) / loops)
+    return statistics.median(timings), min(timings)
+
+
+def run_suite(args):
+    config = load_config(args.config)
+    scales = [int(s) for s in args.scales.split(',') if s]
+    selected = [(name, scaled, setup) for name, scaled, setup in BENCHMARKS
+                if not args.filter or any(f in name for f in args.filter.split(','))]
+    metrics, rows = {}, []
+    runs = [(0, [b for b in selected if not b[1]])] + [(scale, [b for b in selected if b[1]]) for scale in scales]
+    for students, benchmarks in runs:
+        if not benchmarks:
+            continue
+        with tempfile.TemporaryDirectory(prefix='smart_id_micro_') as scratch:
+            print(f"\n=== {'gallery ' + str(students) + ' students' if students else 'gallery-independent'} ===")
+            ctx = Context(config, scratch, students)
+            for name, scaled, setup in benchmarks:
+                key = f"{name}[{students}]" if scaled else name
+                median, best = measure(setup(ctx), args.min_time, args.repeat)
+                metrics[key] = metric(median * 1e6, 'us')
+                rows.append((key, median * 1e6, best * 1e6))
+                print(f"  {key:<40}{median * 1e6:>14.2f} us/call (min {best * 1e6:.2f})")
+    return {
+        "meta": run_metadata('microbench', args.label, scales=scales, min_time=args.min_time,
+                             repeat=args.repeat, filter=args.filter),
+        "metrics": metrics,
+    }
+
+
+def main(args):
+    results = run_suite(args)
+    if args.json:
+        save_results(args.json, results)
+    if args.update_baseline:
+        save_results(args.baseline, results)
+    if args.command == 'compare':
+        baseline = load_results(args.baseline)
+        print(f"\n--- Compared with baseline '{args.baseline}' (rev {baseline.get('meta', {}).get('git_revision')}) ---")
+        rows = [row for row in compare_results(baseline, results, threshold_pct=args.threshold,
+                                                min_delta=args.min_delta)
+                if row[4] != 'missing' or not args.filter] # Filtered runs only cover part of the baseline
+        print_comparison(rows, base_label='baseline', new_label='now')
+        regressed = [row[0] for row in rows if row[4] == 'regressed']
+        print(f"\n{len(regressed)} benchmark(s) slower than the baseline by more than {args.threshold:g}%"
+              + (f": {', '.join(regressed)}" if regressed else "."))
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the hot functions, with baseline comparison.")
+    parser.add_argument('command', choices=('run', 'compare'), help="run: measure; compare: measure and check against the baseline")
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--scales', default='1000,10000,100000', help="Comma-separated gallery sizes")
+    parser.add_argument('--filter', help="Only benchmarks whose name contains one of these (comma-separated)")
+    parser.add_argument('--min-time', type=float, default=0.1, help="Seconds per measurement (loop count is calibrated)")
+    parser.add_argument('--repeat', type=int, default=5, help="Measurements per benchmark; the median is reported")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline results JSON")
+    parser.add_argument('--update-baseline', action='store_true', help="Write this run's results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=15.0, help="Allowed slowdown in percent for compare")
+    parser.add_argument('--min-delta', type=float, default=0.0, help="Ignore slowdowns smaller than this many microseconds")
+    parser.add_argument('--label', help="Free-form label stored in the results")
+    parser.add_argument('--json', help="Also write this run's results to this file")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,121 @@
+# benchmarks/results.py
+"""
+Machine-readable benchmark results shared by the benchmark tools.
+
+A results file is JSON with a "meta" block (when/where/what was run) and a
+flat "metrics" map {name: {"value", "unit", "better"}}; tools may add more
+detail sections. compare_results() only looks at "metrics", so any two
+files written by the same tool can be compared (see compare_results.py).
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from frame_sources import PROJECT_ROOT, percentile
+
+
+def metric(value, unit='ms', better='lower'):
+    """One comparable number; 'better' is 'lower' (latencies, memory) or 'higher' (throughput)."""
+    return {"value": round(float(value), 4), "unit": unit, "better": better}
+
+
+def latency_metrics(prefix, samples_ms):
+    """p50/p95/p99/mean metrics of a list of millisecond samples, named '<prefix>.p50' etc."""
+    if not samples_ms:
+        return {}
+    return {
+        f"{prefix}.p50": metric(percentile(samples_ms, 50)),
+        f"{prefix}.p95": metric(percentile(samples_ms, 95)),
+        f"{prefix}.p99": metric(percentile(samples_ms, 99)),
+        f"{prefix}.mean": metric(sum(samples_ms) / len(samples_ms)),
+    }
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                  capture_output=True, text=True, timeout=5).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=PROJECT_ROOT,
+                               capture_output=True, text=True, timeout=5).stdout.strip()
+        return revision + ('-dirty' if dirty else '') if revision else None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_metadata(tool, label=None, **settings):
+    return {
+        "tool": tool,
+        "label": label,
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "command": " ".join(sys.argv),
+        "settings": settings,
+    }
+
+
+def save_results(path, results):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"[ OK ] Results written to '{path}'.")
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_results(base, new, threshold_pct=10.0, min_delta=0.0):
+    """
+    Compares the metrics of two results dicts. A metric regresses when it got
+    worse by more than threshold_pct percent and by more than min_delta (in
+    its own unit, to ignore jitter on tiny values).
+    Returns rows of (name, base value, new value, change %, status) with
+    status 'regressed', 'improved', 'ok', 'new' or 'missing'.
+    """
+    base_metrics = base.get('metrics', {})
+    new_metrics = new.get('metrics', {})
+    rows = []
+    for name in sorted(set(base_metrics) | set(new_metrics)):
+        if name not in new_metrics:
+            rows.append((name, base_metrics[name]['value'], None, None, 'missing'))
+            continue
+        if name not in base_metrics:
+            rows.append((name, None, new_metrics[name]['value'], None, 'new'))
+            continue
+        old_value = base_metrics[name]['value']
+        new_value = new_metrics[name]['value']
+        better = new_metrics[name].get('better', 'lower')
+        if old_value:
+            change = (new_value - old_value) / abs(old_value) * 100.0
+        else: # Any change from zero (e.g. a 0% error rate) counts as infinitely large
+            change = 0.0 if new_value == old_value else float('inf') if new_value > old_value else float('-inf')
+        worse_by = (new_value - old_value) if better == 'lower' else (old_value - new_value)
+        worse_pct = change if better == 'lower' else -change
+        if worse_by > min_delta and worse_pct > threshold_pct:
+            status = 'regressed'
+        elif -worse_by > min_delta and -worse_pct > threshold_pct:
+            status = 'improved'
+        else:
+            status = 'ok'
+        rows.append((name, old_value, new_value, change, status))
+    return rows
+
+
+def print_comparison(rows, base_label='base', new_label='new'):
+    width = max([len(row[0]) for row in rows] + [10])
+    print(f"{'metric':<{width}}{base_label:>14}{new_label:>14}{'change':>10}  status")
+    for name, old_value, new_value, change, status in rows:
+        old_text = f"{old_value:.3f}" if old_value is not None else "-"
+        new_text = f"{new_value:.3f}" if new_value is not None else "-"
+        change_text = f"{change:+.1f}%" if change is not None else "-"
+        marker = "  <-- REGRESSION" if status == 'regressed' else ""
+        print(f"{name:<{width}}{old_text:>14}{new_text:>14}{change_text:>10}  {status}{marker}")
@@ -0,0 +1,78 @@
+# benchmarks/synthetic_data.py
+"""
+Synthetic inputs for the benchmarks: a student DB + embeddings gallery of
+any size in a scratch directory, and generated camera frames.
+Gallery identity i uses stub_models.stub_embedding(i), so faces returned by
+the stub face app match the gallery like real students would.
+"""
+import os
+
+import cv2
+import numpy as np
+import pandas as pd
+
+import frame_sources # noqa: F401 (puts the project root on sys.path)
+from stub_models import EMBEDDING_SIZE, stub_embedding, stub_student_id
+
+
+def synthetic_gallery(size, stub_identities=1000):
+    """Returns (ids, (size, 512) float32 L2-normalized matrix)."""
+    ids = [stub_student_id(i) for i in range(size)]
+    matrix = np.empty((size, EMBEDDING_SIZE), dtype=np.float32)
+    matched = min(size, stub_identities)
+    for i in range(matched):
+        matrix[i] = stub_embedding(i)
+    if size > matched:
+        # Identities the stub face app never produces; one generator call is much faster than one per row
+        rest = np.random.default_rng(size).standard_normal((size - matched, EMBEDDING_SIZE)).astype(np.float32)
+        rest /= np.linalg.norm(rest, axis=1, keepdims=True)
+        matrix[matched:] = rest
+    return ids, matrix
+
+
+def write_student_db(directory, size, stub_identities=1000):
+    """Writes students.csv and known_embeddings.npy for 'size' students; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    ids, matrix = synthetic_gallery(size, stub_identities)
+    csv_path = os.path.join(directory, 'students.csv')
+    embeddings_path = os.path.join(directory, 'known_embeddings.npy')
+    pd.DataFrame({
+        "student_id": ids,
+        "name": [f"Student {i}" for i in range(size)],
+        "image_path": [f"images/{student_id}.jpg" for student_id in ids],
+        "fine_amount": 0.0,
+        "email": [f"{student_id.lower()}@example.edu" for student_id in ids],
+    }).to_csv(csv_path, index=False)
+    # Same {student_id: embedding} format generate_embeddings.py writes
+    np.save(embeddings_path, {student_id: matrix[i] for i, student_id in enumerate(ids)})
+    return csv_path, embeddings_path
+
+
+def scratch_config(config, directory, gallery_size):
+    """Copy of 'config' whose DB, embeddings, fined log and evidence images all live in 'directory'."""
+    csv_path, embeddings_path = write_student_db(directory, gallery_size, config.get('stub_identities', 1000))
+    config = dict(config)
+    config.update({
+        'csv_file': csv_path,
+        'embeddings_file': embeddings_path,
+        'fined_log_csv': os.path.join(directory, 'fined_log.csv'),
+        'fined_images_dir': os.path.join(directory, 'fined_images'),
+        'email_enabled': False, # Never mail synthetic students
+        'shared_fine_state': False,
+    })
+    return config
+
+
+def synthetic_frames(count, width=1280, height=720, seed=0):
+    """Camera-like BGR frames (gradient, noise, a few blocks) that compress like real JPEGs."""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(40, 200, width, dtype=np.float32)[None, :, None]
+    frames = []
+    for _ in range(count):
+        frame = np.clip(gradient + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+        for _ in range(int(rng.integers(1, 5))):
+            x, y = int(rng.integers(0, width - 100)), int(rng.integers(0, height - 200))
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            cv2.rectangle(frame, (x, y), (x + int(rng.integers(60, 200)), y + int(rng.integers(150, 400))), color, -1)
+        frames.append(frame)
+    return frames
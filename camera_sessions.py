@@ -0,0 +1,219 @@
+# camera_sessions.py
+import json
+import threading
+import time
+from collections import namedtuple
+
+# Latest processed frame of a camera; 'events' caches its serialized SSE messages
+_Result = namedtuple('_Result', ['seq', 'published_at', 'encoded_frame', 'detected_info', 'events'])
+
+
+class TooManySubscribers(Exception):
+    """Raised when a camera already has max_subscribers viewers."""
+
+
+class _Subscription:
+    """
+    A viewer's event stream. The viewer count is released once, either when
+    the generator finishes or in close(): WSGI servers call close() on every
+    response body, and a generator that never started would not run its own
+    'finally'.
+    """
+
+    def __init__(self, events, broker, session):
+        self.events = events
+        self.broker = broker
+        self.session = session
+        self.released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.events)
+
+    def release(self):
+        with self.broker.cond:
+            if not self.released:
+                self.released = True
+                self.session.subscribers -= 1
+
+    def close(self):
+        try:
+            self.events.close()
+        finally:
+            self.release()
+
+
+class CameraSession:
+    """Producer claim, subscribers and latest result of one camera ID."""
+
+    def __init__(self, camera_id):
+        self.camera_id = camera_id
+        self.producer = None # client_id of the tab allowed to submit frames
+        self.producer_since = None
+        self.producer_seen = 0.0 # monotonic time of its last claim/frame
+        self.subscribers = 0
+        self.result = None # _Result
+        self.published = 0
+        self.rejected = 0 # Frames refused from non-producers
+
+
+class CameraSessionBroker:
+    """
+    One producer per camera ID, any number of viewers.
+
+    A browser tab (client_id) becomes the camera's producer with claim(); other
+    tabs posting frames for the same camera are refused and watch instead, so
+    each camera frame is processed (and fined) once however many people look at
+    it. A producer that sends nothing for producer_timeout seconds loses the
+    claim, so a closed tab does not block the camera. Each processed result is
+    published to the session and pushed to subscribers by stream() (Server-Sent
+    Events); slow viewers skip to the newest result instead of queueing.
+
+    Sessions live in this process: with several server workers, all tabs of
+    one camera must reach the same worker.
+    """
+
+    def __init__(self, producer_timeout=5.0, max_subscribers=20, heartbeat=15.0):
+        self.producer_timeout = producer_timeout
+        self.max_subscribers = max_subscribers
+        self.heartbeat = heartbeat
+        self.cond = threading.Condition()
+        self.sessions = {} # camera_id -> CameraSession
+        self.closed = False
+
+    def _session(self, camera_id):
+        session = self.sessions.get(camera_id)
+        if session is None:
+            session = self.sessions[camera_id] = CameraSession(camera_id)
+        return session
+
+    def _producer_alive(self, session, now):
+        return session.producer is not None and now - session.producer_seen < self.producer_timeout
+
+    def claim(self, camera_id, client_id):
+        """True if client_id is (now) the camera's producer; refreshes its claim."""
+        now = time.monotonic()
+        with self.cond:
+            session = self._session(camera_id)
+            if session.producer != client_id:
+                if self._producer_alive(session, now):
+                    session.rejected += 1
+                    return False
+                session.producer = client_id
+                session.producer_since = time.time()
+            session.producer_seen = now
+            return True
+
+    def release(self, camera_id, client_id):
+        """Gives up the claim (tab stopped or closed) so another tab can take over at once."""
+        with self.cond:
+            session = self.sessions.get(camera_id)
+            if session is not None and session.producer == client_id:
+                session.producer = None
+                session.producer_since = None
+                return True
+            return False
+
+    def publish(self, camera_id, encoded_frame, detected_info):
+        """Stores the camera's newest result and wakes its subscribers."""
+        with self.cond:
+            session = self._session(camera_id)
+            session.published += 1
+            session.result = _Result(session.published, time.time(), encoded_frame, detected_info, {})
+            self.cond.notify_all()
+
+    @staticmethod
+    def _event(camera_id, result, include_image):
+        """SSE message for a result, serialized once per variant and shared by all subscribers. Caller holds cond."""
+        event = result.events.get(include_image)
+        if event is None:
+            payload = {"camera_id": camera_id, "detections": result.detected_info}
+            if include_image:
+                payload["processed_image"] = result.encoded_frame
+            event = result.events[include_image] = f"id: {result.seq}\nevent: result\ndata: {json.dumps(payload)}\n\n"
+        return event
+
+    def latest(self, camera_id, after=0, include_image=True):
+        """
+        Newest result as a dict (seq, camera_id, detections[, processed_image]),
+        or None if there is none newer than seq 'after'. Polling fallback for
+        viewers that could not open a stream.
+        """
+        with self.cond:
+            session = self.sessions.get(camera_id)
+            result = session.result if session is not None else None
+            if result is None or result.seq == after:
+                return None
+            payload = {"seq": result.seq, "camera_id": camera_id, "detections": result.detected_info}
+            if include_image:
+                payload["processed_image"] = result.encoded_frame
+            return payload
+
+    def stream(self, camera_id, include_image=True):
+        """
+        Generator of SSE messages for a new subscriber: the latest result
+        right away, then every newer one, with comment
+        heartbeats while idle (which also notice disconnected viewers).
+        Raises TooManySubscribers if the camera is at max_subscribers.
+        The viewer is counted right away (check and count in one step, so
+        simultaneous viewers cannot overshoot the cap) and uncounted when the
+        stream ends or is closed, also if it was never read.
+        """
+        with self.cond:
+            session = self._session(camera_id)
+            if session.subscribers >= self.max_subscribers:
+                raise TooManySubscribers(f"Camera '{camera_id}' already has {session.subscribers} viewers.")
+            session.subscribers += 1
+
+        def events():
+            last_seq = 0
+            try:
+                yield "retry: 2000\n\n" # Browser reconnect delay
+                while True:
+                    with self.cond:
+                        self.cond.wait_for(lambda: self.closed or (session.result is not None
+                                                                  and session.result.seq != last_seq),
+                                           timeout=self.heartbeat)
+                        if self.closed:
+                            return
+                        result = session.result
+                        if result is not None and result.seq != last_seq:
+                            last_seq = result.seq
+                            event = self._event(camera_id, result, include_image)
+                        else:
+                            event = ": keep-alive\n\n"
+                    yield event
+            finally:
+                subscription.release()
+
+        subscription = _Subscription(events(), self, session)
+        return subscription
+
+    def snapshot(self):
+        """Per-camera producer and subscriber counts; forgets sessions nobody uses any more."""
+        now = time.monotonic()
+        with self.cond:
+            result = {}
+            for camera_id, session in list(self.sessions.items()):
+                alive = self._producer_alive(session, now)
+                if not alive and not session.subscribers and (session.result is None or
+                                                              time.time() - session.result.published_at > 300):
+                    del self.sessions[camera_id]
+                    continue
+                result[camera_id] = {
+                    "producers": 1 if alive else 0,
+                    "producer_since": session.producer_since if alive else None,
+                    "subscribers": session.subscribers,
+                    "frames_published": session.published,
+                    "frames_rejected": session.rejected,
+                    "last_result_age_s": round(time.time() - session.result.published_at, 3) if session.result else None,
+                }
+            return result
+
+    def close(self):
+        """Ends all streams (server shutdown)."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
@@ -18,6 +18,10 @@ def load_config(config_file='config.ini'):
         settings['face_match_threshold'] = config.getfloat('SETTINGS', 'face_match_threshold', fallback=0.4)
         settings['person_conf_threshold'] = config.getfloat('SETTINGS', 'person_conf_threshold', fallback=0.6)
         settings['id_card_conf_threshold'] = config.getfloat('SETTINGS', 'id_card_conf_threshold', fallback=0.5)
+        settings['id_detection_mode'] = config.get('SETTINGS', 'id_detection_mode', fallback='full_frame').strip().lower()
+        settings['id_crop_imgsz'] = config.getint('SETTINGS', 'id_crop_imgsz', fallback=320)
+        settings['id_crop_top'] = config.getfloat('SETTINGS', 'id_crop_top', fallback=0.1)
+        settings['id_crop_bottom'] = config.getfloat('SETTINGS', 'id_crop_bottom', fallback=0.8)
         # Ignored source settings for web UI mode
         settings['source'] = config.get('SETTINGS', 'source', fallback='camera') # Keep for potential future use or info
         settings['video_path'] = config.get('SETTINGS', 'video_path', fallback='')
@@ -26,10 +30,97 @@ def load_config(config_file='config.ini'):
         # [MODELS]
         settings['person_model_path'] = config.get('MODELS', 'person_model', fallback='yolov8n.pt')
         settings['id_card_model_path'] = config.get('MODELS', 'id_card_model', fallback='id_card_detector.pt')
+        settings['use_pose_model'] = config.getboolean('MODELS', 'use_pose_model', fallback=False)
+        settings['pose_model_path'] = config.get('MODELS', 'pose_model', fallback='yolov8n-pose.pt')
+        settings['stub_models'] = config.getboolean('MODELS', 'stub_models', fallback=False)
+        settings['stub_latency_ms'] = config.getfloat('MODELS', 'stub_latency_ms', fallback=0.0)
         # settings['face_recognition_method'] = config.get('MODELS', 'face_recognition', fallback='template_matching') # Keep if needed later
 
+        # [RESOLUTION]
+        settings['decode_reduce_factor'] = config.getint('RESOLUTION', 'decode_reduce_factor', fallback=1)
+        if settings['decode_reduce_factor'] not in (1, 2, 4, 8):
+            raise ValueError(f"decode_reduce_factor must be 1, 2, 4 or 8 (got {settings['decode_reduce_factor']}).")
+        settings['inference_max_width'] = config.getint('RESOLUTION', 'inference_max_width', fallback=0)
+        settings['person_imgsz'] = config.getint('RESOLUTION', 'person_imgsz', fallback=0)
+        settings['id_imgsz'] = config.getint('RESOLUTION', 'id_imgsz', fallback=0)
+        settings['annotate_max_width'] = config.getint('RESOLUTION', 'annotate_max_width', fallback=0)
+        settings['output_max_width'] = config.getint('RESOLUTION', 'output_max_width', fallback=0)
+        settings['output_jpeg_quality'] = config.getint('RESOLUTION', 'output_jpeg_quality', fallback=85)
+
+        # [CLIENT]
+        settings['adaptive_capture'] = config.getboolean('CLIENT', 'adaptive_capture', fallback=True)
+        settings['latency_target_ms'] = config.getfloat('CLIENT', 'latency_target_ms', fallback=400.0)
+        settings['client_max_fps'] = config.getfloat('CLIENT', 'max_fps', fallback=10.0)
+        settings['capture_max_width'] = config.getint('CLIENT', 'capture_max_width', fallback=0)
+
+        # [SESSIONS]
+        settings['sessions_enabled'] = config.getboolean('SESSIONS', 'enabled', fallback=True)
+        settings['producer_timeout_s'] = config.getfloat('SESSIONS', 'producer_timeout_s', fallback=5.0)
+        settings['max_subscribers'] = config.getint('SESSIONS', 'max_subscribers', fallback=20)
+        settings['session_heartbeat_s'] = config.getfloat('SESSIONS', 'heartbeat_s', fallback=15.0)
+        settings['max_streams'] = config.getint('SESSIONS', 'max_streams', fallback=8)
+
+        # [MEMORY]
+        settings['frame_pool_enabled'] = config.getboolean('MEMORY', 'frame_pool', fallback=True)
+        settings['frame_pool_max_mb'] = config.getint('MEMORY', 'frame_pool_max_mb', fallback=256)
+
+        # [THREADS]
+        settings['torch_threads'] = config.getint('THREADS', 'torch_threads', fallback=0)
+        settings['torch_interop_threads'] = config.getint('THREADS', 'torch_interop_threads', fallback=0)
+        settings['ort_intra_op_threads'] = config.getint('THREADS', 'ort_intra_op_threads', fallback=0)
+        settings['ort_inter_op_threads'] = config.getint('THREADS', 'ort_inter_op_threads', fallback=0)
+        settings['opencv_threads'] = config.getint('THREADS', 'opencv_threads', fallback=0)
+        settings['inference_slots'] = config.getint('THREADS', 'inference_slots', fallback=0)
+
+        # [WORKERS]
+        settings['inference_workers'] = config.getint('WORKERS', 'inference_workers', fallback=0)
+        settings['ring_slots'] = config.getint('WORKERS', 'ring_slots', fallback=0)
+        settings['max_frame_width'] = config.getint('WORKERS', 'max_frame_width', fallback=1920)
+        settings['max_frame_height'] = config.getint('WORKERS', 'max_frame_height', fallback=1080)
+        settings['worker_timeout'] = config.getfloat('WORKERS', 'worker_timeout', fallback=10.0)
+
+        # [BATCHING]
+        settings['batching_enabled'] = config.getboolean('BATCHING', 'enabled', fallback=False)
+        settings['max_batch_size'] = config.getint('BATCHING', 'max_batch_size', fallback=8)
+        settings['max_wait_ms'] = config.getfloat('BATCHING', 'max_wait_ms', fallback=5.0)
+
+        # [ADMISSION]
+        settings['admission_enabled'] = config.getboolean('ADMISSION', 'enabled', fallback=True)
+        settings['max_in_flight'] = config.getint('ADMISSION', 'max_in_flight', fallback=0)
+        settings['max_queue'] = config.getint('ADMISSION', 'max_queue', fallback=4)
+        settings['queue_timeout_ms'] = config.getint('ADMISSION', 'queue_timeout_ms', fallback=250)
+        settings['newest_frame_wins'] = config.getboolean('ADMISSION', 'newest_frame_wins', fallback=True)
+        settings['default_camera_priority'] = config.getfloat('ADMISSION', 'default_priority', fallback=1.0)
+        settings['camera_ttl_s'] = config.getfloat('ADMISSION', 'camera_ttl_s', fallback=300.0)
+        settings['max_cameras'] = config.getint('ADMISSION', 'max_cameras', fallback=256)
+
+        # [CAMERA_PRIORITIES] camera_id = weight (keys are lower-cased by configparser)
+        settings['camera_priorities'] = {}
+        if config.has_section('CAMERA_PRIORITIES'):
+            for camera_id in config.options('CAMERA_PRIORITIES'):
+                settings['camera_priorities'][camera_id] = config.getfloat('CAMERA_PRIORITIES', camera_id)
+
+        # [TRACING]
+        settings['slow_request_count'] = config.getint('TRACING', 'slow_request_count', fallback=50)
+        settings['slow_request_window_s'] = config.getfloat('TRACING', 'slow_request_window_s', fallback=900.0)
+
+        # [PROFILING]
+        settings['profiling_enabled'] = config.getboolean('PROFILING', 'enabled', fallback=True)
+        settings['profile_max_seconds'] = config.getfloat('PROFILING', 'max_seconds', fallback=120.0)
+        settings['profile_output_dir'] = config.get('PROFILING', 'output_dir', fallback='profiles')
+
+        # [ROI]
+        settings['roi_zones_file'] = config.get('ROI', 'zones_file', fallback='roi_zones.json')
+
+        # [ADMIN]
+        settings['admin_token'] = config.get('ADMIN', 'admin_token', fallback='')
+
         # [DATABASE]
         settings['csv_file'] = config.get('DATABASE', 'csv_file', fallback='students_db.csv')
+        settings['embeddings_file'] = config.get('DATABASE', 'embeddings_file', fallback='known_embeddings.npy')
+
+        # [SERVER]
+        settings['shared_fine_state'] = config.getboolean('SERVER', 'shared_fine_state', fallback=False)
 
         # [FINE]
         settings['fine_amount'] = config.getfloat('FINE', 'fine_amount', fallback=10.0)
@@ -38,6 +129,8 @@ def load_config(config_file='config.ini'):
         settings['model_name'] = config.get('ARCFACE', 'model_name', fallback='buffalo_l') # MAKE SURE THIS IS PRESENT
         settings['similarity_threshold'] = config.getfloat('ARCFACE', 'similarity_threshold', fallback=0.5) # MAKE SURE THIS IS PRESENT
         settings['providers'] = config.get('ARCFACE', 'providers', fallback='CPU') # MAKE SURE THIS IS PRESENT
+        settings['keypoint_conf_threshold'] = config.getfloat('ARCFACE', 'keypoint_conf_threshold', fallback=0.5)
+        settings['min_keypoint_eye_distance'] = config.getfloat('ARCFACE', 'min_keypoint_eye_distance', fallback=10.0)
 
         # [EMAIL]
         settings['email_enabled'] = config.getboolean('EMAIL', 'enabled', fallback=False)
@@ -52,6 +145,16 @@ def load_config(config_file='config.ini'):
         # [LOGGING]
         settings['fined_images_dir'] = config.get('LOGGING', 'fined_images_dir', fallback='fined_student_images')
         settings['fined_log_csv'] = config.get('LOGGING', 'fined_log_csv', fallback='fined_log.csv')
+        settings['log_level'] = config.get('LOGGING', 'log_level', fallback='INFO')
+        settings['log_format'] = config.get('LOGGING', 'log_format', fallback='text').strip().lower()
+        settings['log_file'] = config.get('LOGGING', 'log_file', fallback='').strip()
+        settings['log_levels'] = config.get('LOGGING', 'log_levels', fallback='')
+        settings['log_sample_every'] = config.getint('LOGGING', 'log_sample_every', fallback=100)
+
+        # [ANALYTICS]
+        settings['analytics_enabled'] = config.getboolean('ANALYTICS', 'enabled', fallback=True)
+        settings['analytics_db_file'] = config.get('ANALYTICS', 'db_file', fallback='fined_log_analytics.sqlite3')
+        settings['analytics_cache_entries'] = config.getint('ANALYTICS', 'cache_entries', fallback=256)
         # --------------
 
         print("--- Configuration Loaded ---")
@@ -5,6 +5,14 @@ import numpy as np
 import threading # Required for email thread
 import datetime
 import io
+import json
+import logging
+import time
+
+from file_lock import InterProcessLock, NullLock
+from metrics import EMAIL_QUEUE
+
+logger = logging.getLogger(__name__)
 
 # --- Import the email sending function from the separate module ---
 try:
@@ -13,7 +21,15 @@ except ImportError:
     print("[ERROR] Could not import 'send_fine_notification' from 'email_notifier.py'. Ensure the file exists.")
     # Define a dummy function so the rest of the code doesn't crash immediately
     def send_fine_notification(*args, **kwargs):
-        print("[WARN] Dummy email function called because import failed.")
+        logger.warning("Dummy email function called because import failed.")
+
+def _send_notification_tracked(*args):
+    """Runs send_fine_notification while counting it in the email queue gauge."""
+    try:
+        send_fine_notification(*args)
+    finally:
+        EMAIL_QUEUE.dec()
+
 
 # --- DatabaseManager Class ---
 class DatabaseManager:
@@ -22,6 +38,9 @@ class DatabaseManager:
         self.csv_file_path = config.get('csv_file', 'students_db.csv')
         self.embeddings_file_path = config.get('embeddings_file', 'known_embeddings.npy')
         self.fine_amount = config.get('fine_amount', 50.0) # Default based on logs
+        # Shared fine state: several server processes fine against the same files
+        self.shared_state = config.get('shared_fine_state', False)
+        self.fined_today_file_path = self.csv_file_path + '.fined_today.json'
 
         # --- Store Email Config ---
         self.email_config = {
@@ -40,11 +59,25 @@ class DatabaseManager:
         self.known_names = {} # {id: name}
         self.known_embeddings = {} # {id: embedding_array}
         self.known_emails = {} # {id: email} <-- Store emails
+        self.known_embedding_ids = [] # Row order of known_embedding_matrix
+        self.known_embedding_matrix = None # (N, D) float32, memory-mapped and L2-normalized
 
         self.fined_students_today = set()
         self.current_day = datetime.date.today()
         self.db_lock = threading.Lock()
+        # Cross-process lock, always taken *inside* db_lock
+        self.state_lock = InterProcessLock(self.csv_file_path + '.lock') if self.shared_state else NullLock()
+        self._csv_stat = None # (mtime_ns, size) of the CSV as last read/written by this process
+        self._fined_today_stat = None # Same for the shared fined-today file
+        # Live totals (version, violations_today, total_fine, day), maintained by apply_fine and
+        # swapped as a whole, so get_totals() reads them without db_lock
+        self._totals = (0, 0, 0.0, self.current_day)
+        self.totals_changed = threading.Condition() # Notified whenever _totals changes
         self.is_loaded = self._load_database_and_embeddings()
+        if self.is_loaded:
+            with self.db_lock, self.state_lock:
+                self._sync_shared_state()
+                self._refresh_totals()
 
     def _load_database_and_embeddings(self):
         """Loads student info (incl. email) from CSV and embeddings."""
@@ -60,18 +93,10 @@ class DatabaseManager:
                 self.known_ids, self.known_names, self.known_emails = [], {}, {}
                 db_loaded = True
             else:
-                db = pd.read_csv(self.csv_file_path)
-                required_cols = ["student_id", "name", "image_path", "fine_amount", "email"] # Added 'email'
-                if not all(col in db.columns for col in required_cols):
-                    print(f"[FAIL] ERROR: DB CSV '{self.csv_file_path}' must have columns: {', '.join(required_cols)}")
+                db = self._read_students_csv()
+                if db is None:
                     return False # Fail if columns missing
 
-                # Clean data
-                db['student_id'] = db['student_id'].astype(str).str.strip()
-                db['fine_amount'] = pd.to_numeric(db['fine_amount'], errors='coerce').fillna(0).astype(float)
-                db['name'] = db['name'].astype(str).str.strip().fillna('Unknown')
-                db['email'] = db['email'].astype(str).str.strip().replace('', np.nan) # Handle empty strings
-
                 self.students_db = db
                 self.known_ids = db["student_id"].tolist()
                 self.known_names = pd.Series(db.name.values, index=db.student_id).to_dict()
@@ -79,6 +104,7 @@ class DatabaseManager:
                 self.known_emails = db.dropna(subset=['email']).set_index('student_id')['email'].to_dict()
 
                 print(f"[ OK ] Database CSV loaded: {len(self.known_ids)} students ({len(self.known_emails)} with emails).")
+                self._csv_stat = self._file_stat(self.csv_file_path)
                 db_loaded = True
 
         except pd.errors.EmptyDataError:
@@ -104,6 +130,7 @@ class DatabaseManager:
                  else:
                      raise TypeError("Loaded embeddings file is not in the expected dictionary format.")
                  print(f"[ OK ] Embeddings loaded for {len(self.known_embeddings)} students from '{self.embeddings_file_path}'.")
+                 self._load_embedding_matrix()
                  # Optional verification checks...
                  embeddings_loaded = True
              except Exception as e:
@@ -122,34 +149,202 @@ class DatabaseManager:
         print("--- Database & Embeddings Loading Complete ---")
         return db_loaded
 
+    def _read_students_csv(self):
+        """Reads and cleans the student CSV. Returns None if required columns are missing."""
+        db = pd.read_csv(self.csv_file_path)
+        required_cols = ["student_id", "name", "image_path", "fine_amount", "email"] # Added 'email'
+        if not all(col in db.columns for col in required_cols):
+            print(f"[FAIL] ERROR: DB CSV '{self.csv_file_path}' must have columns: {', '.join(required_cols)}")
+            return None
+
+        # Clean data
+        db['student_id'] = db['student_id'].astype(str).str.strip()
+        db['fine_amount'] = pd.to_numeric(db['fine_amount'], errors='coerce').fillna(0).astype(float)
+        db['name'] = db['name'].astype(str).str.strip().fillna('Unknown')
+        db['email'] = db['email'].astype(str).str.strip().replace('', np.nan) # Handle empty strings
+        return db
+
+    def _load_embedding_matrix(self):
+        """
+        Stacks the embeddings into an L2-normalized float32 matrix cached next to the
+        embeddings file, and memory-maps it. Server processes forked from the same
+        parent (or started separately) then share one copy of the gallery pages.
+        The cache records the embeddings file's exact size and mtime_ns and is
+        only reused if both still match and it holds the same student IDs (a
+        restored/copied file with an older mtime must not keep the old gallery).
+        """
+        base = os.path.splitext(self.embeddings_file_path)[0]
+        matrix_path = base + '_matrix.npy'
+        ids_path = base + '_ids.npy'
+        source_path = base + '_source.npy' # [mtime_ns, size] of the embeddings file the cache was built from
+        try:
+            if not self.known_embeddings:
+                return
+            source_stat = self._file_stat(self.embeddings_file_path)
+            cache_fresh = False
+            if source_stat is not None and all(os.path.exists(p) for p in (matrix_path, ids_path, source_path)):
+                cached_stat = tuple(int(v) for v in np.load(source_path))
+                cached_ids = np.load(ids_path).tolist()
+                cache_fresh = cached_stat == source_stat and cached_ids == list(self.known_embeddings.keys())
+            if not cache_fresh:
+                ids = list(self.known_embeddings.keys())
+                matrix = np.stack([np.asarray(self.known_embeddings[i], dtype=np.float32).ravel() for i in ids])
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                matrix /= norms
+                # Write to temp files and rename, so concurrent readers never see a partial cache;
+                # the source stamp goes last, so a half-written cache is never taken as fresh
+                for path, array in ((ids_path, np.array(ids, dtype=str)), (matrix_path, matrix),
+                                    (source_path, np.array(source_stat, dtype=np.int64))):
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        np.save(f, array)
+                    os.replace(tmp_path, path)
+                print(f"[Info] Wrote embedding matrix cache '{matrix_path}' ({matrix.shape[0]}x{matrix.shape[1]}).")
+
+            matrix = np.load(matrix_path, mmap_mode='r')
+            ids = np.load(ids_path).tolist()
+            if len(ids) != matrix.shape[0]:
+                raise ValueError(f"ids ({len(ids)}) and matrix rows ({matrix.shape[0]}) do not match")
+            self.known_embedding_ids = ids
+            self.known_embedding_matrix = matrix
+            # Dict values become views into the shared matrix, so the private copies can be freed
+            self.known_embeddings = {student_id: matrix[i] for i, student_id in enumerate(ids)}
+            print(f"[ OK ] Embedding matrix memory-mapped from '{matrix_path}'.")
+        except Exception as e:
+            print(f"[WARN] Could not build/map embedding matrix ({e}). Falling back to per-student matching.")
+            self.known_embedding_ids = []
+            self.known_embedding_matrix = None
+
+    @staticmethod
+    def _file_stat(path):
+        try:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _sync_shared_state(self):
+        """
+        Picks up fines applied by other processes. Must be called within db_lock
+        and state_lock; a no-op unless shared_fine_state is enabled.
+        """
+        if not self.shared_state:
+            return
+        # Balances: reload the CSV only if another process rewrote it
+        csv_stat = self._file_stat(self.csv_file_path)
+        reloaded = False
+        if csv_stat is not None and csv_stat != self._csv_stat:
+            try:
+                db = self._read_students_csv()
+                if db is not None:
+                    self.students_db = db
+                    reloaded = True
+                self._csv_stat = csv_stat
+            except Exception as e:
+                logger.warning("Failed to reload shared database CSV: %s", e)
+        # Students already fined today
+        try:
+            self._fined_today_stat = self._file_stat(self.fined_today_file_path)
+            if os.path.exists(self.fined_today_file_path):
+                with open(self.fined_today_file_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                today = datetime.date.today()
+                if state.get('date') == today.isoformat():
+                    self.fined_students_today = set(state.get('student_ids', []))
+                    self.current_day = today
+        except Exception as e:
+            logger.warning("Failed to read shared fined-today state '%s': %s", self.fined_today_file_path, e)
+        self._refresh_totals(None if reloaded else 0.0) # Only a reloaded table needs summing again
+
+    def _poll_shared_state(self):
+        """
+        Syncs with the other processes if they changed the shared files (two
+        stat() calls otherwise). Skipped while this process holds db_lock: the
+        fine being applied syncs and publishes the totals itself.
+        """
+        if (self._file_stat(self.csv_file_path) == self._csv_stat
+                and self._file_stat(self.fined_today_file_path) == self._fined_today_stat):
+            return
+        if not self.db_lock.acquire(blocking=False):
+            return
+        try:
+            with self.state_lock:
+                self._sync_shared_state()
+        finally:
+            self.db_lock.release()
+
+    def _refresh_totals(self, fine_delta=None):
+        """
+        Publishes the current totals to get_totals() and wait_for_totals().
+        Must be called within db_lock. fine_delta is added to the cached total
+        fine; None sums the whole fine_amount column again.
+        """
+        version, _, total_fine, _ = self._totals
+        if fine_delta is None:
+            total_fine = 0.0
+            if self.students_db is not None and len(self.students_db):
+                total_fine = float(pd.to_numeric(self.students_db['fine_amount'], errors='coerce').fillna(0).sum())
+        else:
+            total_fine += fine_delta
+        totals = (len(self.fined_students_today), round(total_fine, 2), self.current_day)
+        if totals != self._totals[1:]:
+            with self.totals_changed:
+                self._totals = (version + 1,) + totals
+                self.totals_changed.notify_all()
+
+    def _write_students_csv(self):
+        """Saves students_db. In shared mode the file is replaced atomically."""
+        if self.shared_state:
+            tmp_path = f"{self.csv_file_path}.{os.getpid()}.tmp"
+            self.students_db.to_csv(tmp_path, index=False, float_format='%.2f')
+            os.replace(tmp_path, self.csv_file_path)
+        else:
+            self.students_db.to_csv(self.csv_file_path, index=False, float_format='%.2f') # Save with format
+        self._csv_stat = self._file_stat(self.csv_file_path)
+
+    def _write_fined_today(self):
+        """Persists today's fined set for the other processes (shared mode only)."""
+        if not self.shared_state:
+            return
+        tmp_path = f"{self.fined_today_file_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'date': self.current_day.isoformat(), 'student_ids': sorted(self.fined_students_today)}, f)
+        os.replace(tmp_path, self.fined_today_file_path)
+        self._fined_today_stat = self._file_stat(self.fined_today_file_path)
+
     def _reset_daily_fines_if_needed(self):
         """Resets the set of fined students if the day has changed. Must be called within db_lock."""
         today = datetime.date.today()
         if today != self.current_day:
             # This check should ideally be inside the lock for thread-safety if multiple threads could call it
             # but since apply_fine holds the lock when calling this, it's currently safe.
-            print(f"--- New Day ({today}) --- Resetting daily fined list ---")
+            logger.info("New day (%s): resetting daily fined list.", today)
             self.fined_students_today = set()
             self.current_day = today
+            self._refresh_totals(0.0)
 
     def apply_fine(self, student_id, student_name):
         """Applies fine, saves DB, and triggers email notification in a new thread."""
         if not self.is_loaded or self.students_db is None:
-            print(f"Error: Cannot apply fine. Database not loaded.")
+            logger.error("Cannot apply fine. Database not loaded.")
             return False # Exit early if DB not ready
 
         fine_applied_successfully = False
         new_total_fine_amount = 0.0 # Store the student's new total fine
 
         # Use lock for modifying shared resources (students_db, fined_students_today)
-        with self.db_lock:
+        # state_lock additionally serializes fining across server processes (shared mode)
+        with self.db_lock, self.state_lock:
+            self._sync_shared_state()
             self._reset_daily_fines_if_needed()
 
             if student_id in self.fined_students_today:
                 # Fine was not applied *this time*, so return False immediately
                 return False # Exit the method here
 
-            print(f"-> Violation: Applying ${self.fine_amount:.2f} fine to {student_name} (ID: {student_id})")
+            logger.info("Violation: applying $%.2f fine to %s (ID: %s)", self.fine_amount, student_name, student_id,
+                        extra={"event": "fine", "student_id": student_id, "amount": self.fine_amount})
             student_indices = self.students_db.index[self.students_db['student_id'] == student_id].tolist()
 
             if student_indices:
@@ -161,17 +356,22 @@ class DatabaseManager:
 
                 # Attempt to save DB
                 try:
-                    self.students_db.to_csv(self.csv_file_path, index=False, float_format='%.2f') # Save with format
+                    self._write_students_csv()
                     # Only if save succeeds: update state and set success flag
                     self.fined_students_today.add(student_id)
                     fine_applied_successfully = True # Mark success
+                    self._refresh_totals(self.fine_amount) # Pushed to /totals/events
+                    try:
+                        self._write_fined_today()
+                    except Exception as e:
+                        logger.warning("Failed to persist shared fined-today state: %s", e)
                 except Exception as e:
-                    print(f"   ERROR: Failed to save updated DB to '{self.csv_file_path}': {e}")
+                    logger.error("Failed to save updated DB to '%s': %s", self.csv_file_path, e)
                     # Revert the change in memory if save failed
                     self.students_db.loc[db_idx, 'fine_amount'] = current_fine
                     fine_applied_successfully = False # Mark failure
             else:
-                print(f"   ERROR: Student ID {student_id} not found in DB for applying fine.")
+                logger.error("Student ID %s not found in DB for applying fine.", student_id)
                 fine_applied_successfully = False # Mark failure
 
         # --- Correctly Indented Email Trigger Block ---
@@ -181,40 +381,55 @@ class DatabaseManager:
             recipient_email = self.known_emails.get(student_id)
             if recipient_email:
                 # Indented two levels
-                print(f"  [Info] Preparing email notification for {student_name}...")
+                logger.info("Preparing email notification for %s...", student_name)
+                EMAIL_QUEUE.inc()
                 email_thread = threading.Thread(
-                    target=send_fine_notification, # Target the imported function
+                    target=_send_notification_tracked, # Wraps the imported function
                     args=(recipient_email, student_name, self.fine_amount, new_total_fine_amount, self.email_config),
                     daemon=True
                 )
                 email_thread.start()
             else:
                 # Indented two levels
-                print(f"  [Info] Fine applied to {student_name}, but no email address found in database.")
+                logger.info("Fine applied to %s, but no email address found in database.", student_name)
         elif not self.email_config.get('enabled', False) and fine_applied_successfully:
              # Indented one level
-             print(f"  [Info] Fine applied to {student_name}, but email notifications are disabled.")
+             logger.info("Fine applied to %s, but email notifications are disabled.", student_name)
         # --- End of Email Trigger Block ---
 
         # Return the actual success status of applying the fine (and saving)
         return fine_applied_successfully
 
     def get_totals(self):
-        """Calculates total outstanding fine and violations today. Thread-safe."""
+        """
+        Violations today and total outstanding fine. Reads the counters that
+        apply_fine maintains instead of summing the table, without db_lock.
+        """
         if not self.is_loaded or self.students_db is None:
             return 0, 0.0
+        if self.shared_state:
+            self._poll_shared_state() # Fines applied by other processes
+        _, violations_today, total_fine, day = self._totals
+        if day != datetime.date.today():
+            violations_today = 0 # Nobody fined since midnight yet
+        return violations_today, total_fine
 
-        with self.db_lock:
-            self._reset_daily_fines_if_needed()
-            try:
-                fine_column = pd.to_numeric(self.students_db['fine_amount'], errors='coerce').fillna(0)
-                total_fine = fine_column.sum()
-                violations_today = len(self.fined_students_today)
-                # print(f"[DEBUG get_totals] Calculated total_fine: {total_fine}") # Keep if needed
-                return violations_today, float(total_fine)
-            except Exception as e:
-                print(f"Error calculating totals: {e}")
-                return 0, 0.0
+    def wait_for_totals(self, version=None, timeout=None):
+        """
+        Blocks until the totals' version differs from 'version' or 'timeout'
+        seconds have passed, and returns the current version. In shared mode
+        the other processes' files are checked every second while waiting.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        poll = 1.0 if self.shared_state else None
+        while True:
+            if self.shared_state:
+                self._poll_shared_state()
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            wait = remaining if poll is None else (poll if remaining is None else min(poll, remaining))
+            with self.totals_changed:
+                if self.totals_changed.wait_for(lambda: self._totals[0] != version, timeout=wait) or wait == remaining:
+                    return self._totals[0]
 
     def get_recognition_data(self):
         """Returns known names map and embeddings map for face recognition."""
@@ -222,19 +437,33 @@ class DatabaseManager:
             return {}, {}
         return self.known_names, self.known_embeddings
 
-    def export_database_csv(self):
-        """Exports the current state of the database to a CSV buffer. Thread-safe."""
+    def get_embedding_matrix(self):
+        """Returns (ids, matrix) for vectorized matching, or ([], None) if unavailable."""
+        if not self.is_loaded or self.known_embedding_matrix is None:
+            return [], None
+        return self.known_embedding_ids, self.known_embedding_matrix
+
+    def snapshot_database(self):
+        """
+        Consistent copy of students_db for exports. db_lock is held only for the
+        copy, so fining is not blocked while the copy is formatted and sent.
+        """
         if not self.is_loaded or self.students_db is None:
             raise ValueError("Database not loaded, cannot export.")
+        with self.db_lock, self.state_lock:
+            self._sync_shared_state()
+            return self.students_db.copy()
 
-        with self.db_lock:
-            try:
-                buffer = io.BytesIO()
-                self.students_db.to_csv(buffer, index=False, encoding='utf-8', float_format='%.2f')
-                buffer.seek(0)
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"student_fines_export_{timestamp}.csv"
-                return buffer, filename, 'text/csv'
-            except Exception as e:
-                print(f"Error exporting database to CSV buffer: {e}")
-                raise
\ No newline at end of file
+    def export_database_csv(self):
+        """Exports a snapshot of the database to a CSV buffer (formatted outside db_lock)."""
+        snapshot = self.snapshot_database()
+        try:
+            buffer = io.BytesIO()
+            snapshot.to_csv(buffer, index=False, encoding='utf-8', float_format='%.2f')
+            buffer.seek(0)
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"student_fines_export_{timestamp}.csv"
+            return buffer, filename, 'text/csv'
+        except Exception as e:
+            logger.error("Error exporting database to CSV buffer: %s", e)
+            raise
@@ -0,0 +1,67 @@
+# event_streams.py
+import threading
+
+
+class StreamSlots:
+    """
+    Bounds the Server-Sent Event streams (/totals/events, /camera/<id>/events)
+    open in this process. Each open stream occupies a server thread for as long
+    as the page stays connected, so without a cap a few dashboards would take
+    every worker thread and leave none for /process. Gunicorn gets one extra
+    thread per slot (gunicorn.conf.py); requests over the cap are refused with
+    503 and the page polls instead.
+    """
+
+    def __init__(self, max_streams=8):
+        self.max_streams = max_streams
+        self.lock = threading.Lock()
+        self.open = 0
+        self.refused = 0
+
+    def try_acquire(self):
+        with self.lock:
+            if self.open >= self.max_streams:
+                self.refused += 1
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.open -= 1
+
+    def wrap(self, events):
+        """Response body for a stream holding one slot; the slot is freed when the server closes the response."""
+        return _SlotStream(events, self)
+
+    def snapshot(self):
+        with self.lock:
+            return {"open": self.open, "max": self.max_streams, "refused": self.refused}
+
+
+class _SlotStream:
+    """
+    Iterable that frees its slot in close(). WSGI servers call close() on every
+    response body, also when the client went away before the first chunk (a
+    generator's own 'finally' would not run if it never started).
+    """
+
+    def __init__(self, events, slots):
+        self.events = events
+        self.slots = slots
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.events)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.events.close()
+        finally:
+            self.slots.release()
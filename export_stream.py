@@ -0,0 +1,156 @@
+# export_stream.py
+"""
+Streaming exports of the student balances and the fined-event log.
+
+The data comes from snapshots (DatabaseManager.snapshot_database() and a
+byte length of the append-only fined log taken under its lock), so nothing
+is locked while rows are formatted and sent. Rows are produced in chunks of
+chunk_rows and each writer turns chunks into bytes as they arrive, so only
+one chunk is ever formatted in memory.
+
+Formats: 'csv', 'parquet' (one row group per chunk) and 'arrow' (Arrow IPC
+stream). The columnar ones need pyarrow, which is optional.
+"""
+import io
+
+import pandas as pd
+
+CHUNK_ROWS = 5000
+
+EXPORT_FORMATS = {
+    # format: (mimetype, file extension)
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+FINED_LOG_COLUMNS = ["student_id", "name", "timestamp", "image_filename"]
+
+
+class ExportUnavailable(Exception):
+    """Raised when a format's optional dependency is missing."""
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet # noqa: F401 (registers pyarrow.parquet)
+        return pyarrow
+    except ImportError:
+        raise ExportUnavailable("Parquet/Arrow export needs pyarrow (pip install pyarrow).")
+
+
+# --- Row sources (DataFrame chunks) ---
+
+def balance_chunks(snapshot, chunk_rows=CHUNK_ROWS):
+    """The students table in chunks (always at least one, possibly empty, for the header/schema)."""
+    if not len(snapshot):
+        yield snapshot
+        return
+    for start in range(0, len(snapshot), chunk_rows):
+        yield snapshot.iloc[start:start + chunk_rows]
+
+
+class _PrefixReader(io.RawIOBase):
+    """The first 'limit' bytes of a binary file: rows appended after the snapshot are not read."""
+
+    def __init__(self, f, limit):
+        self.f = f
+        self.remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        if size <= 0:
+            return 0
+        data = self.f.read(size)
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+def fined_event_chunks(snapshot, log_path, log_size, chunk_rows=CHUNK_ROWS):
+    """
+    Fined-log events up to byte 'log_size', each joined with the student's
+    current balance and email from 'snapshot' (left join: events of students
+    no longer in the table keep empty balance columns).
+    """
+    balances = snapshot[['student_id', 'fine_amount', 'email']].drop_duplicates('student_id')
+    balances = balances.rename(columns={'fine_amount': 'current_fine_amount'})
+    empty = pd.DataFrame({col: pd.Series(dtype=str) for col in FINED_LOG_COLUMNS})
+    if not log_size:
+        yield empty.merge(balances, on='student_id', how='left')
+        return
+    with open(log_path, 'rb') as f:
+        reader = io.BufferedReader(_PrefixReader(f, log_size))
+        chunks = pd.read_csv(reader, dtype=str, keep_default_na=False, chunksize=chunk_rows, encoding='utf-8')
+        produced = False
+        for chunk in chunks:
+            produced = True
+            chunk['student_id'] = chunk['student_id'].str.strip()
+            yield chunk.merge(balances, on='student_id', how='left')
+        if not produced: # Header only
+            yield empty.merge(balances, on='student_id', how='left')
+
+
+# --- Writers (bytes) ---
+
+def csv_stream(chunks):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header, float_format='%.2f').encode('utf-8')
+        header = False
+
+
+def _columnar(chunk):
+    """Same types in every chunk: text as strings (an all-empty chunk is not 'null'), timestamps parsed."""
+    chunk = chunk.copy()
+    for col in chunk.columns:
+        if col == 'timestamp':
+            chunk[col] = pd.to_datetime(chunk[col], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+        elif chunk[col].dtype == object:
+            chunk[col] = chunk[col].astype('string')
+    return chunk
+
+
+def _columnar_stream(chunks, open_writer, write_chunk):
+    pa = require_pyarrow()
+    sink = io.BytesIO()
+    writer = schema = None
+    for chunk in chunks:
+        table = pa.Table.from_pandas(_columnar(chunk), preserve_index=False)
+        if writer is None:
+            schema = table.schema
+            writer = open_writer(sink, schema)
+        write_chunk(writer, table.cast(schema))
+        yield sink.getvalue() # Bytes written for this chunk
+        sink.seek(0)
+        sink.truncate()
+    writer.close() # Footer / end-of-stream marker
+    yield sink.getvalue()
+
+
+def parquet_stream(chunks):
+    pa = require_pyarrow()
+    return _columnar_stream(chunks, lambda sink, schema: pa.parquet.ParquetWriter(sink, schema),
+                            lambda writer, table: writer.write_table(table))
+
+
+def arrow_stream(chunks):
+    pa = require_pyarrow()
+    return _columnar_stream(chunks, lambda sink, schema: pa.ipc.new_stream(sink, schema),
+                            lambda writer, table: writer.write_table(table))
+
+
+WRITERS = {'csv': csv_stream, 'parquet': parquet_stream, 'arrow': arrow_stream}
+
+
+def export_stream(fmt, chunks):
+    """Bytes generator for 'fmt' (raises ValueError for unknown formats, ExportUnavailable without pyarrow)."""
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format '{fmt}' (choose from {', '.join(WRITERS)}).")
+    if fmt != 'csv':
+        require_pyarrow() # Fail before the response starts
+    return WRITERS[fmt](chunks)
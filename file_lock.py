@@ -0,0 +1,51 @@
+# file_lock.py
+import os
+
+try:
+    import fcntl # POSIX only
+except ImportError:
+    fcntl = None
+
+
+class InterProcessLock:
+    """
+    Exclusive lock shared by all processes that use the same lock file
+    (e.g. several Gunicorn workers). Re-entrant within one holder is NOT
+    supported; combine with a threading.Lock for thread safety.
+    On platforms without fcntl the lock is a no-op.
+    """
+
+    def __init__(self, lock_file_path):
+        self.lock_file_path = lock_file_path
+        self.fd = None
+        if fcntl is None:
+            print(f"[WARN] fcntl not available; cross-process lock '{lock_file_path}' is disabled.")
+
+    def __enter__(self):
+        if fcntl is None:
+            return self
+        lock_dir = os.path.dirname(self.lock_file_path)
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+        self.fd = os.open(self.lock_file_path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.fd is not None:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self.fd)
+                self.fd = None
+        return False
+
+
+class NullLock:
+    """Stand-in for InterProcessLock when only one process uses the files."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
@@ -3,6 +3,9 @@ import csv
 import os
 import threading
 import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 class FinedLogManager:
     """Handles writing fine event records to a dedicated CSV file."""
@@ -20,9 +23,9 @@ class FinedLogManager:
             if log_dir and not os.path.exists(log_dir):
                 try:
                     os.makedirs(log_dir, exist_ok=True)
-                    print(f"[Info] Created directory for fined log: {log_dir}")
+                    logger.info("Created directory for fined log: %s", log_dir)
                 except OSError as e:
-                    print(f"[ERROR] Failed to create directory for fined log '{log_dir}': {e}")
+                    logger.error("Failed to create directory for fined log '%s': %s", log_dir, e)
                     # Decide how to handle this - maybe disable logging?
 
             # Check if file exists or is empty to write header
@@ -33,9 +36,9 @@ class FinedLogManager:
                         writer = csv.writer(csvfile)
                         header = ["student_id", "name", "timestamp", "image_filename"]
                         writer.writerow(header)
-                    print(f"[Info] Initialized fined log file: {self.log_file_path}")
+                    logger.info("Initialized fined log file: %s", self.log_file_path)
                 except IOError as e:
-                    print(f"[ERROR] Failed to initialize fined log file '{self.log_file_path}': {e}")
+                    logger.error("Failed to initialize fined log file '%s': %s", self.log_file_path, e)
 
     def log_fine(self, student_id, name, timestamp, image_filename):
         """Appends a fine record to the CSV file."""
@@ -51,9 +54,26 @@ class FinedLogManager:
                 with open(self.log_file_path, 'a', newline='', encoding='utf-8') as csvfile:
                     writer = csv.writer(csvfile)
                     writer.writerow(row)
-                # print(f"[Log OK] Logged fine for {student_id} to {self.log_file_path}") # Optional success log
+                logger.debug("Logged fine for %s to %s", student_id, self.log_file_path)
 
             except IOError as e:
-                print(f"[ERROR] Failed to write to fined log file '{self.log_file_path}': {e}")
+                logger.error("Failed to write to fined log file '%s': %s", self.log_file_path, e)
             except Exception as e:
-                 print(f"[ERROR] Unexpected error writing to fined log: {e}")
\ No newline at end of file
+                 logger.exception("Unexpected error writing to fined log: %s", e)
+
+    def snapshot_size(self):
+        """
+        Length in bytes of the log's complete rows right now; exports read up to
+        here while fines keep being appended. A row another process is still
+        writing (shared mode) is left out.
+        """
+        with self.file_lock:
+            try:
+                with open(self.log_file_path, 'rb') as f:
+                    size = f.seek(0, os.SEEK_END)
+                    f.seek(max(0, size - 4096))
+                    tail = f.read()
+            except OSError:
+                return 0
+        last_newline = tail.rfind(b'\n')
+        return size - len(tail) + last_newline + 1 if last_newline >= 0 else 0
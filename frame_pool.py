@@ -0,0 +1,113 @@
+# frame_pool.py
+"""
+Reusable frame-sized buffers.
+
+Each /process request used to allocate several full-frame arrays (the
+downscaled inference frame, the annotation canvas, the copy of the worker
+pool's output) and drop them again a few milliseconds later. With several
+cameras that is a steady stream of multi-megabyte allocations, each one
+paying fresh page faults (large arrays come straight from mmap).
+
+FramePool keeps released buffers keyed by shape and dtype and hands them out
+again. Buffers are borrowed for one request with frame_lease(): every
+acquire_frame() inside the lease is given back to the pool when the lease
+ends, so nothing from a lease may be kept after it (copy it if it must
+outlive the request). Outside a lease acquire_frame() is a plain np.empty.
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class FramePool:
+    """Free lists of uint8 (or other dtype) arrays by (shape, dtype), bounded in total size."""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_per_shape=16):
+        self.max_bytes = max_bytes
+        self.max_per_shape = max_per_shape
+        self._free = {} # (shape, dtype) -> [arrays]
+        self._lock = threading.Lock()
+        self.pooled_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.dropped = 0 # Released while the pool was full
+
+    def acquire(self, shape, dtype=np.uint8):
+        """An uninitialized array of this shape: a pooled one if available, else a new one."""
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                buffer = free.pop()
+                self.pooled_bytes -= buffer.nbytes
+                self.hits += 1
+                return buffer
+            self.misses += 1
+        return np.empty(shape, dtype=dtype)
+
+    def release(self, buffer):
+        """Returns a buffer to the pool; the caller must not use it afterwards."""
+        if buffer.base is not None or not buffer.flags.c_contiguous:
+            return # Views of other memory are never pooled
+        key = (buffer.shape, buffer.dtype.str)
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            if len(free) >= self.max_per_shape or self.pooled_bytes + buffer.nbytes > self.max_bytes:
+                self.dropped += 1
+                return
+            free.append(buffer)
+            self.pooled_bytes += buffer.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+            self.pooled_bytes = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "dropped": self.dropped,
+                "pooled_buffers": sum(len(free) for free in self._free.values()),
+                "pooled_bytes": self.pooled_bytes,
+            }
+
+
+FRAME_POOL = FramePool()
+
+_current_lease = contextvars.ContextVar('smart_id_frame_lease', default=None)
+
+
+@contextmanager
+def frame_lease(pool=None):
+    """Buffers acquired by this thread inside the block go back to 'pool' (default FRAME_POOL) at its end."""
+    pool = pool or FRAME_POOL
+    borrowed = []
+    token = _current_lease.set((pool, borrowed))
+    try:
+        yield borrowed
+    finally:
+        _current_lease.reset(token)
+        for buffer in borrowed:
+            pool.release(buffer)
+
+
+def acquire_frame(shape, dtype=np.uint8):
+    """Uninitialized array from the current lease's pool, or np.empty when no lease is active."""
+    lease = _current_lease.get()
+    if lease is None:
+        return np.empty(shape, dtype=dtype)
+    pool, borrowed = lease
+    buffer = pool.acquire(shape, dtype)
+    borrowed.append(buffer)
+    return buffer
+
+
+def copy_frame(frame):
+    """frame.copy() into a leased buffer."""
+    buffer = acquire_frame(frame.shape, frame.dtype)
+    np.copyto(buffer, frame)
+    return buffer
@@ -7,65 +7,36 @@ import os
 import sys
 from config_loader import load_config # Assuming config_loader.py is in the same dir
 
-def generate_known_embeddings(config):
-    """
-    Processes student images from the database CSV, extracts ArcFace embeddings,
-    and saves them to the specified file.
-    """
-    db_csv_path = config.get('csv_file', 'students_db.csv') # Direct key access with default
-    embeddings_output_file = config.get('embeddings_file', 'known_embeddings.npy') # Direct key access with default
+def load_face_app(config):
+    """Loads the InsightFace detector + ArcFace recognizer named in config. Raises on failure."""
     arcface_model_name = config.get('model_name', 'buffalo_l') # Direct key access with default
     providers_str = config.get('providers', 'CPU') # Direct key access with default
 
     # Parse providers string into a list
     providers = [p.strip() + 'ExecutionProvider' for p in providers_str.split(',')]
     print(f"Using Execution Providers: {providers}")
-
-    print("--- Generating Known Embeddings ---")
     print(f"Loading ArcFace model '{arcface_model_name}'...")
 
-    try:
-        # Initialize FaceAnalysis - this loads detector and recognizer
-        # allowed_modules=['detection', 'recognition'] ensures both are loaded
-        # You might need to run this once with internet to download models
-        face_app = insightface.app.FaceAnalysis(name=arcface_model_name,
-                                                allowed_modules=['detection', 'recognition'],
-                                                providers=providers)
-        face_app.prepare(ctx_id=0, det_size=(640, 640)) # ctx_id=0 for CPU or first GPU
-        print("ArcFace model loaded successfully.")
-    except Exception as e:
-        print(f"FATAL: Failed to load InsightFace model '{arcface_model_name}'. Error: {e}")
-        print("Ensure 'insightface' and 'onnxruntime' are installed.")
-        print("If using GPU, check CUDA/cuDNN setup and provider setting in config.ini.")
-        sys.exit(1)
+    # Initialize FaceAnalysis - this loads detector and recognizer
+    # allowed_modules=['detection', 'recognition'] ensures both are loaded
+    # You might need to run this once with internet to download models
+    face_app = insightface.app.FaceAnalysis(name=arcface_model_name,
+                                            allowed_modules=['detection', 'recognition'],
+                                            providers=providers)
+    face_app.prepare(ctx_id=0, det_size=(640, 640)) # ctx_id=0 for CPU or first GPU
+    print("ArcFace model loaded successfully.")
+    return face_app
 
-    # Load the student database CSV
-    if not os.path.exists(db_csv_path):
-        print(f"ERROR: Database CSV file not found at '{db_csv_path}'")
-        sys.exit(1)
-
-    try:
-        db = pd.read_csv(db_csv_path)
-        required_cols = ["student_id", "name", "image_path"]
-        if not all(col in db.columns for col in required_cols):
-             print(f"ERROR: DB CSV '{db_csv_path}' must have columns: {', '.join(required_cols)}")
-             sys.exit(1)
-        db['student_id'] = db['student_id'].astype(str).str.strip()
-        db['image_path'] = db['image_path'].astype(str).str.strip()
-        print(f"Loaded {len(db)} student records from '{db_csv_path}'.")
-    except Exception as e:
-        print(f"ERROR: Failed to load or parse database CSV '{db_csv_path}': {e}")
-        sys.exit(1)
 
+def embed_student_images(face_app, db, csv_dir):
+    """
+    Extracts one embedding per row of 'db' (columns student_id, name, image_path;
+    relative image paths are resolved against csv_dir).
+    Returns ({student_id: embedding}, counts dict).
+    """
     known_embeddings = {}
-    processed_count = 0
-    error_count = 0
-    no_face_count = 0
-    multiple_faces_count = 0
+    counts = {'processed': 0, 'errors': 0, 'no_face': 0, 'multiple_faces': 0}
 
-    csv_dir = os.path.dirname(os.path.abspath(db_csv_path))
-
-    print("Processing student images...")
     for index, row in db.iterrows():
         student_id = row['student_id']
         image_path_rel = row['image_path']
@@ -73,7 +44,7 @@ def generate_known_embeddings(config):
 
         if not image_path_rel or pd.isna(image_path_rel):
             print(f"  [Skip] No image path for student {student_id} ({name}).")
-            error_count += 1
+            counts['errors'] += 1
             continue
 
         abs_path = image_path_rel if os.path.isabs(image_path_rel) else os.path.join(csv_dir, image_path_rel)
@@ -81,14 +52,14 @@ def generate_known_embeddings(config):
 
         if not os.path.exists(abs_path):
             print(f"  [Error] Image file not found for student {student_id} ({name}): {abs_path}")
-            error_count += 1
+            counts['errors'] += 1
             continue
 
         try:
             img = cv2.imread(abs_path)
             if img is None:
                 print(f"  [Error] Failed to read image for student {student_id} ({name}): {abs_path}")
-                error_count += 1
+                counts['errors'] += 1
                 continue
 
             # Use insightface to get faces (includes detection and embedding)
@@ -97,12 +68,12 @@ def generate_known_embeddings(config):
 
             if len(faces) == 0:
                 print(f"  [Warn] No face detected for student {student_id} ({name}) in image: {abs_path}")
-                no_face_count += 1
+                counts['no_face'] += 1
                 continue # Skip if no face found
 
             if len(faces) > 1:
                 print(f"  [Warn] Multiple faces ({len(faces)}) detected for student {student_id} ({name}) in image: {abs_path}. Using the largest face.")
-                multiple_faces_count += 1
+                counts['multiple_faces'] += 1
                 # Select the face with the largest bounding box area
                 faces.sort(key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]), reverse=True)
 
@@ -111,20 +82,67 @@ def generate_known_embeddings(config):
 
             # Store the embedding (ensure it's a numpy array)
             known_embeddings[student_id] = np.array(embedding)
-            processed_count += 1
+            counts['processed'] += 1
             # print(f"  [OK] Processed embedding for student {student_id} ({name}).")
 
         except Exception as e:
             print(f"  [Error] Exception processing image for student {student_id} ({name}) at {abs_path}: {e}")
-            error_count += 1
+            counts['errors'] += 1
+
+    return known_embeddings, counts
+
 
+def print_embedding_summary(counts):
     print("\n--- Embedding Generation Summary ---")
-    print(f"Successfully processed: {processed_count}")
-    print(f"Images not found/unreadable/no path: {error_count}")
-    print(f"Images with no face detected: {no_face_count}")
-    print(f"Images with multiple faces: {multiple_faces_count}")
+    print(f"Successfully processed: {counts['processed']}")
+    print(f"Images not found/unreadable/no path: {counts['errors']}")
+    print(f"Images with no face detected: {counts['no_face']}")
+    print(f"Images with multiple faces: {counts['multiple_faces']}")
+
+
+def generate_known_embeddings(config):
+    """
+    Processes student images from the database CSV, extracts ArcFace embeddings,
+    and saves them to the specified file.
+    """
+    db_csv_path = config.get('csv_file', 'students_db.csv') # Direct key access with default
+    embeddings_output_file = config.get('embeddings_file', 'known_embeddings.npy') # Direct key access with default
+    arcface_model_name = config.get('model_name', 'buffalo_l')
+
+    print("--- Generating Known Embeddings ---")
+    try:
+        face_app = load_face_app(config)
+    except Exception as e:
+        print(f"FATAL: Failed to load InsightFace model '{arcface_model_name}'. Error: {e}")
+        print("Ensure 'insightface' and 'onnxruntime' are installed.")
+        print("If using GPU, check CUDA/cuDNN setup and provider setting in config.ini.")
+        sys.exit(1)
+
+    # Load the student database CSV
+    if not os.path.exists(db_csv_path):
+        print(f"ERROR: Database CSV file not found at '{db_csv_path}'")
+        sys.exit(1)
+
+    try:
+        db = pd.read_csv(db_csv_path)
+        required_cols = ["student_id", "name", "image_path"]
+        if not all(col in db.columns for col in required_cols):
+             print(f"ERROR: DB CSV '{db_csv_path}' must have columns: {', '.join(required_cols)}")
+             sys.exit(1)
+        db['student_id'] = db['student_id'].astype(str).str.strip()
+        db['image_path'] = db['image_path'].astype(str).str.strip()
+        print(f"Loaded {len(db)} student records from '{db_csv_path}'.")
+    except Exception as e:
+        print(f"ERROR: Failed to load or parse database CSV '{db_csv_path}': {e}")
+        sys.exit(1)
+
+    csv_dir = os.path.dirname(os.path.abspath(db_csv_path))
+
+    print("Processing student images...")
+    known_embeddings, counts = embed_student_images(face_app, db, csv_dir)
+    print_embedding_summary(counts)
 
-    if processed_count == 0:
+    if counts['processed'] == 0:
         print("\nERROR: No embeddings were generated. Cannot save file. Check image paths and face detection.")
     else:
         try:
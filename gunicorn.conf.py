@@ -0,0 +1,36 @@
+# gunicorn.conf.py
+# Usage: gunicorn -c gunicorn.conf.py wsgi:application
+# Settings can be overridden with the SMART_ID_* environment variables below.
+import configparser
+import multiprocessing
+import os
+
+bind = os.environ.get('SMART_ID_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('SMART_ID_WORKERS', max(1, multiprocessing.cpu_count() // 4)))
+
+
+def stream_threads(config_file):
+    # [SESSIONS] max_streams: event streams a worker keeps open, one thread each
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    return config.getint('SESSIONS', 'max_streams', fallback=8)
+
+
+# SMART_ID_THREADS request threads for /process and friends, plus one per
+# allowed event stream so open dashboards and viewers cannot starve them
+threads = int(os.environ.get('SMART_ID_THREADS', 2)) + stream_threads(os.environ.get('SMART_ID_CONFIG', 'config.ini'))
+worker_class = 'gthread'
+timeout = 120
+
+# Load config, models and the embedding matrix once in the master process.
+# Forked workers then share the weights and gallery pages copy-on-write.
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Re-apply the [THREADS] budget in the child; thread pools created in the
+    # master (during the warm-up inference) do not survive fork().
+    import app
+    from thread_budget import apply_thread_budget
+    if app.CONFIG is not None:
+        apply_thread_budget(app.CONFIG)
@@ -1,6 +1,8 @@
 # image_processor.py
 import os
+import time
 import datetime
+import logging
 import cv2
 import numpy as np
 from scipy.spatial.distance import cosine # <-- For cosine distance/similarity
@@ -8,9 +10,15 @@ from scipy.spatial.distance import cosine # <-- For cosine distance/similarity
 #print("[DEBUG image_processor.py] 'os' module imported successfully.")
 
 # Import helpers and constants from utils
-from utils import (draw_text_with_background,
+from utils import (draw_text_with_background, draw_overlays, BoxLabel, resize_to_max_width, scale_box,
                    COLOR_PERSON_WITH_ID, COLOR_RECOGNIZED_NO_ID,
-                   COLOR_UNKNOWN_NO_ID, COLOR_ID_CARD, COLOR_TEXT)
+                   COLOR_UNKNOWN_NO_ID, COLOR_ID_CARD, COLOR_ROI_ZONE)
+from pose_face import landmarks_from_keypoints, embed_face_from_landmarks, face_path_stats
+from metrics import timed, observe_stage, FRAMES, PERSONS, FACES, FINES
+from log_setup import log_sampled
+from frame_pool import copy_frame
+
+logger = logging.getLogger(__name__)
 
 def calculate_cosine_similarity(embedding1, embedding2):
     """Calculates cosine similarity between two embeddings."""
@@ -27,24 +35,350 @@ def calculate_cosine_similarity(embedding1, embedding2):
         similarity = 1 - cosine(emb1, emb2)
         return similarity
     except Exception as e:
-        print(f"Error calculating cosine similarity: {e}")
+        log_sampled(logger, logging.WARNING, 'cosine_similarity', "Error calculating cosine similarity: %s", e)
         return 0.0
 
 
-def process_frame_logic(frame, person_model, id_card_model, face_app, db_manager, fined_log_manager,config): # <-- Added face_app
+def match_embedding(detected_embedding, known_embeddings_map, gallery_ids=None, gallery_matrix=None):
+    """
+    Finds the most similar known student. Uses one matrix-vector product when the
+    L2-normalized gallery matrix is available, otherwise compares one by one.
+    Returns (best_match_id or None, max_similarity).
+    """
+    if gallery_matrix is not None and len(gallery_ids) > 0:
+        emb = np.asarray(detected_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(emb)
+        if norm == 0 or emb.shape[0] != gallery_matrix.shape[1]:
+            return None, 0.0
+        similarities = gallery_matrix @ (emb / norm)
+        best_idx = int(np.argmax(similarities))
+        max_similarity = float(similarities[best_idx])
+        if max_similarity <= 0.0:
+            return None, 0.0
+        return gallery_ids[best_idx], max_similarity
+
+    best_match_id = None
+    max_similarity = 0.0
+    for known_id, known_embedding in known_embeddings_map.items():
+        sim = calculate_cosine_similarity(detected_embedding, known_embedding)
+        if sim > max_similarity:
+            max_similarity = sim
+            best_match_id = known_id
+    return best_match_id, max_similarity
+
+
+def assign_id_cards(id_card_result, person_xyxy, scale=1.0, offset=(0, 0)):
+    """
+    Assigns the cards of one full-frame ID card result to the persons whose
+    box contains the card center. Card boxes are divided by 'scale' and moved
+    by 'offset' (ROI crop origin) to map them back to original coordinates
+    (person_xyxy is always original).
+    Returns (person_has_id list, id card boxes in original frame coordinates).
+    """
+    id_boxes = id_card_result.boxes if id_card_result is not None and id_card_result.boxes is not None else []
+    ox, oy = offset
+    id_card_boxes = [(int(bx1 / scale) + ox, int(by1 / scale) + oy, int(bx2 / scale) + ox, int(by2 / scale) + oy)
+                     for bx1, by1, bx2, by2 in (id_box.xyxy[0].tolist() for id_box in id_boxes)]
+    id_card_centers = [((ix1 + ix2) / 2, (iy1 + iy2) / 2) for ix1, iy1, ix2, iy2 in id_card_boxes]
+
+    # Check if an ID card center falls within each person's bounding box
+    person_has_id = [any(x1 < icx < x2 and y1 < icy < y2 for icx, icy in id_card_centers)
+                     for x1, y1, x2, y2 in person_xyxy]
+    return person_has_id, id_card_boxes
+
+
+def detect_id_cards_full_frame(frame, person_xyxy, id_card_model, conf, imgsz=None, scale=1.0):
+    """
+    Runs the ID card model on the whole frame and assigns each card to the
+    persons whose box contains the card center. If 'frame' is a downscaled
+    copy, 'scale' is its size relative to the original and the card boxes are
+    mapped back to original coordinates (person_xyxy is always original).
+    Returns (person_has_id list, id card boxes in original frame coordinates).
+    """
+    kwargs = {'imgsz': imgsz} if imgsz else {}
+    id_card_results = id_card_model(frame, stream=False, conf=conf, verbose=False, **kwargs)
+    id_card_result = id_card_results[0] if id_card_results and len(id_card_results) > 0 else None
+    return assign_id_cards(id_card_result, person_xyxy, scale)
+
+
+def torso_crop_box(person_box, frame_shape, top_frac=0.1, bottom_frac=0.8):
+    """Returns the clamped (x1, y1, x2, y2) torso region of a person box, or None if empty."""
+    x1, y1, x2, y2 = person_box
+    h, w = frame_shape[:2]
+    person_h = y2 - y1
+    cy1 = max(0, int(y1 + person_h * top_frac))
+    cy2 = min(h, int(y1 + person_h * bottom_frac))
+    cx1, cx2 = max(0, x1), min(w, x2)
+    if cy1 >= cy2 or cx1 >= cx2:
+        return None
+    return cx1, cy1, cx2, cy2
+
+
+def torso_crops(frame, person_xyxy, top_frac=0.1, bottom_frac=0.8):
+    """Returns ([(person index, crop x offset, crop y offset)], [torso crop images]) for a frame."""
+    crop_boxes = []
+    crops = []
+    for idx, person_box in enumerate(person_xyxy):
+        crop_box = torso_crop_box(person_box, frame.shape, top_frac, bottom_frac)
+        if crop_box is None:
+            continue
+        cx1, cy1, cx2, cy2 = crop_box
+        crop_boxes.append((idx, cx1, cy1))
+        crops.append(frame[cy1:cy2, cx1:cx2])
+    return crop_boxes, crops
+
+
+def assign_crop_results(crop_boxes, crop_results, num_persons):
+    """Maps per-crop ID card results back to (person_has_id list, id card boxes in frame coordinates)."""
+    person_has_id = [False] * num_persons
+    id_card_boxes = []
+    for (idx, ox, oy), result in zip(crop_boxes, crop_results):
+        if result.boxes is None or len(result.boxes) == 0:
+            continue
+        person_has_id[idx] = True
+        for id_box in result.boxes:
+            ix1, iy1, ix2, iy2 = map(int, id_box.xyxy[0])
+            id_card_boxes.append((ix1 + ox, iy1 + oy, ix2 + ox, iy2 + oy))
+    return person_has_id, id_card_boxes
+
+
+def detect_id_cards_on_person_crops(frame, person_xyxy, id_card_model, conf, imgsz=320,
+                                    top_frac=0.1, bottom_frac=0.8):
+    """
+    Crops the torso region of every person and runs the ID card model on all
+    crops as one batch at a small input size. A card found in a crop belongs
+    to that person, so no geometric association is needed.
+    Returns (person_has_id list, id card boxes in frame coordinates).
+    """
+    crop_boxes, crops = torso_crops(frame, person_xyxy, top_frac, bottom_frac)
+    if not crops:
+        return [False] * len(person_xyxy), []
+
+    # A list input makes ultralytics run the crops as a single batch
+    crop_results = id_card_model(crops, stream=False, conf=conf, imgsz=imgsz, verbose=False)
+    return assign_crop_results(crop_boxes, crop_results, len(person_xyxy))
+
+
+def detect_frames(frames, person_model, id_card_model, config, roi_zones=None):
+    """
+    Detection stage of process_frame_logic for one or more frames: persons
+    (plus pose keypoints) and ID cards. Each model runs once over the whole
+    list, so frames from concurrent requests share a batch (see
+    batch_scheduler.py). 'roi_zones' optionally gives a RoiZone (or None) per
+    frame: detection then only sees the zone's bounding rectangle and persons
+    standing outside the polygon are dropped before the ID/face stages.
+    Returns one detections dict per frame, to be passed to
+    process_frame_logic(..., detections=...). Boxes and keypoints are in
+    original frame coordinates.
+    """
+    person_conf = config.get('person_conf_threshold', 0.6)
+    id_card_conf = config.get('id_card_conf_threshold', 0.5)
+    use_pose_keypoints = config.get('use_pose_model', False)
+    id_detection_mode = config.get('id_detection_mode', 'full_frame')
+    id_crop_imgsz = config.get('id_crop_imgsz', 320)
+    id_crop_top = config.get('id_crop_top', 0.1)
+    id_crop_bottom = config.get('id_crop_bottom', 0.8)
+    person_imgsz = config.get('person_imgsz', 0) or None # None = model default
+    id_imgsz = config.get('id_imgsz', 0) or None
+    inference_max_width = config.get('inference_max_width', 0) # 0 = full resolution
+
+    # --- Crop to the ROI and downscale once for inference ---
+    detections = []
+    for frame, roi_zone in zip(frames, roi_zones or [None] * len(frames)):
+        roi_rect = roi_zone.bounding_rect(frame.shape) if roi_zone is not None else None
+        if roi_rect is not None and roi_rect[0] < roi_rect[2] and roi_rect[1] < roi_rect[3]:
+            rx1, ry1, rx2, ry2 = roi_rect
+            source = frame[ry1:ry2, rx1:rx2] # View, no copy
+        else:
+            roi_rect, source = None, frame
+        inference_frame, inference_scale = resize_to_max_width(source, inference_max_width)
+        detections.append({
+            "inference_frame": inference_frame, # Of the ROI crop when roi_rect is set
+            "inference_scale": inference_scale,
+            "roi_zone": roi_zone,
+            "roi_rect": roi_rect,
+            "roi_offset": (roi_rect[0], roi_rect[1]) if roi_rect else (0, 0),
+            "person_xyxy": [],
+            "person_keypoints": None,
+            "person_error": False,
+            "person_has_id": [],
+            "id_card_boxes": [],
+        })
+    if not detections:
+        return detections
+    inference_frames = [det["inference_frame"] for det in detections]
+
+    # --- Person Detection (YOLO), one batch ---
+    try:
+        person_kwargs = {'imgsz': person_imgsz} if person_imgsz else {}
+        with timed('person_yolo'):
+            person_results = person_model(inference_frames, stream=False, classes=[0], conf=person_conf, verbose=False, **person_kwargs)
+        for frame, det, result in zip(frames, detections, person_results):
+            person_boxes = result.boxes if result.boxes is not None else []
+            scale = det["inference_scale"]
+            ox, oy = det["roi_offset"]
+            # Plain integer boxes in frame coordinates, in the same order as the keypoints
+            person_xyxy = [(int(bx1 / scale) + ox, int(by1 / scale) + oy, int(bx2 / scale) + ox, int(by2 / scale) + oy)
+                           for bx1, by1, bx2, by2 in (person_box.xyxy[0].tolist() for person_box in person_boxes)]
+            person_keypoints = None
+            # Pose models return keypoints for each person box in the same pass
+            if use_pose_keypoints and len(person_boxes) > 0 and getattr(result, 'keypoints', None) is not None:
+                person_keypoints = result.keypoints.data.cpu().numpy() # (N, 17, 3): x, y, conf
+                person_keypoints[..., :2] /= scale
+                person_keypoints[..., 0] += ox
+                person_keypoints[..., 1] += oy
+            # Drop persons standing outside the enforcement zone before any ID/face work
+            if det["roi_zone"] is not None and person_xyxy:
+                keep = [i for i, box in enumerate(person_xyxy) if det["roi_zone"].contains_person(box, frame.shape)]
+                person_xyxy = [person_xyxy[i] for i in keep]
+                if person_keypoints is not None:
+                    person_keypoints = person_keypoints[keep]
+            det["person_xyxy"] = person_xyxy
+            det["person_keypoints"] = person_keypoints
+    except Exception as e:
+        log_sampled(logger, logging.ERROR, 'person_detection', "Error during person detection: %s", e, exc_info=True)
+        for det in detections:
+            det["person_xyxy"], det["person_keypoints"], det["person_error"] = [], None, True
+
+    # --- ID Card Detection (YOLO), one batch ---
+    try:
+        if id_detection_mode == 'person_crops':
+            # Torso crops of every person in every frame; association is implicit
+            per_frame_crops = [torso_crops(frame, det["person_xyxy"], id_crop_top, id_crop_bottom)
+                               for frame, det in zip(frames, detections)]
+            all_crops = [crop for _, crops in per_frame_crops for crop in crops]
+            crop_results = []
+            if all_crops:
+                with timed('id_yolo'):
+                    crop_results = id_card_model(all_crops, stream=False, conf=id_card_conf, imgsz=id_crop_imgsz, verbose=False)
+            offset = 0
+            for det, (crop_boxes, crops) in zip(detections, per_frame_crops):
+                det["person_has_id"], det["id_card_boxes"] = assign_crop_results(
+                    crop_boxes, crop_results[offset:offset + len(crops)], len(det["person_xyxy"]))
+                offset += len(crops)
+        else:
+            id_kwargs = {'imgsz': id_imgsz} if id_imgsz else {}
+            with timed('id_yolo'):
+                id_card_results = id_card_model(inference_frames, stream=False, conf=id_card_conf, verbose=False, **id_kwargs)
+            for det, result in zip(detections, id_card_results):
+                det["person_has_id"], det["id_card_boxes"] = assign_id_cards(result, det["person_xyxy"], det["inference_scale"],
+                                                                             det["roi_offset"])
+    except Exception as e:
+        log_sampled(logger, logging.WARNING, 'id_card_detection', "ID card detection failed: %s", e, exc_info=True)
+        for det in detections:
+            det["person_has_id"], det["id_card_boxes"] = [False] * len(det["person_xyxy"]), []
+
+    return detections
+
+
+def apply_fine_and_capture(person_roi, matched_student_id, matched_student_name,
+                           db_manager, fined_log_manager, fined_images_dir):
+    """
+    Applies the fine for a recognized student and, if it is a new fine,
+    saves the person ROI as evidence and logs the event.
+    Returns True if a new fine was applied.
+    """
+    # Apply fine using DatabaseManager
+    with timed('apply_fine'):
+        fine_applied = db_manager.apply_fine(matched_student_id, matched_student_name)
+    if fine_applied:
+        FINES.inc()
+
+    # --- >> CAPTURE IMAGE & LOG FINE (if fine was applied) << ---
+    if fine_applied and fined_log_manager: # Check if fine was new and logger exists
+        #print(f"  [DEBUG] Entered image capture/log block for {matched_student_id}")
+        now = datetime.datetime.now()
+        timestamp_str = now.strftime('%Y%m%d_%H%M%S')
+        image_filename = f"{matched_student_id}_{timestamp_str}.jpg"
+        save_path = os.path.join(fined_images_dir, image_filename)
+        #print(f"  [DEBUG] Attempting to save image to: {save_path}")
+
+        try:
+            # Ensure directory exists
+            os.makedirs(fined_images_dir, exist_ok=True)
+            #print(f"  [DEBUG] ROI shape: {person_roi.shape}, path: {save_path}")
+            # Save the ROI image
+            success = cv2.imwrite(save_path, person_roi)
+            if success:
+                logger.info("Saved evidence image: %s", save_path,
+                            extra={"event": "capture", "student_id": matched_student_id, "image": image_filename})
+                #print(f"  [DEBUG] Calling log_fine with: id={matched_student_id}, name={matched_student_name}, ts={now}, img={image_filename}")
+                # Log the fine details including the relative filename
+                fined_log_manager.log_fine(
+                    student_id=matched_student_id,
+                    name=matched_student_name,
+                    timestamp=now, # Pass datetime object
+                    image_filename=image_filename # Just the filename
+                )
+            else:
+                 logger.error("Failed to save evidence image: %s", save_path)
+                 # Log anyway, but maybe with empty filename?
+                 fined_log_manager.log_fine(matched_student_id, matched_student_name, now, "SAVE_FAILED")
+
+        except Exception as capture_e:
+            logger.exception("Exception saving evidence image or logging fine: %s", capture_e)
+            # Log anyway?
+            fined_log_manager.log_fine(matched_student_id, matched_student_name, now, "CAPTURE_ERROR")
+    # --- >> END CAPTURE & LOG << ---
+
+    #elif not fine_applied:
+        #print(f"  [DEBUG] Image/Log skipped: Fine was not applied this time (already fined today?).")
+    #elif not fined_log_manager:
+         #print(f"  [DEBUG] Image/Log skipped: fined_log_manager is None.")
+
+    return fine_applied
+
+
+def apply_detected_fines(frame, detected_info, db_manager, fined_log_manager, config, evidence=None):
+    """
+    Applies fines for the 'recognized_no_id' entries of a detected_info list.
+    Used when recognition ran elsewhere (e.g. in an inference worker process)
+    with apply_fines=False, so that fining and logging stay in this process.
+    Crops come from 'evidence' (see process_frame_logic) when given, else from 'frame'.
+    """
+    fined_images_dir = config.get('fined_images_dir', 'fined_student_images')
+    for info in detected_info:
+        if info.get("status") != "recognized_no_id" or not info.get("student_id"):
+            continue
+        x1, y1, x2, y2 = info["bbox"]
+        person_roi = evidence.get(info["student_id"]) if evidence else None
+        if person_roi is None:
+            person_roi = frame[y1:y2, x1:x2]
+        apply_fine_and_capture(person_roi, info["student_id"], info["name"],
+                               db_manager, fined_log_manager, fined_images_dir)
+
+
+def process_frame_logic(frame, person_model, id_card_model, face_app, db_manager, fined_log_manager,config,
+                        apply_fines=True, detections=None, roi_zone=None, annotate_in_place=False,
+                        evidence=None): # <-- Added face_app
     """
     Processes frame: detects persons (YOLO), detects IDs (YOLO),
     detects faces and extracts embeddings within person ROIs (InsightFace),
     compares embeddings, applies fines, draws results.
+    With apply_fines=False recognized students are only reported in detected_info;
+    the caller is then responsible for apply_detected_fines().
+    'detections' is this frame's entry from detect_frames() when the detection
+    stage already ran in a batch; otherwise it is run here for this frame alone,
+    restricted to 'roi_zone' (RoiZone of the camera) if given.
+    With annotate_in_place=True the caller hands over 'frame' (e.g. a freshly
+    decoded upload): results are drawn on it, or on the inference frame when
+    that is reused, instead of a copy. Drawing happens after all face work, so
+    crops taken during this call are unaffected. Fines deferred with
+    apply_fines=False would then crop annotated pixels from 'frame': pass a
+    dict as 'evidence' to receive a copy of each recognized person's crop
+    (student_id -> array) for apply_detected_fines().
     """
     
-    person_conf = config.get('person_conf_threshold', 0.6) # Use direct key + default
-    id_card_conf = config.get('id_card_conf_threshold', 0.5) # Use direct key + default
     arcface_thresh = config.get('similarity_threshold', 0.5) # Use direct key + default
     fined_images_dir = config.get('fined_images_dir', 'fined_student_images') # <-- Get image save directory
+    use_pose_keypoints = config.get('use_pose_model', False)
+    keypoint_conf = config.get('keypoint_conf_threshold', 0.5)
+    min_eye_distance = config.get('min_keypoint_eye_distance', 10.0)
+    inference_max_width = config.get('inference_max_width', 0) # 0 = full resolution
+    annotate_max_width = config.get('annotate_max_width', 0)
     
     if frame is None:
-        print("Error: process_frame_logic received None frame.")
+        logger.error("process_frame_logic received None frame.")
         error_frame = np.zeros((480, 640, 3), dtype=np.uint8)
         cv2.putText(error_frame, "Input Error", (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,0,255), 2)
         return error_frame, [{"error": "Input frame was None"}]
@@ -56,48 +390,47 @@ def process_frame_logic(frame, person_model, id_card_model, face_app, db_manager
                                   fontScale=0.7, color=(255,255,255), bg_color=(200,0,0), alpha=0.8)
         return error_frame, [{"error": "Detection models or FaceAnalysis app not loaded"}]
 
-    processed_frame = frame.copy()
+    # --- Detection stage (persons, keypoints, ID cards) ---
+    if detections is None:
+        detections = detect_frames([frame], person_model, id_card_model, config, roi_zones=[roi_zone])[0]
+    inference_frame, inference_scale = detections["inference_frame"], detections["inference_scale"]
+    person_xyxy = detections["person_xyxy"]
+    person_keypoints = detections["person_keypoints"] if use_pose_keypoints else None
+    person_has_id, id_card_boxes = detections["person_has_id"], detections["id_card_boxes"]
+
+    # --- Annotation canvas ---
+    # Detections are in 'frame' coordinates; face work always uses the full-size frame.
+    if (annotate_max_width and annotate_max_width == inference_max_width and inference_frame is not frame
+            and detections["roi_rect"] is None):
+        # Reuse the resize; the inference frame is not needed once detection is done
+        processed_frame = inference_frame if annotate_in_place else copy_frame(inference_frame)
+        annotate_scale = inference_scale
+    else:
+        processed_frame, annotate_scale = resize_to_max_width(frame, annotate_max_width)
+        if processed_frame is frame and not annotate_in_place:
+            processed_frame = copy_frame(frame)
     detected_info = []
 
     # Get current known face data from the database manager
     known_names_map, known_embeddings_map = db_manager.get_recognition_data()
     recognition_possible = db_manager.is_loaded and bool(known_embeddings_map) # Check if embeddings were loaded
+    gallery_ids, gallery_matrix = db_manager.get_embedding_matrix() if hasattr(db_manager, 'get_embedding_matrix') else ([], None)
 
-    if not recognition_possible:
-         draw_text_with_background(processed_frame, "WARN: Embeddings N/A", (10, 60),
-                                   fontScale=0.7, color=(0,0,0), bg_color=(255,200,0), alpha=0.8)
+    # Recognition model used directly by the keypoint fast path
+    rec_model = face_app.models.get('recognition') if person_keypoints is not None else None
 
-    # --- Person Detection (YOLO) ---
-    try:
-        person_results = person_model(processed_frame, stream=False, classes=[0], conf=person_conf, verbose=False)
-        person_boxes = person_results[0].boxes if person_results and len(person_results) > 0 and person_results[0].boxes is not None else []
-    except Exception as e:
-        print(f"Error during person detection: {e}")
-        draw_text_with_background(processed_frame, "Person Detection Error", (10, 90),
-                                  fontScale=0.6, color=(255,255,255), bg_color=(200,0,0), alpha=0.7)
-        person_boxes = []
-
-    # --- ID Card Detection (YOLO) ---
-    id_card_centers = []
-    try:
-        # ... (Keep existing ID card detection logic) ...
-        id_card_results = id_card_model(processed_frame, stream=False, conf=id_card_conf, verbose=False)
-        id_card_boxes = id_card_results[0].boxes if id_card_results and len(id_card_results) > 0 and id_card_results[0].boxes is not None else []
-        for id_box in id_card_boxes:
-            ix1, iy1, ix2, iy2 = map(int, id_box.xyxy[0])
-            cv2.rectangle(processed_frame, (ix1, iy1), (ix2, iy2), COLOR_ID_CARD, 2)
-            id_card_centers.append(((ix1 + ix2) / 2, (iy1 + iy2) / 2))
-            draw_text_with_background(processed_frame, "ID", (ix1, iy1 - 5),
-                                      fontScale=0.4, color=COLOR_TEXT, bg_color=COLOR_ID_CARD[:3], alpha=0.7)
-    except Exception as e:
-        print(f"Warning: ID card detection failed: {e}")
+    FRAMES.inc()
+    PERSONS.inc(len(person_xyxy))
+    # Boxes and labels are collected here and drawn in one pass at the end (ID cards first, as before)
+    overlays = []
+    for id_box in id_card_boxes:
+        ix1, iy1, ix2, iy2 = scale_box(id_box, annotate_scale)
+        overlays.append(BoxLabel((ix1, iy1, ix2, iy2), COLOR_ID_CARD, "ID", (ix1, iy1 - 5), 0.4, 0.7))
 
     # --- Process Each Detected Person ---
-    for person_box in person_boxes:
-        x1, y1, x2, y2 = map(int, person_box.xyxy[0])
-
+    for person_idx, (x1, y1, x2, y2) in enumerate(person_xyxy):
         # Clamp Coordinates & Basic Check
-        h, w = processed_frame.shape[:2]
+        h, w = frame.shape[:2]
         y1, y2 = max(0, y1), min(h, y2)
         x1, x2 = max(0, x1), min(w, x2)
         if y1 >= y2 or x1 >= x2 or (y2 - y1) < 30 or (x2 - x1) < 20: # Adjust minimum size if needed
@@ -110,9 +443,9 @@ def process_frame_logic(frame, person_model, id_card_model, face_app, db_manager
         matched_student_id = None
         matched_student_name = "Unknown"
         face_detected_in_roi = False # Flag
+        face_path = None # 'keypoints' (pose fast path) or 'scrfd'
 
-        # Check if an ID card center falls within this person's bounding box
-        id_found_for_person = any(x1 < icx < x2 and y1 < icy < y2 for icx, icy in id_card_centers)
+        id_found_for_person = person_has_id[person_idx]
 
         if id_found_for_person:
             person_status = "id_detected"
@@ -121,31 +454,49 @@ def process_frame_logic(frame, person_model, id_card_model, face_app, db_manager
             # Optionally: Could still try face detection/rec here if desired
         else:
             # No ID found, attempt face detection and recognition within the person ROI
-            person_roi = processed_frame[y1:y2, x1:x2]
+            person_roi = frame[y1:y2, x1:x2]
 
             if person_roi.shape[0] > 0 and person_roi.shape[1] > 0 and recognition_possible:
                 try:
-                    # Use insightface app.get() on the person ROI
-                    faces = face_app.get(person_roi) # Detect faces and get embeddings
-
-                    if len(faces) > 0:
+                    detected_embedding = None
+
+                    # --- Fast path: align from pose keypoints, skipping the SCRFD detector ---
+                    if person_keypoints is not None and rec_model is not None:
+                        landmarks = landmarks_from_keypoints(person_keypoints[person_idx],
+                                                             conf_threshold=keypoint_conf,
+                                                             min_eye_distance=min_eye_distance)
+                        if landmarks is not None:
+                            kps5, _ = landmarks
+                            with timed('face_keypoint_embed'):
+                                detected_embedding = embed_face_from_landmarks(frame, kps5, rec_model)
+                        if detected_embedding is not None:
+                            face_path = 'keypoints'
+                            face_path_stats.record('keypoints')
+                        else:
+                            face_path_stats.record('scrfd_fallback')
+                    else:
+                        face_path_stats.record('scrfd')
+
+                    if detected_embedding is None:
+                        # Use insightface app.get() on the person ROI
+                        with timed('face_app_get'):
+                            faces = face_app.get(person_roi) # Detect faces and get embeddings
+                        if len(faces) > 0:
+                            # If multiple faces, optionally pick the largest/most central
+                            if len(faces) > 1:
+                                # print(f"Debug: Multiple faces ({len(faces)}) in ROI, using largest.")
+                                faces.sort(key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]), reverse=True)
+                            detected_embedding = faces[0].normed_embedding
+                            face_path = 'scrfd'
+
+                    if detected_embedding is not None:
                         face_detected_in_roi = True
-                        # If multiple faces, optionally pick the largest/most central
-                        if len(faces) > 1:
-                            # print(f"Debug: Multiple faces ({len(faces)}) in ROI, using largest.")
-                            faces.sort(key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]), reverse=True)
-
-                        detected_embedding = faces[0].normed_embedding
+                        FACES.inc(label_value=face_path)
 
                         # --- Compare with known embeddings ---
-                        best_match_id = None
-                        max_similarity = 0.0
-
-                        for known_id, known_embedding in known_embeddings_map.items():
-                            sim = calculate_cosine_similarity(detected_embedding, known_embedding)
-                            if sim > max_similarity:
-                                max_similarity = sim
-                                best_match_id = known_id
+                        with timed('gallery_match'):
+                            best_match_id, max_similarity = match_embedding(
+                                detected_embedding, known_embeddings_map, gallery_ids, gallery_matrix)
 
                         similarity_score = max_similarity
 
@@ -157,53 +508,12 @@ def process_frame_logic(frame, person_model, id_card_model, face_app, db_manager
                             matched_student_name = known_names_map.get(matched_student_id, "Name Error") # Get name from map
                             display_name = f"Fine: {matched_student_name} ({max_similarity:.2f})"
 
-                            # Apply fine using DatabaseManager
-                            fine_applied = db_manager.apply_fine(matched_student_id, matched_student_name)
-                            
-                            # --- >> CAPTURE IMAGE & LOG FINE (if fine was applied) << ---
-                            if fine_applied and fined_log_manager: # Check if fine was new and logger exists
-                                #print(f"  [DEBUG] Entered image capture/log block for {matched_student_id}")
-                                now = datetime.datetime.now()
-                                timestamp_str = now.strftime('%Y%m%d_%H%M%S')
-                                image_filename = f"{matched_student_id}_{timestamp_str}.jpg"
-                                save_path = os.path.join(fined_images_dir, image_filename)
-                                #print(f"  [DEBUG] Attempting to save image to: {save_path}")
-
-                                try:
-                                    abs_fined_images_dir = os.path.abspath(fined_images_dir)
-                                    print(f"  [DEBUG] Absolute image directory: {abs_fined_images_dir}")
-                                    # Ensure directory exists
-                                    os.makedirs(fined_images_dir, exist_ok=True)
-                                    #print(f"  [DEBUG] ROI shape: {person_roi.shape}, path: {save_path}")
-                                    # Save the ROI image
-                                    success = cv2.imwrite(save_path, person_roi)
-                                    if success:
-                                        print(f"  [Capture] Saved image: {save_path}")
-                                        #print(f"  [DEBUG] Calling log_fine with: id={matched_student_id}, name={matched_student_name}, ts={now}, img={image_filename}")
-                                        # Log the fine details including the relative filename
-                                        fined_log_manager.log_fine(
-                                            student_id=matched_student_id,
-                                            name=matched_student_name,
-                                            timestamp=now, # Pass datetime object
-                                            image_filename=image_filename # Just the filename
-                                        )
-                                    else:
-                                         print(f"  [Capture FAIL] Failed to save image: {save_path}")
-                                         # Log anyway, but maybe with empty filename?
-                                         fined_log_manager.log_fine(matched_student_id, matched_student_name, now, "SAVE_FAILED")
-
-                                except Exception as capture_e:
-                                    print(f"  [Capture ERROR] Exception saving image or logging fine: {capture_e}")
-                                    import traceback
-                                    traceback.print_exc()
-                                    # Log anyway?
-                                    fined_log_manager.log_fine(matched_student_id, matched_student_name, now, "CAPTURE_ERROR")
-                            # --- >> END CAPTURE & LOG << ---
-
-                            #elif not fine_applied:
-                                #print(f"  [DEBUG] Image/Log skipped: Fine was not applied this time (already fined today?).")
-                            #elif not fined_log_manager:
-                                 #print(f"  [DEBUG] Image/Log skipped: fined_log_manager is None.")
+                            if apply_fines:
+                                apply_fine_and_capture(person_roi, matched_student_id, matched_student_name,
+                                                       db_manager, fined_log_manager, fined_images_dir)
+                            elif evidence is not None:
+                                # Outlives this call (and the annotation drawn on 'frame')
+                                evidence[matched_student_id] = person_roi.copy()
 
                         else:
                             # Face detected, but not recognized (below threshold)
@@ -217,7 +527,7 @@ def process_frame_logic(frame, person_model, id_card_model, face_app, db_manager
                         display_name = "Unknown (No Face)"
 
                 except Exception as face_e:
-                    print(f"Error during face detection/embedding in ROI: {face_e}")
+                    log_sampled(logger, logging.WARNING, 'face_embedding', "Error during face detection/embedding in ROI: %s", face_e)
                     person_status = "error"
                     display_name = "Face Detection Error"
             elif not recognition_possible:
@@ -228,12 +538,10 @@ def process_frame_logic(frame, person_model, id_card_model, face_app, db_manager
             # Else: ROI was invalid (should be caught earlier)
 
 
-        # --- Draw Bounding Box and Label ---
-        cv2.rectangle(processed_frame, (x1, y1), (x2, y2), box_color, 2)
-        label_y = y1 - 7 if y1 > 20 else y2 + 15
-        draw_text_with_background(processed_frame, display_name, (x1 + 2, label_y),
-                                  fontScale=0.45, color=COLOR_TEXT, thickness=1,
-                                  bg_color=box_color[:3], alpha=0.75)
+        # --- Queue Bounding Box and Label ---
+        ax1, ay1, ax2, ay2 = scale_box((x1, y1, x2, y2), annotate_scale)
+        label_y = ay1 - 7 if ay1 > 20 else ay2 + 15
+        overlays.append(BoxLabel((ax1, ay1, ax2, ay2), box_color, display_name, (ax1 + 2, label_y), 0.45, 0.75))
 
         # --- Store Detection Info ---
         detected_info.append({
@@ -242,7 +550,26 @@ def process_frame_logic(frame, person_model, id_card_model, face_app, db_manager
             "name": matched_student_name,
             # Show similarity only if a face was detected and compared
             "similarity": f"{similarity_score:.2f}" if face_detected_in_roi else "N/A",
+            "face_path": face_path,
             "bbox": [x1, y1, x2, y2]
         })
 
+    # Nothing is drawn before this point: with annotate_in_place the canvas can be 'frame' itself,
+    # which the face stage and the evidence crops above read
+    draw_start = time.perf_counter()
+    if not recognition_possible:
+         draw_text_with_background(processed_frame, "WARN: Embeddings N/A", (10, 60),
+                                   fontScale=0.7, color=(0,0,0), bg_color=(255,200,0), alpha=0.8)
+    if detections["roi_zone"] is not None:
+        # Outline the enforcement zone; persons outside it are ignored
+        zone_pixels = detections["roi_zone"].pixel_polygon(processed_frame.shape).astype(np.int32)
+        cv2.polylines(processed_frame, [zone_pixels], True, COLOR_ROI_ZONE, 1)
+    if detections["person_error"]:
+        draw_text_with_background(processed_frame, "Person Detection Error", (10, 90),
+                                  fontScale=0.6, color=(255,255,255), bg_color=(200,0,0), alpha=0.7)
+    draw_overlays(processed_frame, overlays)
+    observe_stage('draw', time.perf_counter() - draw_start)
+    if logger.isEnabledFor(logging.DEBUG): # Per-frame detail; skipped entirely unless DEBUG is on
+        logger.debug("Frame %dx%d: %d person(s) %s", frame.shape[1], frame.shape[0], len(detected_info),
+                     [(info.get("status"), info.get("student_id")) for info in detected_info])
     return processed_frame, detected_info
\ No newline at end of file
@@ -0,0 +1,361 @@
+# inference_pool.py
+import itertools
+import math
+import multiprocessing as mp
+import queue
+import threading
+import time
+import traceback
+from contextlib import nullcontext
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait as wait_for_processes
+
+import numpy as np
+
+from frame_pool import copy_frame
+
+
+class FrameTooLargeError(ValueError):
+    """Raised when a frame does not fit in a shared memory slot."""
+
+
+class WorkersUnavailable(RuntimeError):
+    """Raised when a frame's worker died or no worker is alive (respawning); retry_after is a hint in seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SharedFrameRing:
+    """
+    Fixed set of frame slots in one shared memory block. Each slot has an input
+    region (frame to process) and an output region (annotated frame), both
+    sized for the largest accepted frame, so frames never need to be pickled.
+    """
+
+    def __init__(self, slots, max_height, max_width, name=None):
+        self.slots = slots
+        self.max_height = max_height
+        self.max_width = max_width
+        self.region_size = max_height * max_width * 3
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=slots * 2 * self.region_size)
+        self.owner = create
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _view(self, slot, region, height, width):
+        if height > self.max_height or width > self.max_width:
+            raise FrameTooLargeError(f"Frame {width}x{height} exceeds ring slot size {self.max_width}x{self.max_height}.")
+        offset = (slot * 2 + region) * self.region_size
+        return np.ndarray((height, width, 3), dtype=np.uint8, buffer=self.shm.buf, offset=offset)
+
+    def input_view(self, slot, height, width):
+        return self._view(slot, 0, height, width)
+
+    def output_view(self, slot, height, width):
+        return self._view(slot, 1, height, width)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(worker_id, config, shm_name, slots, max_height, max_width, task_queue, result_queue):
+    """Entry point of an inference worker process: owns its own model copies."""
+    try:
+        # Imported here so the parent process does not need the models loaded
+        from model_loader import load_models
+        from database_manager import DatabaseManager
+        from image_processor import process_frame_logic
+        from roi_zones import RoiZone
+        from log_setup import setup_logging
+        from frame_pool import FRAME_POOL, frame_lease
+
+        setup_logging(config) # Spawned processes start without handlers
+        pooled = config.get('frame_pool_enabled', True)
+        FRAME_POOL.max_bytes = config.get('frame_pool_max_mb', 256) * 1024 * 1024
+        person_model, id_card_model, face_app, models_ok = load_models(config)
+        # Read-only gallery; fines are applied by the front process only
+        gallery = DatabaseManager(config)
+        ring = SharedFrameRing(slots, max_height, max_width, name=shm_name)
+        result_queue.put(('ready', worker_id, models_ok, None, None))
+    except Exception as e:
+        traceback.print_exc()
+        result_queue.put(('ready', worker_id, False, None, f"Worker init failed: {e}"))
+        return
+
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None: # Shutdown sentinel
+                break
+            task_id, slot, height, width, roi_polygon = task
+            try:
+                frame = ring.input_view(slot, height, width) # Zero-copy view into shared memory
+                roi_zone = RoiZone(roi_polygon) if roi_polygon is not None else None
+                # The input slot is ours until we answer (the front process fines from its own copy),
+                # so annotate it in place; resize buffers come from this worker's frame pool
+                with frame_lease() if pooled else nullcontext():
+                    processed_frame, detected_info = process_frame_logic(
+                        frame, person_model, id_card_model, face_app, gallery, None, config, apply_fines=False,
+                        roi_zone=roi_zone, annotate_in_place=pooled)
+                    out_h, out_w = processed_frame.shape[:2]
+                    ring.output_view(slot, out_h, out_w)[:] = processed_frame
+                result_queue.put((task_id, worker_id, detected_info, (out_h, out_w), None))
+            except Exception as e:
+                traceback.print_exc()
+                result_queue.put((task_id, worker_id, None, None, str(e)))
+    finally:
+        ring.close()
+
+
+class InferenceWorkerPool:
+    """
+    Pool of inference processes, each holding its own YOLO/InsightFace models.
+    Frames are handed over through a SharedFrameRing; only the task header and
+    the small detected_info list travel through the queues.
+
+    Each worker has its own task queue, so the pool knows which tasks a worker
+    holds. A watcher thread notices a worker process that exits (crash, OOM
+    kill): its tasks fail at once and their frame slots are freed, and a
+    replacement is spawned. A worker that dies again soon after its respawn
+    waits twice as long for the next one (from respawn_delay up to 5 minutes),
+    so a worker that cannot load its models does not spin.
+    """
+
+    def __init__(self, config, num_workers, ring_slots=0, max_width=1920, max_height=1080, timeout=10.0,
+                 respawn_delay=5.0):
+        self.config = config
+        self.num_workers = num_workers
+        self.ring_slots = ring_slots or num_workers * 2
+        self.timeout = timeout
+        self.respawn_delay = respawn_delay
+        self.max_width = max_width
+        self.max_height = max_height
+        self.ring = SharedFrameRing(self.ring_slots, max_height, max_width)
+
+        self.ctx = mp.get_context('spawn') # Fresh interpreters: no forked torch/ORT thread state
+        self.result_queue = self.ctx.Queue()
+        self.free_slots = queue.Queue()
+        for slot in range(self.ring_slots):
+            self.free_slots.put(slot)
+
+        self.pending = {} # task_id -> {'event', 'slot', 'worker', 'result', 'abandoned'}
+        self.pending_lock = threading.Lock() # Also guards the per-worker state below
+        self.task_ids = itertools.count()
+        self.ready_workers = 0
+        self.failed_workers = 0
+        self.ready_event = threading.Event()
+        self.restarts = 0
+        self.stopping = False
+
+        self.processes = [None] * num_workers
+        self.task_queues = [None] * num_workers
+        self.ready = [False] * num_workers # Models loaded; preferred for new tasks
+        self.in_flight = [0] * num_workers
+        self.spawned_at = [0.0] * num_workers
+        self.backoff = [respawn_delay] * num_workers # Minimum lifetime before the next respawn
+        for worker_id in range(num_workers):
+            self._spawn(worker_id, start=False)
+        self.listener = threading.Thread(target=self._listen_for_results, name="inference-results", daemon=True)
+        self.watcher = threading.Thread(target=self._watch_workers, name="inference-watcher", daemon=True)
+
+    def _spawn(self, worker_id, start=True):
+        """(Re)creates a worker with a fresh task queue (a dead process may have left the old one locked)."""
+        task_queue = self.ctx.Queue()
+        process = self.ctx.Process(target=_worker_main, name=f"inference-worker-{worker_id}", daemon=True,
+                                   args=(worker_id, self.config, self.ring.name, self.ring_slots, self.max_height,
+                                         self.max_width, task_queue, self.result_queue))
+        self.task_queues[worker_id] = task_queue
+        self.processes[worker_id] = process
+        self.ready[worker_id] = False
+        self.spawned_at[worker_id] = time.monotonic()
+        if start:
+            process.start()
+
+    def start(self, startup_timeout=300.0):
+        """Starts the workers and waits until each one has loaded its models. Returns True if all loaded cleanly."""
+        print(f"--- Starting {self.num_workers} inference worker(s) ({self.ring_slots} shared frame slots) ---")
+        for process in self.processes:
+            process.start()
+        self.listener.start()
+        self.watcher.start()
+        if not self.ready_event.wait(startup_timeout):
+            print(f"[WARN] Only {self.ready_workers}/{self.num_workers} inference workers became ready.")
+            return False
+        if self.failed_workers:
+            print(f"[WARN] {self.failed_workers}/{self.num_workers} inference workers failed to load their models.")
+            return False
+        print(f"[ OK ] {self.num_workers} inference worker(s) ready.")
+        return True
+
+    def _listen_for_results(self):
+        while True:
+            try:
+                message = self.result_queue.get()
+            except (EOFError, OSError):
+                break
+            if message is None:
+                break
+            task_id, worker_id, payload, out_shape, error = message
+            if task_id == 'ready':
+                failed = bool(error or not payload)
+                if failed:
+                    print(f"[WARN] Inference worker {worker_id} did not load cleanly: {error or 'model load failure'}")
+                with self.pending_lock:
+                    self.ready[worker_id] = True
+                    if not failed:
+                        self.backoff[worker_id] = self.respawn_delay
+                if self.ready_event.is_set(): # A respawned worker
+                    if not failed:
+                        print(f"[ OK ] Inference worker {worker_id} restarted.")
+                    continue
+                self._count_startup(worker_id, failed)
+                continue
+            with self.pending_lock:
+                entry = self.pending.pop(task_id, None)
+                if entry is not None:
+                    self.in_flight[entry['worker']] -= 1
+            if entry is None: # Already failed when its worker died
+                continue
+            if entry['abandoned']:
+                # Caller timed out; the slot is only safe to reuse now
+                self.free_slots.put(entry['slot'])
+                continue
+            entry['result'] = (payload, out_shape, error)
+            entry['event'].set()
+
+    def _count_startup(self, worker_id, failed):
+        if failed:
+            self.failed_workers += 1
+        self.ready_workers += 1
+        if self.ready_workers >= self.num_workers:
+            self.ready_event.set()
+
+    def _watch_workers(self):
+        """Fails the tasks of workers that exited and respawns them."""
+        dead = set()
+        while not self.stopping:
+            sentinels = [p.sentinel for i, p in enumerate(self.processes) if i not in dead]
+            wait_for_processes(sentinels, timeout=1.0)
+            if self.stopping:
+                break
+            for worker_id, process in enumerate(self.processes):
+                if worker_id not in dead and not process.is_alive():
+                    dead.add(worker_id)
+                    self._fail_worker(worker_id, process.exitcode)
+            now = time.monotonic()
+            for worker_id in list(dead):
+                if now - self.spawned_at[worker_id] >= self.backoff[worker_id]:
+                    dead.discard(worker_id)
+                    with self.pending_lock:
+                        self.restarts += 1
+                        self.backoff[worker_id] = min(self.backoff[worker_id] * 2, 300.0)
+                        self._spawn(worker_id)
+
+    def _fail_worker(self, worker_id, exitcode):
+        """Fails the dead worker's tasks and frees their slots (nothing can write to them any more)."""
+        with self.pending_lock:
+            was_ready = self.ready[worker_id]
+            self.ready[worker_id] = False
+            lost = [(task_id, entry) for task_id, entry in self.pending.items() if entry['worker'] == worker_id]
+            for task_id, _ in lost:
+                del self.pending[task_id]
+            self.in_flight[worker_id] = 0
+        print(f"[WARN] Inference worker {worker_id} exited (code {exitcode}); "
+              f"failing {len(lost)} task(s) and respawning it.")
+        if not self.ready_event.is_set() and not was_ready:
+            self._count_startup(worker_id, failed=True) # Died while loading: do not wait for it at startup
+        for _, entry in lost:
+            if entry['abandoned']:
+                self.free_slots.put(entry['slot'])
+            else:
+                entry['result'] = (None, None, WorkersUnavailable(f"Inference worker {worker_id} exited (code {exitcode})."))
+                entry['event'].set()
+
+    def _pick_worker(self):
+        """Live worker with the fewest tasks, preferring ones with models loaded. Caller holds pending_lock."""
+        candidates = [i for i, p in enumerate(self.processes) if p.is_alive()]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda i: (not self.ready[i], self.in_flight[i]))
+
+    def process(self, frame, roi_zone=None):
+        """
+        Runs process_frame_logic on a worker (without fining), restricted to
+        'roi_zone' if given; only its polygon points travel to the worker.
+        Returns (processed_frame, detected_info); raises TimeoutError, WorkersUnavailable (worker died
+        or none alive) or RuntimeError (processing error) on failure.
+        """
+        height, width = frame.shape[:2]
+        try:
+            slot = self.free_slots.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError("No free shared frame slot (all workers busy).")
+
+        task_id = next(self.task_ids)
+        entry = {'event': threading.Event(), 'slot': slot, 'worker': None, 'result': None, 'abandoned': False}
+        try:
+            self.ring.input_view(slot, height, width)[:] = frame
+        except Exception:
+            self.free_slots.put(slot)
+            raise
+        roi_polygon = roi_zone.to_list() if roi_zone is not None else None
+        with self.pending_lock:
+            worker_id = self._pick_worker()
+            if worker_id is None:
+                self.free_slots.put(slot)
+                # Seconds until the next worker is respawned (it still has to load its models after that)
+                now = time.monotonic()
+                respawn_in = min(self.spawned_at[i] + self.backoff[i] - now for i in range(self.num_workers))
+                raise WorkersUnavailable("No live inference worker (restarting).", max(1, math.ceil(respawn_in)))
+            entry['worker'] = worker_id
+            self.pending[task_id] = entry
+            self.in_flight[worker_id] += 1
+            # Queued under the lock so a worker that just died cannot miss it when failing its tasks
+            self.task_queues[worker_id].put((task_id, slot, height, width, roi_polygon))
+
+        if not entry['event'].wait(self.timeout):
+            with self.pending_lock:
+                if task_id in self.pending:
+                    entry['abandoned'] = True
+                    raise TimeoutError(f"Inference worker did not answer within {self.timeout:.1f}s.")
+            # Result arrived just after the timeout; the listener is about to hand it over
+            entry['event'].wait()
+
+        try:
+            detected_info, out_shape, error = entry['result']
+            if isinstance(error, WorkersUnavailable):
+                raise error
+            if error:
+                raise RuntimeError(error)
+            processed_frame = copy_frame(self.ring.output_view(slot, *out_shape)) # Pooled inside a frame_lease()
+            return processed_frame, detected_info
+        finally:
+            self.free_slots.put(slot)
+
+    def snapshot(self):
+        with self.pending_lock:
+            return {
+                "workers": self.num_workers,
+                "alive": sum(p.is_alive() for p in self.processes),
+                "ready": sum(self.ready),
+                "in_flight": list(self.in_flight),
+                "restarts": self.restarts,
+            }
+
+    def shutdown(self):
+        self.stopping = True
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.result_queue.put(None)
+        self.ring.close()
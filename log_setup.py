@@ -0,0 +1,162 @@
+# log_setup.py
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+# LogRecord attributes that are not 'extra' fields
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_queue_handler = None
+_hooks_registered = False
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed with extra={...} are included as top-level keys."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that does no work in the calling thread beyond creating the
+    record. The stock prepare() renders msg % args and the traceback before
+    enqueueing; the queue here never leaves the process, so the record can
+    travel as is and the listener thread does all formatting.
+    Log arguments must therefore not be mutated after the call.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class EventSampler:
+    """Lets the 1st, (every+1)th, (2*every+1)th, ... event of each key through."""
+
+    def __init__(self, every=100):
+        self.every = max(1, int(every))
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def hit(self, key):
+        """Counts one event of 'key'; returns the running count if it should be logged, else 0."""
+        with self.lock:
+            count = self.counts.get(key, 0) + 1
+            self.counts[key] = count
+        return count if (count - 1) % self.every == 0 else 0
+
+
+SAMPLER = EventSampler()
+
+
+def log_sampled(logger, level, key, msg, *args, **kwargs):
+    """
+    For events that can fire on every frame (detection failures, shed frames):
+    logs only every SAMPLER.every-th occurrence of 'key', tagged with the
+    running count so the rate can still be read from the logs.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    count = SAMPLER.hit(key)
+    if count:
+        extra = dict(kwargs.pop('extra', None) or {}, sample_key=key, sample_count=count, sample_every=SAMPLER.every)
+        logger.log(level, msg + " [seen %d time(s), logging 1 in %d]", *args, count, SAMPLER.every, extra=extra, **kwargs)
+
+
+def _build_handlers(settings):
+    if settings.get('log_format', 'text') == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    log_file = settings.get('log_file', '')
+    if log_file:
+        log_dir = os.path.dirname(log_file)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        # Re-opens the file if logrotate moves it; safe with several server workers appending
+        handlers.append(logging.handlers.WatchedFileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _start_listener(handlers):
+    global _listener
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork(); without a new one the
+    # child's records would pile up in a queue nobody drains
+    if _listener is not None:
+        _start_listener(_listener.handlers)
+
+
+def setup_logging(settings):
+    """
+    Routes all logging through a queue: request threads only enqueue records,
+    a QueueListener thread formats them and writes to stdout (and log_file).
+    Uses the [LOGGING] keys of the settings dict; safe to call more than once.
+    """
+    global _queue_handler, _hooks_registered
+    level = getattr(logging, str(settings.get('log_level', 'INFO')).upper(), logging.INFO)
+    SAMPLER.every = max(1, int(settings.get('log_sample_every', 100)))
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        if not _hooks_registered:
+            os.register_at_fork(after_in_child=_restart_after_fork)
+            atexit.register(stop_logging)
+            _hooks_registered = True
+
+        if _queue_handler is None:
+            _queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+        _start_listener(_build_handlers(settings))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        # e.g. "image_processor=DEBUG, werkzeug=WARNING"
+        for entry in filter(None, (part.strip() for part in settings.get('log_levels', '').split(','))):
+            name, _, name_level = entry.partition('=')
+            logging.getLogger(name.strip()).setLevel(name_level.strip().upper())
+
+
+def stop_logging():
+    """Flushes queued records and stops the listener thread (registered with atexit)."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
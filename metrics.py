@@ -0,0 +1,312 @@
+# metrics.py
+import bisect
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers ~0.1 ms (gallery match, drawing) up to multi-second stalls
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _HistogramChild:
+    """Bucket counts for one label value. observe() is a bisect plus a few adds under a lock."""
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Histogram:
+    """Prometheus-style histogram; with 'label' set, use .labels(value).observe(x)."""
+
+    def __init__(self, name, documentation, label=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(sorted(buckets))
+        self.children = {}
+        self.lock = threading.Lock()
+        if label is None:
+            self.children[None] = _HistogramChild(self.buckets)
+
+    def labels(self, value):
+        child = self.children.get(value)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(value, _HistogramChild(self.buckets))
+        return child
+
+    def observe(self, value):
+        self.children[None].observe(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for value, child in sorted(self.children.items(), key=lambda kv: str(kv[0])):
+            base = [(self.label, value)] if self.label is not None else []
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(base + [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(base)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(base)} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter, optionally with one label."""
+
+    def __init__(self, name, documentation, label=None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, label_value=None):
+        with self.lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def value(self, label_value=None):
+        return self.values.get(label_value, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            items = sorted(self.values.items(), key=lambda kv: str(kv[0]))
+        if not items and self.label is None:
+            items = [(None, 0)]
+        for value, amount in items:
+            labels = [(self.label, value)] if self.label is not None else []
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(amount)}")
+        return lines
+
+
+class Gauge:
+    """Current value; either set()/inc()/dec() or read from a callback at scrape time."""
+
+    def __init__(self, name, documentation, callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.current = 0
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        self.current = value
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.current += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.current -= amount
+
+    def render(self):
+        value = self.callback() if self.callback is not None else self.current
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_format_value(value)}"]
+
+
+class MetricsRegistry:
+    """
+    Holds metrics and renders them in the Prometheus text format. Collectors
+    are callables returning extra text lines at scrape time (for stats that
+    live in other objects, e.g. the admission controller).
+    Metrics are per process: under several server workers each scrape sees
+    the worker that answered it.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, name, collector):
+        with self.lock:
+            self.collectors[name] = collector
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics)
+            collectors = list(self.collectors.items())
+        for metric in metrics:
+            lines.extend(metric.render())
+        for name, collector in collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                lines.append(f"# collector {name} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def metric_family(name, documentation, samples, metric_type='gauge'):
+    """Text lines for a collector-provided metric; samples are (labels list, value) pairs."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return lines
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'smart_id_stage_seconds', 'Time spent per /process pipeline stage.', label='stage'))
+FRAMES = REGISTRY.register(Counter('smart_id_frames_total', 'Frames run through process_frame_logic.'))
+PERSONS = REGISTRY.register(Counter('smart_id_persons_total', 'Persons detected (inside ROI zones).'))
+FACES = REGISTRY.register(Counter('smart_id_faces_total', 'Faces embedded, by path.', label='path'))
+FINES = REGISTRY.register(Counter('smart_id_fines_total', 'Fines applied.'))
+EMAIL_QUEUE = REGISTRY.register(Gauge('smart_id_email_queue', 'Fine notification emails waiting or being sent.'))
+
+
+class RequestTrace:
+    """Stage durations of one request, in the order first seen (repeated stages are summed)."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.info = {} # Free-form request details (camera, frame size, counts)
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        """Value for the Server-Timing response header (durations in ms)."""
+        parts = [f"{stage};dur={seconds * 1000.0:.1f}" for stage, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000.0:.1f}")
+        return ", ".join(parts)
+
+
+_current_trace = contextvars.ContextVar('smart_id_request_trace', default=None)
+
+
+def current_trace():
+    """The RequestTrace of the request being handled by this thread, or None."""
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_request():
+    """Collects every timed()/observe_stage() of this thread into a RequestTrace."""
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+class SlowRequestLog:
+    """
+    Keeps the 'capacity' slowest requests seen in the last 'max_age' seconds
+    (a min-heap on duration, so recording is O(log n) and fast requests are
+    rejected with one comparison once the heap is full).
+    """
+
+    def __init__(self, capacity=50, max_age=900.0):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.heap = [] # (duration, seq, entry)
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+
+    def _evict_old(self, now):
+        if any(now - entry['timestamp'] > self.max_age for _, _, entry in self.heap):
+            self.heap = [item for item in self.heap if now - item[2]['timestamp'] <= self.max_age]
+            heapq.heapify(self.heap)
+
+    def record(self, trace, status=None):
+        if self.capacity <= 0:
+            return
+        duration = trace.elapsed()
+        with self.lock:
+            if len(self.heap) >= self.capacity and duration <= self.heap[0][0]:
+                if time.time() - self.heap[0][2]['timestamp'] <= self.max_age:
+                    return
+                self._evict_old(time.time())
+            entry = {
+                "timestamp": trace.started,
+                "duration_ms": round(duration * 1000.0, 2),
+                "status": status,
+                "stages_ms": {stage: round(seconds * 1000.0, 2) for stage, seconds in trace.stages.items()},
+                **trace.info,
+            }
+            item = (duration, next(self.seq), entry)
+            if len(self.heap) < self.capacity:
+                heapq.heappush(self.heap, item)
+            else:
+                heapq.heapreplace(self.heap, item)
+
+    def slowest(self):
+        with self.lock:
+            self._evict_old(time.time())
+            return [entry for _, _, entry in sorted(self.heap, key=lambda item: item[0], reverse=True)]
+
+
+@contextmanager
+def timed(stage):
+    """Records the duration of the block under STAGE_SECONDS{stage=...} and in the request trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage).observe(seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, seconds)
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
@@ -1,13 +1,23 @@
 # model_loader.py
 import os
 import numpy as np
-from ultralytics import YOLO
-import insightface # <-- Add insightface import
+from thread_budget import apply_thread_budget, apply_ort_thread_budget
 
 def load_models(config):
     """Loads YOLO models and the InsightFace FaceAnalysis app."""
+    if config.get('stub_models', False):
+        # Benchmarks/load tests without weights (see stub_models.py)
+        from stub_models import load_stub_models
+        return load_stub_models(config)
+    # Imported here so stub mode also works where ultralytics/insightface are not installed
+    from ultralytics import YOLO
+    import insightface
+
     # --- Corrected Configuration Access ---
     person_model_path = config.get('person_model_path', 'yolov8n.pt')
+    if config.get('use_pose_model', False):
+        # Pose model replaces the person detector: same person boxes plus keypoints
+        person_model_path = config.get('pose_model_path', 'yolov8n-pose.pt')
     id_card_model_path = config.get('id_card_model_path', 'id_card_detector.pt')
     arcface_model_name = config.get('model_name', 'buffalo_l')
     providers_str = config.get('providers', 'CPU')
@@ -20,6 +30,9 @@ def load_models(config):
     print("--- Loading Detection & Recognition Models ---")
     models_loaded_successfully = True
 
+    # Limit torch/OpenCV thread pools before the first inference creates them
+    apply_thread_budget(config)
+
 
     # --- Load Person YOLO Model ---
     try:
@@ -57,6 +70,7 @@ def load_models(config):
         face_app = insightface.app.FaceAnalysis(name=arcface_model_name,
                                                 allowed_modules=['detection', 'recognition'],
                                                 providers=providers)
+        apply_ort_thread_budget(face_app, providers, config)
         face_app.prepare(ctx_id=0, det_size=(640, 640)) # det_size can be adjusted
         # Perform a dummy analysis to ensure loading
         _ = face_app.get(np.zeros((100, 100, 3), dtype=np.uint8))
@@ -0,0 +1,118 @@
+# pose_face.py
+import logging
+import threading
+import numpy as np
+
+from log_setup import log_sampled
+
+logger = logging.getLogger(__name__)
+
+# --- COCO keypoint indices produced by YOLO pose models (e.g. yolov8n-pose.pt) ---
+KPT_NOSE = 0
+KPT_LEFT_EYE = 1   # Subject's left eye (appears on the image right when facing the camera)
+KPT_RIGHT_EYE = 2  # Subject's right eye (appears on the image left)
+KPT_LEFT_EAR = 3
+KPT_RIGHT_EAR = 4
+
+# --- Ratios taken from the InsightFace ArcFace 112x112 template ---
+# Mouth centre sits ~2.02x further below the eye midpoint than the nose does,
+# and the mouth corners are ~0.83x the eye distance apart.
+MOUTH_TO_NOSE_RATIO = 2.02
+MOUTH_HALF_WIDTH_RATIO = 0.414
+
+
+def landmarks_from_keypoints(person_kpts, conf_threshold=0.5, min_eye_distance=10.0):
+    """
+    Builds the 5-point ArcFace landmark set (image-left eye, image-right eye,
+    nose, left mouth corner, right mouth corner) from one person's pose keypoints.
+    Mouth corners are not part of the COCO skeleton, so they are estimated from
+    the eyes and nose using the ArcFace template proportions.
+
+    Returns (kps5, face_bbox) or None if the keypoints are not confident enough,
+    in which case the caller should fall back to the SCRFD detector.
+    """
+    try:
+        kpts = np.asarray(person_kpts, dtype=np.float32)
+        if kpts.ndim != 2 or kpts.shape[0] <= KPT_RIGHT_EAR or kpts.shape[1] < 3:
+            return None
+
+        nose, left_eye, right_eye = kpts[KPT_NOSE], kpts[KPT_LEFT_EYE], kpts[KPT_RIGHT_EYE]
+        if min(nose[2], left_eye[2], right_eye[2]) < conf_threshold:
+            return None # Face not clearly visible
+
+        img_left_eye = right_eye[:2]
+        img_right_eye = left_eye[:2]
+        eye_vec = img_right_eye - img_left_eye
+        eye_dist = float(np.hypot(eye_vec[0], eye_vec[1]))
+        # Person facing away (eyes swapped) or face too small to embed reliably
+        if eye_vec[0] <= 0 or eye_dist < min_eye_distance:
+            return None
+
+        # Strongly turned heads put the nose outside the eyes; SCRFD handles those better
+        if not (img_left_eye[0] <= nose[0] <= img_right_eye[0]):
+            return None
+
+        eye_mid = (img_left_eye + img_right_eye) / 2.0
+        mouth_mid = eye_mid + (nose[:2] - eye_mid) * MOUTH_TO_NOSE_RATIO
+        mouth_left = mouth_mid - eye_vec * MOUTH_HALF_WIDTH_RATIO
+        mouth_right = mouth_mid + eye_vec * MOUTH_HALF_WIDTH_RATIO
+
+        kps5 = np.stack([img_left_eye, img_right_eye, nose[:2], mouth_left, mouth_right]).astype(np.float32)
+
+        # Approximate face box from the visible eye/ear/mouth points (used for reporting only)
+        visible = [kps5]
+        for ear_idx in (KPT_LEFT_EAR, KPT_RIGHT_EAR):
+            if kpts[ear_idx, 2] >= conf_threshold:
+                visible.append(kpts[ear_idx:ear_idx + 1, :2])
+        pts = np.concatenate(visible, axis=0)
+        face_bbox = [float(pts[:, 0].min()), float(pts[:, 1].min() - eye_dist * 0.6),
+                     float(pts[:, 0].max()), float(pts[:, 1].max() + eye_dist * 0.3)]
+        return kps5, face_bbox
+    except Exception as e:
+        log_sampled(logger, logging.WARNING, 'pose_landmarks', "Error building landmarks from pose keypoints: %s", e)
+        return None
+
+
+def embed_face_from_landmarks(image, kps5, rec_model):
+    """Aligns the face with the given 5-point landmarks and runs the ArcFace recognizer directly."""
+    from insightface.utils import face_align # Only with real models; keeps stub/CI mode free of insightface
+    aligned_face = face_align.norm_crop(image, landmark=kps5, image_size=rec_model.input_size[0])
+    embedding = rec_model.get_feat(aligned_face).flatten()
+    norm = np.linalg.norm(embedding)
+    if norm == 0:
+        return None
+    return embedding / norm
+
+
+class FacePathStats:
+    """Thread-safe counters for how each face embedding was obtained."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keypoints = 0       # Fast path: pose keypoints -> recognizer
+        self.scrfd_fallback = 0  # Keypoints available but not confident enough
+        self.scrfd = 0           # No keypoints available (pose path disabled)
+
+    def record(self, path):
+        with self.lock:
+            if path == 'keypoints':
+                self.keypoints += 1
+            elif path == 'scrfd_fallback':
+                self.scrfd_fallback += 1
+            else:
+                self.scrfd += 1
+
+    def snapshot(self):
+        with self.lock:
+            total = self.keypoints + self.scrfd_fallback + self.scrfd
+            return {
+                "keypoints": self.keypoints,
+                "scrfd_fallback": self.scrfd_fallback,
+                "scrfd": self.scrfd,
+                "total": total,
+                "fast_path_ratio": (self.keypoints / total) if total else 0.0
+            }
+
+
+# Shared instance used by process_frame_logic and reported by app.py
+face_path_stats = FacePathStats()
@@ -0,0 +1,162 @@
+# profiler.py
+import cProfile
+import collections
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Innermost Python functions of threads that are just waiting (server accept
+# loop, idle pool threads, queue/event waits, keep-alive reads); dropped with
+# skip_idle so busy stacks stand out
+IDLE_LEAVES = ('wait', 'select', 'poll', 'accept', 'serve_forever', 'readinto', '_wait_for_tstate_lock')
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.splitext(os.path.basename(code.co_filename))[0]}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    Pure-Python sampling profiler: a background thread reads
+    sys._current_frames() every 'interval' seconds for 'duration' seconds and
+    counts each thread's stack. The result is in collapsed-stack format
+    ("thread;module:func;module:func count" per line), which flamegraph.pl,
+    speedscope or inferno render directly. One session runs at a time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.counts = collections.Counter()
+        self.samples = 0
+        self.started_at = None
+        self.finished_at = None
+        self.settings = {}
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, duration=30.0, interval=0.01, thread_filter='', skip_idle=True):
+        """Starts a sampling session; returns False if one is already running."""
+        with self.lock:
+            if self.running():
+                return False
+            self.counts = collections.Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self.finished_at = None
+            self.settings = {"duration_s": duration, "interval_ms": interval * 1000.0,
+                             "thread_filter": thread_filter, "skip_idle": skip_idle}
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, args=(duration, interval, thread_filter, skip_idle),
+                                           name="sampling-profiler", daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def _run(self, duration, interval, thread_filter, skip_idle):
+        own_id = threading.get_ident()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline and not self.stop_event.is_set():
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                name = names.get(thread_id, f"thread-{thread_id}")
+                if thread_filter and thread_filter not in name:
+                    continue
+                if skip_idle and frame.f_code.co_name in IDLE_LEAVES:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(name.split(' ')[0].rstrip('-0123456789') or name) # Group numbered threads
+                stacks.append(";".join(reversed(labels)))
+            with self.lock:
+                self.counts.update(stacks)
+                self.samples += 1
+            self.stop_event.wait(interval)
+        self.finished_at = time.time()
+
+    def status(self):
+        with self.lock:
+            return {
+                "running": self.running(),
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "samples": self.samples,
+                "distinct_stacks": len(self.counts),
+                **self.settings,
+            }
+
+    def collapsed(self):
+        """Collapsed stacks of the current/last session, most frequent first."""
+        with self.lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self.counts.most_common()) + "\n"
+
+
+class RequestProfiler:
+    """
+    Wraps single requests in cProfile. Only one request is profiled at a time
+    (the interpreter allows one active profiler); the .prof file is written to
+    output_dir (open it with snakeviz or pstats) and a text summary is kept
+    for the admin endpoint.
+    """
+
+    def __init__(self, output_dir='profiles', keep=20):
+        self.output_dir = output_dir
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.summaries = collections.OrderedDict() # profile_id -> text summary
+
+    def run(self, func, label='request'):
+        """Calls func() under cProfile; returns (result, profile_id or None if another profile was running)."""
+        if not self.lock.acquire(blocking=False):
+            return func(), None
+        try:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError: # Another profiling tool is active in this interpreter
+                return func(), None
+            try:
+                result = func()
+            finally:
+                profile.disable()
+                profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{int(time.time() * 1000) % 1000:03d}"
+                self._save(profile, profile_id)
+            return result, profile_id
+        finally:
+            self.lock.release()
+
+    def _save(self, profile, profile_id):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            profile.dump_stats(os.path.join(self.output_dir, profile_id + '.prof'))
+        except OSError as e:
+            logger.warning("Could not write profile '%s': %s", profile_id, e)
+        buffer = io.StringIO()
+        pstats.Stats(profile, stream=buffer).sort_stats('cumulative').print_stats(40)
+        self.summaries[profile_id] = buffer.getvalue()
+        while len(self.summaries) > self.keep:
+            self.summaries.popitem(last=False)
+
+    def list(self):
+        return list(self.summaries.keys())
+
+    def summary(self, profile_id):
+        return self.summaries.get(profile_id)
@@ -0,0 +1,130 @@
+# roi_zones.py
+import json
+import logging
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RoiZone:
+    """
+    Enforcement zone of one camera: a polygon in normalized coordinates
+    (0..1 of frame width/height), so it stays valid when the browser changes
+    resolution or frames are decoded at reduced size.
+    """
+
+    def __init__(self, polygon):
+        try:
+            points = np.asarray(polygon, dtype=np.float32)
+        except TypeError: # e.g. a dict, or points that are not numbers
+            raise ValueError("ROI polygon must be a list of [x, y] number pairs.")
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+            raise ValueError("ROI polygon needs at least 3 [x, y] points.")
+        if not np.isfinite(points).all(): # NaN would pass the range check below
+            raise ValueError("ROI polygon points must be finite numbers.")
+        if points.min() < 0.0 or points.max() > 1.0:
+            raise ValueError("ROI polygon points must be normalized to 0..1.")
+        self.points = points
+
+    def to_list(self):
+        return [[round(float(x), 5), round(float(y), 5)] for x, y in self.points]
+
+    def pixel_polygon(self, frame_shape):
+        h, w = frame_shape[:2]
+        return self.points * np.array([w, h], dtype=np.float32)
+
+    def bounding_rect(self, frame_shape):
+        """Pixel (x1, y1, x2, y2) of the zone's bounding rectangle, clamped to the frame."""
+        h, w = frame_shape[:2]
+        pixels = self.pixel_polygon(frame_shape)
+        x1, y1 = (int(v) for v in np.floor(pixels.min(axis=0)))
+        x2, y2 = (int(v) for v in np.ceil(pixels.max(axis=0)))
+        return max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+
+    def contains_person(self, person_box, frame_shape):
+        """A person is in the zone when the bottom center of the box (their feet) is inside the polygon."""
+        x1, y1, x2, y2 = person_box
+        foot = (float(x1 + x2) / 2.0, float(y2))
+        return cv2.pointPolygonTest(self.pixel_polygon(frame_shape), foot, False) >= 0
+
+
+class RoiZoneStore:
+    """
+    Per-camera zones kept in a JSON file ({camera_id: [[x, y], ...]}).
+    Updates are written atomically; other server processes pick them up
+    because the file is re-read when its modification time changes.
+    """
+
+    def __init__(self, zones_file, check_interval=1.0):
+        self.zones_file = zones_file
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.zones = {}
+        self._mtime = None
+        self._last_check = 0.0
+        self._reload()
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.zones_file).st_mtime_ns
+        except FileNotFoundError:
+            self.zones, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.zones_file, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            if not isinstance(raw, dict):
+                raise ValueError("expected an object of camera_id: polygon")
+            zones = {}
+            for camera_id, polygon in raw.items():
+                try:
+                    zones[str(camera_id)] = RoiZone(polygon)
+                except ValueError as e: # One bad zone (e.g. saved by an older version) does not drop the others
+                    logger.warning("Skipping invalid ROI zone of camera '%s' in '%s': %s", camera_id, self.zones_file, e)
+            self.zones = zones
+            self._mtime = mtime
+            logger.info("Loaded ROI zones for %d camera(s) from '%s'.", len(self.zones), self.zones_file)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load ROI zones from '%s': %s. Keeping previous zones.", self.zones_file, e)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self._reload()
+
+    def get(self, camera_id):
+        """Returns the RoiZone of 'camera_id', or None (whole frame)."""
+        if camera_id is None:
+            return None
+        with self.lock:
+            self._maybe_reload()
+            return self.zones.get(str(camera_id))
+
+    def all(self):
+        with self.lock:
+            self._maybe_reload()
+            return {camera_id: zone.to_list() for camera_id, zone in self.zones.items()}
+
+    def set(self, camera_id, polygon):
+        """Sets (or with polygon=None removes) a camera's zone and saves the file. Raises ValueError if invalid."""
+        with self.lock:
+            self._reload()
+            zones = dict(self.zones)
+            if polygon is None:
+                zones.pop(str(camera_id), None)
+            else:
+                zones[str(camera_id)] = RoiZone(polygon)
+            tmp_path = self.zones_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({cid: zone.to_list() for cid, zone in zones.items()}, f, indent=2)
+            os.replace(tmp_path, self.zones_file)
+            self.zones = zones
+            self._mtime = os.stat(self.zones_file).st_mtime_ns
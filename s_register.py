@@ -1,57 +1,280 @@
-import cv2
+# s_register.py
+"""
+Bulk student importer: merges a roster CSV into the student database
+([DATABASE] csv_file) in the schema DatabaseManager expects
+(student_id, name, image_path, fine_amount, email).
+
+- Photos are checked in parallel by reading only their headers (Pillow opens
+  images lazily), so a missing or corrupt photo rejects its row without
+  decoding every image.
+- Roster and database are merged with one keyed join on student_id;
+  duplicate IDs in the roster are collapsed (last row wins).
+- The database is rewritten atomically (temp file + rename) under the same
+  file lock the server uses with shared_fine_state, so a running server
+  never reads a half-written file or loses a fine to the import.
+- With --embeddings, ArcFace embeddings are generated only for the imported
+  (and, with --update-existing, re-photographed) students and merged into
+  [DATABASE] embeddings_file.
+
+Roster columns are matched by name (student_id/id, name, image_path/image,
+email; anything else such as branch or year is kept as an extra column).
+The old 5-column layout "ID, Name, Branch, Year, ImagePath" is still accepted.
+Relative image paths are resolved against the roster's folder.
+
+Usage:
+    python s_register.py --roster s_details.csv
+    python s_register.py --roster new_intake.csv --embeddings --workers 32
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
-import configparser
-import os
+from PIL import Image, UnidentifiedImageError
 
-# Load config settings
-config = configparser.ConfigParser()
-config.read("config.ini")
+from config_loader import load_config
+from file_lock import InterProcessLock
 
-# Load student details
-csv_file = "s_details.csv"
-if not os.path.exists(csv_file):
-    print(f"❌ Error: {csv_file} not found.")
-    exit()
+SCHEMA = ["student_id", "name", "image_path", "fine_amount", "email"]
+COLUMN_ALIASES = {
+    "student_id": ("student_id", "id", "studentid", "student", "roll_no"),
+    "name": ("name", "student_name", "full_name"),
+    "image_path": ("image_path", "imagepath", "image", "photo", "photo_path"),
+    "email": ("email", "e-mail", "mail", "email_address"),
+}
+LEGACY_COLUMNS = ["student_id", "name", "branch", "year", "image_path"] # Original s_details.csv layout
+MIN_IMAGE_SIDE = 32 # Smaller photos cannot hold a usable face
 
-s_details = pd.read_csv(csv_file)
 
-# Check if students_db.csv exists
-students_db_file = "students_db.csv"
-if os.path.exists(students_db_file):
-    students_db = pd.read_csv(students_db_file)
-else:
-    students_db = pd.DataFrame(columns=["student_id", "name", "branch", "year", "image_path", "fine_amount"]) # Modified column
+def read_roster(roster_path):
+    """Reads the roster as strings and maps its columns onto the schema names."""
+    roster = pd.read_csv(roster_path, dtype=str, keep_default_na=False)
+    normalized = {col: col.strip().lower().replace(' ', '_') for col in roster.columns}
+    renames = {}
+    for target, aliases in COLUMN_ALIASES.items():
+        for col, norm in normalized.items():
+            if norm in aliases and target not in renames.values():
+                renames[col] = target
+                break
+    if not {"student_id", "name", "image_path"} <= set(renames.values()):
+        if len(roster.columns) != len(LEGACY_COLUMNS):
+            raise ValueError("Roster needs columns student_id, name and image_path (optionally email), "
+                             "or the 5-column layout ID, Name, Branch, Year, ImagePath.")
+        renames = dict(zip(roster.columns, LEGACY_COLUMNS))
+    roster = roster.rename(columns=renames)
+    if "email" not in roster.columns:
+        roster["email"] = ""
+    for col in ("student_id", "name", "image_path", "email"):
+        roster[col] = roster[col].astype(str).str.strip()
+    return roster
 
-for _, row in s_details.iterrows():
+
+def probe_image(path):
+    """Header-only check of one photo; returns None if usable, else the reason."""
     try:
-        student_id, name, branch, year, image_path = row
-    except ValueError:
-        print("❌ Error: CSV format incorrect. Ensure 5 columns: ID, Name, Branch, Year, ImagePath")
-        continue
-
-    # Read student image
-    img = cv2.imread(image_path)
-    if img is None:
-        print(f"❌ Error processing {name}: Unable to read image.")
-        continue
-
-    # Check if student already exists
-    if student_id in students_db["student_id"].values:
-        print(f"✅ Student {name} already in database. Skipping...")
-    else:
-        new_entry = pd.DataFrame([{
-            "student_id": student_id,
-            "name": name,
-            "branch": branch,
-            "year": year,
-            "image_path": image_path,  # Save image path
-            "fine_amount": 0
-        }])
-
-        students_db = pd.concat([students_db, new_entry], ignore_index=True)
-        print(f"✅ {name} registered successfully.")
-
-# Save updated database
-students_db.to_csv(students_db_file, index=False)
-print("✅ Image paths stored in students_db.csv with initial fine 0.")
\ No newline at end of file
+        with Image.open(path) as img: # Parses the header only; pixels are not decoded
+            width, height = img.size
+    except FileNotFoundError:
+        return "image not found"
+    except (UnidentifiedImageError, OSError) as e:
+        return f"unreadable image ({e.__class__.__name__})"
+    if width < MIN_IMAGE_SIDE or height < MIN_IMAGE_SIDE:
+        return f"image too small ({width}x{height})"
+    return None
+
+
+def resolve_image_paths(roster, roster_dir):
+    """Absolute photo paths; relative ones are taken from the roster's folder, else the working directory."""
+    resolved = []
+    for path in roster["image_path"]:
+        if not path or os.path.isabs(path):
+            resolved.append(path)
+            continue
+        candidate = os.path.normpath(os.path.join(roster_dir, path))
+        resolved.append(candidate if os.path.exists(candidate) else os.path.abspath(path))
+    return resolved
+
+
+def stored_image_path(abs_path, db_dir):
+    """Path as stored in the DB: relative to the DB file's folder (how generate_embeddings.py resolves it)."""
+    try:
+        return os.path.relpath(abs_path, db_dir)
+    except ValueError: # Different drive on Windows
+        return abs_path
+
+
+def validate_roster(roster, roster_dir, workers):
+    """Splits the roster into (valid rows, rejected rows with a 'reason' column)."""
+    roster = roster.copy()
+    roster["abs_image_path"] = resolve_image_paths(roster, roster_dir)
+    reasons = pd.Series("", index=roster.index)
+    reasons[roster["student_id"] == ""] = "missing student_id"
+    reasons[(reasons == "") & (roster["name"] == "")] = "missing name"
+    reasons[(reasons == "") & (roster["image_path"] == "")] = "missing image_path"
+
+    to_probe = roster.loc[reasons == "", "abs_image_path"].unique()
+    with ThreadPoolExecutor(max_workers=workers) as pool: # File opens are I/O bound
+        probe_results = dict(zip(to_probe, pool.map(probe_image, to_probe, chunksize=64)))
+    probed = reasons == ""
+    reasons[probed] = roster.loc[probed, "abs_image_path"].map(probe_results).fillna("")
+
+    rejected = roster[reasons != ""].assign(reason=reasons[reasons != ""])
+    return roster[reasons == ""], rejected
+
+
+def read_database(db_path):
+    """Current DB (empty if missing). Older files without email etc. are brought up to the schema."""
+    if not os.path.exists(db_path) or os.path.getsize(db_path) == 0:
+        return pd.DataFrame(columns=SCHEMA)
+    db = pd.read_csv(db_path, dtype=str) # Round-trips extra columns (e.g. year) untouched; only fines are numeric
+    for col in SCHEMA:
+        if col not in db.columns:
+            db[col] = 0.0 if col == "fine_amount" else np.nan
+    db["student_id"] = db["student_id"].astype(str).str.strip()
+    db["fine_amount"] = pd.to_numeric(db["fine_amount"], errors="coerce").fillna(0.0)
+    return db
+
+
+def merge_roster(db, roster, update_existing):
+    """
+    One keyed join of roster against DB. Returns (merged DB, new rows,
+    IDs of existing students whose photo changed).
+    """
+    joined = roster.merge(db[["student_id", "image_path"]], on="student_id", how="left",
+                          suffixes=("", "_db"), indicator=True)
+    is_new = (joined["_merge"] == "left_only").to_numpy()
+    new_rows = roster[is_new].copy()
+    new_rows["fine_amount"] = 0.0
+    new_rows["email"] = new_rows["email"].replace("", np.nan)
+
+    changed_photo_ids = []
+    if update_existing and (~is_new).any():
+        existing = roster[~is_new].set_index("student_id")
+        photo_changed = (joined.loc[~is_new, "image_path"].to_numpy() != joined.loc[~is_new, "image_path_db"].to_numpy())
+        changed_photo_ids = existing.index[photo_changed].tolist()
+        updates = existing[["name", "image_path", "email"]].replace("", np.nan) # Blank roster cells keep the DB value
+        db = db.set_index("student_id")
+        db.update(updates)
+        db = db.reset_index()
+
+    extras = [col for col in list(db.columns) + list(new_rows.columns) if col not in SCHEMA]
+    columns = SCHEMA + list(dict.fromkeys(extras))
+    merged = pd.concat([db.reindex(columns=columns), new_rows.reindex(columns=columns)], ignore_index=True)
+    merged["fine_amount"] = merged["fine_amount"].astype(float)
+    return merged, new_rows, changed_photo_ids
+
+
+def write_atomically(df, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_csv(tmp_path, index=False, float_format='%.2f')
+    os.replace(tmp_path, path)
+
+
+def update_embeddings(config, db, student_ids, db_dir):
+    """Embeds only 'student_ids' and merges them into the embeddings file."""
+    from generate_embeddings import load_face_app, embed_student_images, print_embedding_summary
+
+    embeddings_path = config.get('embeddings_file', 'known_embeddings.npy')
+    rows = db[db["student_id"].isin(student_ids)]
+    print(f"\n--- Generating embeddings for {len(rows)} student(s) ---")
+    try:
+        face_app = load_face_app(config)
+    except Exception as e:
+        print(f"[FAIL] Could not load the face model, embeddings not updated: {e}")
+        print("       The students were imported; run generate_embeddings.py once the model is available.")
+        return False
+    new_embeddings, counts = embed_student_images(face_app, rows, db_dir)
+    print_embedding_summary(counts)
+    if not new_embeddings:
+        return True
+
+    known = {}
+    if os.path.exists(embeddings_path):
+        loaded = np.load(embeddings_path, allow_pickle=True)
+        known = loaded.item() if isinstance(loaded, np.ndarray) and loaded.size == 1 else dict(loaded)
+    known.update(new_embeddings)
+    tmp_path = f"{embeddings_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f: # File object, so np.save does not append '.npy' to the temp name
+        np.save(f, known)
+    os.replace(tmp_path, embeddings_path)
+    print(f"[ OK ] Embeddings file '{embeddings_path}' now holds {len(known)} student(s) "
+          f"({len(new_embeddings)} added/updated).")
+    return True
+
+
+def main(args):
+    config = load_config(args.config)
+    db_path = config.get('csv_file', 'students_db.csv')
+    db_dir = os.path.dirname(os.path.abspath(db_path))
+    started = time.perf_counter()
+
+    if not os.path.exists(args.roster):
+        print(f"[FAIL] Roster '{args.roster}' not found.")
+        return 1
+    try:
+        roster = read_roster(args.roster)
+    except (ValueError, pd.errors.ParserError) as e:
+        print(f"[FAIL] {e}")
+        return 1
+    total_rows = len(roster)
+
+    # Blank IDs are reported by validation; among the rest the last row of each ID wins
+    duplicates = roster["student_id"].ne("") & roster.duplicated("student_id", keep="last")
+    roster = roster[~duplicates]
+
+    valid, rejected = validate_roster(roster, os.path.dirname(os.path.abspath(args.roster)), args.workers)
+    valid = valid.assign(image_path=[stored_image_path(p, db_dir) for p in valid["abs_image_path"]])
+    valid = valid.drop(columns=["abs_image_path"])
+    probed_at = time.perf_counter()
+
+    if len(rejected):
+        for _, row in rejected.head(20).iterrows():
+            print(f"  [Skip] {row['student_id'] or '(no id)'} {row['name']}: {row['reason']} ({row['abs_image_path']})")
+        if len(rejected) > 20:
+            print(f"  ... and {len(rejected) - 20} more.")
+        if not args.dry_run:
+            rejects_path = os.path.splitext(args.roster)[0] + '.rejected.csv'
+            rejected.drop(columns=["abs_image_path"]).to_csv(rejects_path, index=False)
+            print(f"[WARN] {len(rejected)} row(s) rejected; details in '{rejects_path}'.")
+
+    # Re-read and write under the server's lock, so fines applied meanwhile are kept
+    with InterProcessLock(db_path + '.lock'):
+        db = read_database(db_path)
+        merged, new_rows, changed_photo_ids = merge_roster(db, valid, args.update_existing)
+        if not args.dry_run:
+            write_atomically(merged, db_path)
+    finished = time.perf_counter()
+
+    skipped_existing = len(valid) - len(new_rows)
+    print(f"\n--- Import Summary ({'dry run, nothing written' if args.dry_run else db_path}) ---")
+    print(f"Roster rows:        {total_rows} ({int(duplicates.sum())} duplicate ID(s) collapsed)")
+    print(f"Rejected:           {len(rejected)}")
+    print(f"New students:       {len(new_rows)}")
+    print(f"Already registered: {skipped_existing}" + (" (updated)" if args.update_existing else " (unchanged)"))
+    print(f"Database size:      {len(merged)} student(s)")
+    print(f"Time:               {finished - started:.2f}s (image checks {probed_at - started:.2f}s, {args.workers} threads)")
+    if not args.dry_run and not config.get('shared_fine_state', False):
+        print("[Info] Restart the server to pick up the new students (it re-reads the DB live only with shared_fine_state).")
+
+    if args.embeddings and not args.dry_run:
+        embed_ids = new_rows["student_id"].tolist() + changed_photo_ids
+        if embed_ids and not update_embeddings(config, merged, embed_ids, db_dir):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk-import a student roster into the student database.")
+    parser.add_argument('--roster', default='s_details.csv', help="Roster CSV to import")
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--workers', type=int, default=min(32, (os.cpu_count() or 1) * 4),
+                        help="Threads for the image header checks")
+    parser.add_argument('--update-existing', action='store_true',
+                        help="Update name/photo/email of students already registered (fines are kept)")
+    parser.add_argument('--embeddings', action='store_true',
+                        help="Generate embeddings for the imported students only and merge them into embeddings_file")
+    parser.add_argument('--dry-run', action='store_true', help="Validate and report without writing anything")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,129 @@
+# stub_models.py
+"""
+Weight-free stand-ins for the YOLO models and the InsightFace app, enabled
+with [MODELS] stub_models = true. They expose the small part of the
+ultralytics/InsightFace interfaces that image_processor uses and return
+deterministic detections derived from the frame content, so benchmarks and
+load tests exercise the whole pipeline (ID association, face matching,
+fining, drawing) without model files or a GPU.
+Optionally each call sleeps [MODELS] stub_latency_ms to mimic inference time.
+"""
+import functools
+import time
+
+import numpy as np
+
+EMBEDDING_SIZE = 512
+
+
+@functools.lru_cache(maxsize=4096)
+def stub_embedding(index):
+    """L2-normalized embedding of synthetic identity 'index' (see stub_student_id)."""
+    vector = np.random.default_rng(index).standard_normal(EMBEDDING_SIZE).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    vector.setflags(write=False)
+    return vector
+
+
+def stub_student_id(index):
+    return f"S{index:06d}"
+
+
+def _checksum(image):
+    # Cheap content hash: a sparse grid of pixels, so identical frames give identical detections
+    return int(np.asarray(image[::32, ::32], dtype=np.uint32).sum())
+
+
+class _StubBox:
+    __slots__ = ('xyxy',)
+
+    def __init__(self, xyxy):
+        self.xyxy = [np.asarray(xyxy, dtype=np.float32)]
+
+
+class _StubResult:
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.keypoints = None # No pose output; the SCRFD path is used
+
+
+class _StubYolo:
+    def __init__(self, latency_ms=0.0):
+        self.latency = max(0.0, latency_ms) / 1000.0
+
+    def __call__(self, source, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        if self.latency:
+            # Batches are cheaper per frame than single calls, as on real hardware
+            time.sleep(self.latency * (1.0 + 0.25 * (len(images) - 1)))
+        return [_StubResult(self._boxes(image)) for image in images]
+
+
+class StubPersonModel(_StubYolo):
+    """0-3 standing persons spread across the frame."""
+
+    def _boxes(self, image):
+        h, w = image.shape[:2]
+        count = _checksum(image) % 4
+        boxes = []
+        for i in range(count):
+            left = (0.05 + i * 0.24) * w
+            boxes.append(_StubBox([left, 0.15 * h, left + 0.2 * w, 0.95 * h]))
+        return boxes
+
+
+class StubIdCardModel(_StubYolo):
+    """
+    A card on the chest of roughly half of the persons. Works on whole frames
+    (card boxes line up with StubPersonModel's persons) and on torso crops.
+    """
+
+    def _boxes(self, image):
+        h, w = image.shape[:2]
+        checksum = _checksum(image)
+        if h > w: # Torso crop of one person
+            return [_StubBox([0.35 * w, 0.2 * h, 0.65 * w, 0.4 * h])] if checksum % 2 else []
+        boxes = []
+        for i in range(checksum % 4):
+            if (checksum >> i) % 2:
+                center = (0.15 + i * 0.24) * w
+                boxes.append(_StubBox([center - 0.03 * w, 0.4 * h, center + 0.03 * w, 0.5 * h]))
+        return boxes
+
+
+class _StubFace:
+    def __init__(self, bbox, embedding):
+        self.bbox = np.asarray(bbox, dtype=np.float32)
+        self.normed_embedding = embedding
+
+
+class StubFaceApp:
+    """
+    One face per person crop. Its embedding is a noisy copy of
+    stub_embedding(i) for an identity chosen from the crop content, with i up
+    to 'identities'; a synthetic gallery smaller than that leaves some faces
+    unrecognized, as in real footage.
+    """
+
+    def __init__(self, latency_ms=0.0, identities=1000):
+        self.latency = max(0.0, latency_ms) / 1000.0
+        self.identities = max(1, identities)
+        self.models = {} # No 'recognition' model, so the pose keypoint fast path stays off
+
+    def get(self, image):
+        if self.latency:
+            time.sleep(self.latency)
+        h, w = image.shape[:2]
+        checksum = _checksum(image)
+        rng = np.random.default_rng(checksum)
+        embedding = stub_embedding(checksum % self.identities) + rng.standard_normal(EMBEDDING_SIZE).astype(np.float32) * 0.01
+        embedding /= np.linalg.norm(embedding)
+        return [_StubFace([0.3 * w, 0.05 * h, 0.7 * w, 0.3 * h], embedding)]
+
+
+def load_stub_models(config):
+    """Same return value as model_loader.load_models()."""
+    latency_ms = config.get('stub_latency_ms', 0.0)
+    print(f"[Info] Using stub models (no weights loaded, {latency_ms:g} ms simulated latency per call).")
+    return (StubPersonModel(latency_ms), StubIdCardModel(latency_ms),
+            StubFaceApp(latency_ms, identities=config.get('stub_identities', 1000)), True)
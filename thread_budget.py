@@ -0,0 +1,69 @@
+# thread_budget.py
+import os
+import cv2
+
+# OpenMP/BLAS environment variables; inherited by spawned inference workers,
+# which read them before torch/numpy create their pools
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+
+def apply_thread_budget(config):
+    """
+    Applies the [THREADS] budget to PyTorch (ultralytics) and OpenCV for this
+    process. A value of 0 leaves the library default (usually one thread per core).
+    ONNX Runtime is handled separately by apply_ort_thread_budget once the
+    InsightFace sessions exist.
+    """
+    torch_threads = config.get('torch_threads', 0)
+    torch_interop = config.get('torch_interop_threads', 0)
+    opencv_threads = config.get('opencv_threads', 0)
+
+    if torch_threads > 0:
+        for var in THREAD_ENV_VARS:
+            os.environ[var] = str(torch_threads)
+    try:
+        import torch
+        if torch_threads > 0:
+            torch.set_num_threads(torch_threads)
+        if torch_interop > 0:
+            try:
+                torch.set_num_interop_threads(torch_interop)
+            except RuntimeError:
+                # Only allowed before the first inter-op parallel work in the process
+                pass
+    except ImportError:
+        pass
+
+    if opencv_threads > 0:
+        cv2.setNumThreads(opencv_threads)
+
+    print(f"[Info] Thread budget: torch={torch_threads or 'default'}, torch_interop={torch_interop or 'default'}, "
+          f"opencv={opencv_threads or 'default'}, onnxruntime={config.get('ort_intra_op_threads', 0) or 'default'}, "
+          f"inference_slots={config.get('inference_slots', 0) or 'unlimited'}")
+
+
+def apply_ort_thread_budget(face_app, providers, config):
+    """
+    Recreates the ONNX Runtime sessions of an InsightFace FaceAnalysis app with
+    the configured intra/inter-op thread counts. FaceAnalysis does not forward
+    SessionOptions to its models, so the sessions are rebuilt from model_file.
+    """
+    intra = config.get('ort_intra_op_threads', 0)
+    inter = config.get('ort_inter_op_threads', 0)
+    if face_app is None or (intra <= 0 and inter <= 0):
+        return
+
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    if intra > 0:
+        options.intra_op_num_threads = intra
+    if inter > 0:
+        options.inter_op_num_threads = inter
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+
+    for taskname, model in face_app.models.items():
+        model_file = getattr(model, 'model_file', None)
+        if model_file is None or getattr(model, 'session', None) is None:
+            continue
+        model.session = onnxruntime.InferenceSession(model_file, sess_options=options, providers=providers)
+        print(f"[Info] ONNX Runtime session for '{taskname}' limited to intra={intra or 'default'}, inter={inter or 'default'} threads.")
@@ -1,61 +1,139 @@
 # utils.py
 import base64
 import io
+import logging
+from collections import namedtuple
+from functools import lru_cache
 import cv2
 import numpy as np
 from PIL import Image
+from frame_pool import acquire_frame
+from log_setup import log_sampled
+
+logger = logging.getLogger(__name__)
 
 # --- Bounding Box Colors ---
 COLOR_PERSON_WITH_ID = (0, 200, 0)
 COLOR_RECOGNIZED_NO_ID = (255, 140, 0)
 COLOR_UNKNOWN_NO_ID = (255, 215, 0)
 COLOR_ID_CARD = (30, 144, 255)
+COLOR_ROI_ZONE = (200, 200, 200)
 COLOR_TEXT = (255, 255, 255)
 TEXT_BG_COLOR = (0, 0, 0) # Default background for text
 
-def decode_image(base64_string):
-    """Decodes a base64 string (potentially with data URI prefix) to an OpenCV image."""
+# cv2.imdecode flags that decode JPEGs directly at 1/2, 1/4 or 1/8 scale
+REDUCED_DECODE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def decode_image(base64_string, reduce_factor=1):
+    """
+    Decodes a base64 string (potentially with data URI prefix) to an OpenCV image.
+    With reduce_factor 2, 4 or 8 the JPEG is decoded directly at that reduced scale,
+    which is much cheaper than decoding at full size and resizing afterwards.
+    The returned frame is a fresh array owned by the caller (safe to draw on in place).
+    """
     try:
         # Remove data URI prefix if present (e.g., "data:image/jpeg;base64,")
         if "," in base64_string:
             base64_string = base64_string.split(',')[1]
         img_bytes = base64.b64decode(base64_string)
+        if reduce_factor in REDUCED_DECODE_FLAGS:
+            img_cv2 = cv2.imdecode(np.frombuffer(img_bytes, dtype=np.uint8), REDUCED_DECODE_FLAGS[reduce_factor])
+            if img_cv2 is None:
+                raise ValueError("cv2.imdecode failed")
+            return img_cv2
+        # Straight to BGR in one allocation (grayscale/alpha handled by IMREAD_COLOR);
+        # orientation is ignored to match the PIL path below
+        img_cv2 = cv2.imdecode(np.frombuffer(img_bytes, dtype=np.uint8),
+                               cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if img_cv2 is not None:
+            return img_cv2
+        # Fallback for formats OpenCV cannot read
         img_pil = Image.open(io.BytesIO(img_bytes))
         # Convert to BGR for OpenCV, handling grayscale images
         if img_pil.mode == 'RGB':
             img_cv2 = cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
         elif img_pil.mode == 'RGBA': # Handle transparency if needed
-             img_cv2_rgba = cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGBA2BGRA)
-             img_cv2 = cv2.cvtColor(img_cv2_rgba, cv2.COLOR_BGRA2BGR) # Convert to BGR
+             img_cv2 = cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGBA2BGR)
         elif img_pil.mode == 'L': # Grayscale
             img_cv2 = cv2.cvtColor(np.array(img_pil), cv2.COLOR_GRAY2BGR)
         else: # Fallback for other modes
             img_cv2 = cv2.cvtColor(np.array(img_pil.convert('RGB')), cv2.COLOR_RGB2BGR)
         return img_cv2
     except Exception as e:
-        print(f"Error decoding base64 image: {e}")
+        log_sampled(logger, logging.WARNING, 'decode_image', "Error decoding base64 image: %s", e)
         return None
 
-def encode_image(frame, quality=85):
-    """Encodes an OpenCV frame (numpy array) to a base64 string (JPEG format)."""
+def encode_image(frame, quality=85, max_width=0):
+    """
+    Encodes an OpenCV frame (numpy array) to a base64 string (JPEG format).
+    If max_width is set, wider frames are downscaled before encoding.
+    """
     if frame is None:
         return None
     try:
+        frame, _ = resize_to_max_width(frame, max_width)
         success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
         if not success:
             raise ValueError("cv2.imencode failed")
         # Return only the base64 part, without the data URI prefix
         return base64.b64encode(buffer).decode('utf-8')
     except Exception as e:
-        print(f"Error encoding image to base64: {e}")
+        log_sampled(logger, logging.WARNING, 'encode_image', "Error encoding image to base64: %s", e)
         return None
 
 
+def resize_to_max_width(frame, max_width):
+    """
+    Downscales a frame (keeping aspect ratio) so it is at most max_width wide.
+    Returns (frame, scale); the input frame itself is returned with scale 1.0
+    if max_width is 0 or the frame is already narrow enough.
+    """
+    h, w = frame.shape[:2]
+    if not max_width or w <= max_width:
+        return frame, 1.0
+    scale = max_width / float(w)
+    new_h = max(1, int(round(h * scale)))
+    # Inside a frame_lease() the output buffer is reused across requests
+    resized = cv2.resize(frame, (max_width, new_h), dst=acquire_frame((new_h, max_width) + frame.shape[2:], frame.dtype),
+                         interpolation=cv2.INTER_AREA)
+    return resized, scale
+
+
+def scale_box(box, scale):
+    """Scales (x1, y1, x2, y2) integer box coordinates by a factor."""
+    if scale == 1.0:
+        return tuple(box)
+    return tuple(int(round(v * scale)) for v in box)
+
+
+@lru_cache(maxsize=4096)
+def text_size(text, fontFace, fontScale, thickness):
+    """cv2.getTextSize, cached: labels repeat from frame to frame."""
+    return cv2.getTextSize(text, fontFace, fontScale, thickness)
+
+
+@lru_cache(maxsize=512)
+def _background_sprite(height, width, channels, bg_color):
+    """Solid label background, built once per (size, color) and shared read-only."""
+    sprite = np.empty((height, width, channels), dtype=np.uint8)
+    sprite[:] = bg_color
+    sprite.flags.writeable = False
+    return sprite
+
+
 def draw_text_with_background(img, text, org, fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=0.5,
                               color=(255, 255, 255), thickness=1, bg_color=(0, 0, 0), alpha=0.6, padding=3):
-    """Draws text with a semi-transparent background rectangle."""
+    """
+    Draws text with a semi-transparent background rectangle.
+    Text sizes and background sprites are cached and the background is blended
+    in place, so a label costs one addWeighted and one putText.
+    """
     try:
-        (text_w, text_h), baseline = cv2.getTextSize(text, fontFace, fontScale, thickness)
+        (text_w, text_h), baseline = text_size(text, fontFace, fontScale, thickness)
         x, y = org
 
         # Calculate rectangle coordinates carefully, ensuring they are within image bounds
@@ -64,41 +142,40 @@ def draw_text_with_background(img, text, org, fontFace=cv2.FONT_HERSHEY_SIMPLEX,
         rect_x2 = min(img.shape[1], x + text_w + padding)
         rect_y2 = min(img.shape[0], y + baseline + padding)
 
-        # Check if the rectangle dimensions are valid
-        if rect_x1 >= rect_x2 or rect_y1 >= rect_y2:
-            # If rect is invalid, just draw text without background (or skip)
-            # cv2.putText(img, text, (x, y), fontFace, fontScale, color, thickness, lineType=cv2.LINE_AA)
-            # print(f"Warning: Invalid background rect for text '{text}'. Skipping background.")
-            pass # Skip drawing if rect is invalid
-
-        else:
+        # Skip the background if the rectangle is invalid or empty (label fully off-image)
+        if rect_x1 < rect_x2 and rect_y1 < rect_y2:
             sub_img = img[rect_y1:rect_y2, rect_x1:rect_x2]
-
-            # Ensure sub_img is not empty (can happen with edge cases)
-            if sub_img.size == 0:
-                 # cv2.putText(img, text, (x, y), fontFace, fontScale, color, thickness, lineType=cv2.LINE_AA)
-                 # print(f"Warning: Empty sub-image for text '{text}'. Skipping background.")
-                 pass # Skip drawing if sub-image is empty
-            else:
-                # Create background rectangle
-                bg_rect = np.full(sub_img.shape, bg_color, dtype=np.uint8)
-
-                # Blend background with original image area
-                res = cv2.addWeighted(sub_img, 1.0 - alpha, bg_rect, alpha, 1.0)
-
-                # Put the blended region back onto the main image
-                img[rect_y1:rect_y2, rect_x1:rect_x2] = res
+            # Sprite of the unclipped label size, so it is reused wherever the label sits
+            sprite = _background_sprite(text_h + baseline * 2 + padding * 2, text_w + padding * 2,
+                                        sub_img.shape[2] if sub_img.ndim == 3 else 1, tuple(bg_color))
+            # Blend background with original image area, writing straight into the view
+            cv2.addWeighted(sub_img, 1.0 - alpha, sprite[:sub_img.shape[0], :sub_img.shape[1]], alpha, 1.0,
+                            dst=sub_img)
 
         # Draw the text on top
-        # Adjust text position slightly if background was drawn to align with original 'org'
-        text_org_x = x
-        text_org_y = y
-        cv2.putText(img, text, (text_org_x, text_org_y), fontFace, fontScale, color, thickness, lineType=cv2.LINE_AA)
+        cv2.putText(img, text, (x, y), fontFace, fontScale, color, thickness, lineType=cv2.LINE_AA)
 
     except Exception as e:
-        print(f"Error drawing text '{text}': {e}")
+        log_sampled(logger, logging.WARNING, 'draw_text', "Error drawing text '%s': %s", text, e)
         # Fallback: Try drawing text without background if error occurs
         try:
             cv2.putText(img, text, org, fontFace, fontScale, color, thickness, lineType=cv2.LINE_AA)
         except Exception as fallback_e:
-            print(f"Error drawing text '{text}' (fallback failed): {fallback_e}")
\ No newline at end of file
+            log_sampled(logger, logging.WARNING, 'draw_text_fallback', "Error drawing text '%s' (fallback failed): %s",
+                        text, fallback_e)
+
+
+# One labelled box of a frame's overlay; see draw_overlays()
+BoxLabel = namedtuple('BoxLabel', ['box', 'color', 'text', 'org', 'font_scale', 'alpha'])
+
+
+def draw_overlays(img, overlays, box_thickness=2, text_color=COLOR_TEXT):
+    """
+    Draws a frame's labelled boxes in one pass, in list order (later labels
+    on top), each as a rectangle plus a draw_text_with_background label.
+    """
+    for box, color, text, org, font_scale, alpha in overlays:
+        x1, y1, x2, y2 = box
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, box_thickness)
+        draw_text_with_background(img, text, org, fontScale=font_scale, color=text_color, thickness=1,
+                                  bg_color=color[:3], alpha=alpha)
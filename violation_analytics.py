@@ -0,0 +1,248 @@
+# violation_analytics.py
+import csv
+import io
+import logging
+import os
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    student_id TEXT NOT NULL,
+    name TEXT,
+    ts TEXT NOT NULL,
+    day TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    image_filename TEXT
+);
+CREATE INDEX IF NOT EXISTS events_day ON events (day);
+CREATE INDEX IF NOT EXISTS events_student ON events (student_id, day, ts); -- Covers windowed offender counts
+CREATE TABLE IF NOT EXISTS daily (day TEXT PRIMARY KEY, fines INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS hourly (day TEXT, hour INTEGER, fines INTEGER NOT NULL, PRIMARY KEY (day, hour));
+CREATE TABLE IF NOT EXISTS students (
+    student_id TEXT PRIMARY KEY,
+    name TEXT,
+    fines INTEGER NOT NULL,
+    first_ts TEXT,
+    last_ts TEXT
+);
+CREATE TABLE IF NOT EXISTS ingest_state (
+    log_path TEXT PRIMARY KEY,
+    log_offset INTEGER NOT NULL,
+    header TEXT
+);
+"""
+
+
+class ViolationAnalytics:
+    """
+    Reports over the fined-event log (fined_log.csv) without re-reading it.
+
+    New rows of the append-only log are ingested incrementally into SQLite: the
+    byte offset already read is stored, so each refresh reads only what was
+    appended since (a rewritten or truncated log is ingested again from the
+    start). Ingest keeps daily, hourly and per-student rollups current, which
+    most reports read directly; per-student history and offender counts since
+    a date use an index on events.
+
+    Results are cached by query and arguments until the ingested part of the
+    log grows. refresh() is a stat() of the log when nothing changed, and is run
+    before every query, so new fines show up on the next request. Several
+    processes may share the database file: ingest runs in a write transaction
+    that re-reads the stored offset, so no row is counted twice.
+    """
+
+    def __init__(self, db_path, log_path, cache_entries=256):
+        self.db_path = db_path
+        self.log_path = log_path
+        self.cache_entries = cache_entries
+        self._lock = threading.Lock() # One connection, shared by the request threads
+        self._cache = OrderedDict() # (query, args) -> result
+        self._log_stat = None # (mtime_ns, size) of the log at the last refresh
+        self._offset = None # Ingested log bytes the cached results are based on
+        self.version = 0 # Bumped whenever the ingested part of the log changes (cache generation)
+        self.ingested = 0 # Rows ingested by this process
+        self.skipped = 0 # Malformed rows
+        self.cache_hits = 0
+        self.cache_misses = 0
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL") # Readers in other processes do not block ingest
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    # --- Ingest ---
+
+    @staticmethod
+    def _log_signature(path):
+        try:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def refresh(self):
+        """Ingests rows appended to the log since the last refresh; returns how many were added."""
+        with self._lock:
+            signature = self._log_signature(self.log_path)
+            if signature is None or signature == self._log_stat:
+                return 0
+            added, offset = self._ingest()
+            self._log_stat = signature
+            if offset != self._offset: # Also when another process did the ingest
+                self._offset = offset
+                self.version += 1
+                self._cache.clear()
+            return added
+
+    def _ingest(self):
+        """Reads the log from the stored offset in one write transaction; returns (rows added, new offset). Caller holds _lock."""
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE") # Serializes ingest across processes sharing the database
+        try:
+            state = conn.execute("SELECT log_offset, header FROM ingest_state WHERE log_path = ?",
+                                 (self.log_path,)).fetchone()
+            offset, header = (state['log_offset'], state['header']) if state else (0, None)
+            with open(self.log_path, 'rb') as f:
+                first_line = f.readline()
+                size = f.seek(0, os.SEEK_END)
+                if offset > size or (header is not None and first_line.decode('utf-8', 'replace') != header):
+                    # Log truncated or replaced: start over
+                    logger.info("Fined log '%s' was rewritten; rebuilding violation analytics.", self.log_path)
+                    for table in ('events', 'daily', 'hourly', 'students'):
+                        conn.execute(f"DELETE FROM {table}") # (executescript would commit the transaction)
+                    offset = 0
+                start = offset or len(first_line) # Skip the header row
+                f.seek(start)
+                data = f.read(size - start)
+            end = data.rfind(b'\n') + 1 # Only complete rows; a row still being written waits for the next refresh
+            rows = self._parse(data[:end])
+            if rows:
+                self._insert(rows)
+            conn.execute("INSERT OR REPLACE INTO ingest_state (log_path, log_offset, header) VALUES (?, ?, ?)",
+                         (self.log_path, start + end, first_line.decode('utf-8', 'replace')))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.ingested += len(rows)
+        return len(rows), start + end
+
+    def _parse(self, data):
+        """(student_id, name, ts, day, hour, image_filename) per valid row of the log's CSV bytes."""
+        rows = []
+        for record in csv.reader(io.StringIO(data.decode('utf-8', 'replace'))):
+            if len(record) < 4:
+                self.skipped += bool(record)
+                continue
+            student_id, name, ts, image_filename = (value.strip() for value in record[:4])
+            # FinedLogManager writes 'YYYY-MM-DD HH:MM:SS'
+            if len(ts) < 13 or ts[4] != '-' or not ts[11:13].isdigit():
+                self.skipped += 1
+                continue
+            rows.append((student_id, name, ts, ts[:10], int(ts[11:13]), image_filename))
+        return rows
+
+    def _insert(self, rows):
+        conn = self._conn
+        conn.executemany("INSERT INTO events (student_id, name, ts, day, hour, image_filename) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        # Rollups: one upsert per day / hour / student of the batch
+        conn.executemany("INSERT INTO daily (day, fines) VALUES (?, ?) "
+                         "ON CONFLICT (day) DO UPDATE SET fines = fines + excluded.fines",
+                         Counter(row[3] for row in rows).items())
+        conn.executemany("INSERT INTO hourly (day, hour, fines) VALUES (?, ?, ?) "
+                         "ON CONFLICT (day, hour) DO UPDATE SET fines = fines + excluded.fines",
+                         [(day, hour, fines) for (day, hour), fines in Counter((row[3], row[4]) for row in rows).items()])
+        students = {}
+        for student_id, name, ts, _, _, _ in rows:
+            fines, first_ts, last_ts, _ = students.get(student_id, (0, ts, ts, name))
+            students[student_id] = (fines + 1, min(first_ts, ts), max(last_ts, ts), name)
+        conn.executemany("INSERT INTO students (student_id, fines, first_ts, last_ts, name) VALUES (?, ?, ?, ?, ?) "
+                         "ON CONFLICT (student_id) DO UPDATE SET fines = fines + excluded.fines, name = excluded.name, "
+                         "first_ts = MIN(first_ts, excluded.first_ts), last_ts = MAX(last_ts, excluded.last_ts)",
+                         [(student_id,) + values for student_id, values in students.items()])
+
+    # --- Queries ---
+
+    def _query(self, key, sql, params=()):
+        """Rows of 'sql' as dicts, cached under 'key' until new log rows are ingested."""
+        self.refresh()
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return result
+            self.cache_misses += 1
+            result = [dict(row) for row in self._conn.execute(sql, params)]
+            self._cache[key] = result
+            if len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+            return result
+
+    def fines_per_day(self, start=None, end=None):
+        """[{'day', 'fines'}] for days in [start, end] (ISO dates, inclusive)."""
+        return self._query(('daily', start, end),
+                           "SELECT day, fines FROM daily WHERE day >= ? AND day <= ? ORDER BY day",
+                           (start or '', end or '9999'))
+
+    def busiest_hours(self, start=None, end=None):
+        """[{'hour', 'fines'}] summed over days in [start, end], busiest first."""
+        return self._query(('hours', start, end),
+                           "SELECT hour, SUM(fines) AS fines FROM hourly WHERE day >= ? AND day <= ? "
+                           "GROUP BY hour ORDER BY fines DESC, hour",
+                           (start or '', end or '9999'))
+
+    def repeat_offenders(self, min_fines=2, since=None, limit=50):
+        """Students fined at least min_fines times (since an ISO date, else ever), most fines first."""
+        if since is None:
+            # Straight from the per-student rollup
+            return self._query(('offenders', min_fines, None, limit),
+                               "SELECT student_id, name, fines, first_ts, last_ts FROM students "
+                               "WHERE fines >= ? ORDER BY fines DESC, last_ts DESC LIMIT ?",
+                               (min_fines, limit))
+        # Counted on the covering index alone; names are looked up for the returned rows only
+        return self._query(('offenders', min_fines, since, limit),
+                           "SELECT g.student_id, s.name, g.fines, g.first_ts, g.last_ts FROM ("
+                           "SELECT student_id, COUNT(*) AS fines, MIN(ts) AS first_ts, MAX(ts) AS last_ts "
+                           "FROM events WHERE day >= ? GROUP BY student_id HAVING COUNT(*) >= ? "
+                           "ORDER BY fines DESC, last_ts DESC LIMIT ?) AS g "
+                           "LEFT JOIN students s ON s.student_id = g.student_id ORDER BY g.fines DESC, g.last_ts DESC",
+                           (since, min_fines, limit))
+
+    def student_history(self, student_id, limit=100):
+        """A student's fines, newest first, with the evidence image filenames."""
+        return self._query(('history', student_id, limit),
+                           "SELECT ts AS timestamp, name, image_filename FROM events WHERE student_id = ? "
+                           "ORDER BY ts DESC LIMIT ?",
+                           (student_id, limit))
+
+    def summary(self):
+        """Total fines, fined students and the covered date range."""
+        rows = self._query(('summary',),
+                           "SELECT (SELECT COALESCE(SUM(fines), 0) FROM daily) AS fines, "
+                           "(SELECT COUNT(*) FROM students) AS students, "
+                           "(SELECT MIN(day) FROM daily) AS first_day, (SELECT MAX(day) FROM daily) AS last_day")
+        return rows[0]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "ingested": self.ingested,
+                "skipped": self.skipped,
+                "cached_queries": len(self._cache),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
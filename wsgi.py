@@ -0,0 +1,8 @@
+# wsgi.py
+# WSGI entry point for production servers, e.g.:
+#   gunicorn -c gunicorn.conf.py wsgi:application      (Linux, multi-process)
+#   waitress-serve --threads=8 wsgi:application        (Windows, single process)
+import os
+from app import create_app
+
+application = create_app(os.environ.get('SMART_ID_CONFIG', 'config.ini'))